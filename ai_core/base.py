@@ -1,6 +1,33 @@
 # ai_core/base.py
+import json
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+
+
+def default_temperature(type_: Optional[str]) -> float:
+    """Sampling temperature used for an artifact type."""
+    return 0.2 if type_ == "test_cases" else 0.1
+
+
+def wrap_result(type_: Optional[str], raw: str) -> Dict[str, Any]:
+    """Wrap raw model output in a consistent dict keyed by artifact type."""
+    if type_ == "test_cases":
+        return {"test_cases": raw}
+    elif type_ == "test_plan":
+        return {"test_plan": raw}
+    else:
+        return {"raw": raw}
+
+
+def result_text(result: Dict[str, Any], type_: Optional[str]) -> str:
+    """Inverse of wrap_result: the model text behind a generate() result."""
+    if type_ in result:
+        value = result[type_]
+        return value if isinstance(value, str) else json.dumps({type_: value})
+    return str(result.get("raw", ""))
+
 
 class BaseLLMProvider(ABC):
     """
@@ -21,3 +48,52 @@ class BaseLLMProvider(ABC):
         }
         """
         pass
+
+    def chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                        meta: Dict[str, Any] = None) -> str:
+        """Answer a question under a system prompt and return plain text."""
+        raise NotImplementedError
+
+    def target_model(self, meta: Dict[str, Any] = None, prompt_tokens: int = 0) -> Optional[str]:
+        """
+        Model a call with this meta and (untrimmed) prompt size would be sent
+        to, so prompts can be sized for its context window.
+        None means settings.OPENAI_MODEL.
+        """
+        return getattr(self, "model", None)
+
+    async def agenerate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Async twin of generate() for ASGI views.
+        The default runs generate() in a worker thread; providers with a
+        native async client should override it.
+        """
+        return await sync_to_async(self.generate, thread_sensitive=False)(prompt, meta=meta)
+
+    async def achat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> str:
+        """Async twin of chat_completion(); same thread fallback as agenerate()."""
+        return await sync_to_async(self.chat_completion, thread_sensitive=False)(
+            system_prompt, question, temperature=temperature, meta=meta
+        )
+
+    def stream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> Iterator[str]:
+        """
+        Yield the model output of generate() as text deltas.
+        The default yields the whole completion at once.
+        """
+        meta = meta or {}
+        yield result_text(self.generate(prompt, meta=meta), meta.get("type"))
+
+    def stream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> Iterator[str]:
+        """Yield the chat_completion() answer as text deltas."""
+        yield self.chat_completion(system_prompt, question, temperature=temperature, meta=meta)
+
+    async def astream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        meta = meta or {}
+        yield result_text(await self.agenerate(prompt, meta=meta), meta.get("type"))
+
+    async def astream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                                      meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        yield await self.achat_completion(system_prompt, question, temperature=temperature, meta=meta)
@@ -0,0 +1,92 @@
+# ai_core/budget.py
+from typing import Any, Dict, List
+
+from django.conf import settings
+from .tokens import context_tokens, count_tokens, truncate_to_tokens
+
+# Headings and separators build_requirement_text adds around each section.
+SECTION_OVERHEAD_TOKENS = 8
+
+
+class PromptBudget:
+    """
+    Splits a model's prompt token budget across named prompt sections.
+
+    Fixed sections (instructions, schema) are always kept whole. The rest are
+    served in priority order (1 first); sections sharing a priority split what
+    is left evenly, and whatever does not fit is trimmed from the end.
+    """
+
+    def __init__(self, model: str = None, max_prompt_tokens: int = None):
+        self.model = model or getattr(settings, "OPENAI_MODEL", "gpt-4o-mini")
+        reserve = getattr(settings, "LLM_OUTPUT_RESERVE_TOKENS", 4096)
+        limits = [context_tokens(self.model) - reserve, getattr(settings, "LLM_MAX_PROMPT_TOKENS", 30000)]
+        if max_prompt_tokens:
+            limits.append(max_prompt_tokens)
+        self.total = max(0, min(limits))
+        self.sections: List[Dict[str, Any]] = []
+
+    def add(self, name: str, text: str, priority: int = 1, fixed: bool = False) -> "PromptBudget":
+        text = text or ""
+        tokens = count_tokens(text)
+        self.sections.append({
+            "name": name,
+            "text": text,
+            "priority": 0 if fixed else priority,
+            "fixed": fixed,
+            "tokens": tokens + (SECTION_OVERHEAD_TOKENS if text and not fixed else 0),
+            "kept_tokens": 0,
+        })
+        return self
+
+    def allocate(self) -> Dict[str, str]:
+        """Return {name: kept text} and record per-section allocations for report()."""
+        remaining = self.total
+        for section in self.sections:
+            if section["fixed"]:
+                section["kept_tokens"] = section["tokens"]
+                remaining -= section["tokens"]
+
+        for priority in sorted({s["priority"] for s in self.sections if not s["fixed"]}):
+            group = sorted(
+                (s for s in self.sections if not s["fixed"] and s["priority"] == priority),
+                key=lambda s: s["tokens"],
+            )
+            # Water-fill: small sections keep everything, large ones share the rest.
+            for position, section in enumerate(group):
+                share = max(0, remaining) // (len(group) - position)
+                section["kept_tokens"] = min(section["tokens"], share)
+                remaining -= section["kept_tokens"]
+
+        kept = {}
+        for section in self.sections:
+            if section["kept_tokens"] >= section["tokens"]:
+                kept[section["name"]] = section["text"]
+            else:
+                limit = section["kept_tokens"] - (0 if section["fixed"] else SECTION_OVERHEAD_TOKENS)
+                kept[section["name"]] = truncate_to_tokens(section["text"], limit)
+        return kept
+
+    def trimmed(self, name: str) -> bool:
+        return any(s["name"] == name and s["kept_tokens"] < s["tokens"] for s in self.sections)
+
+    def available(self) -> int:
+        """Tokens left for non-fixed sections."""
+        return max(0, self.total - sum(s["tokens"] for s in self.sections if s["fixed"]))
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "budget_tokens": self.total,
+            "used_tokens": sum(s["kept_tokens"] for s in self.sections),
+            "sections": [
+                {
+                    "name": s["name"],
+                    "priority": s["priority"],
+                    "tokens": s["tokens"],
+                    "kept_tokens": s["kept_tokens"],
+                    "trimmed": s["kept_tokens"] < s["tokens"],
+                }
+                for s in self.sections
+            ],
+        }
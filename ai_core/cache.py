@@ -0,0 +1,362 @@
+# ai_core/cache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .base import BaseLLMProvider, default_temperature, result_text, wrap_result
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so cosmetic prompt differences share a key."""
+    return _WHITESPACE.sub(" ", prompt or "").strip()
+
+
+def request_key(model: str, prompt: str, temperature: float, type_: Optional[str]) -> str:
+    """Content address of an LLM request: sha256 of model, prompt, temperature and type."""
+    payload = json.dumps(
+        [model, normalize_prompt(prompt), round(float(temperature), 4), type_ or ""],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def chat_prompt(system_prompt: str, question: str) -> str:
+    """Single prompt string used to key chat completions."""
+    return f"{system_prompt}\x00{question}"
+
+
+class MemoryTier:
+    """In-process LRU with a size bound and a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.evictions += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteTier:
+    """
+    Persistent tier in a standalone SQLite file, shared by every worker process
+    on the host. Connections are per thread and re-opened after a fork.
+    """
+
+    def __init__(self, path: str, ttl: float = 86400, max_rows: int = 20000):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (created_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str):
+        row = self._conn().execute(
+            "SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now + self.ttl),
+        )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % 100 == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """Drop expired rows, then the oldest rows beyond max_rows."""
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        removed += conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        ).rowcount
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+
+class CachedProvider(BaseLLMProvider):
+    """
+    Content-addressed cache in front of any provider.
+    Lookups go memory -> SQLite -> upstream; pass meta["nocache"] to bypass.
+    """
+
+    def __init__(self, inner, memory: MemoryTier = None, persistent: SQLiteTier = None):
+        self.inner = inner
+        self.memory = memory
+        self.persistent = persistent
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "memory_hits": 0, "persistent_hits": 0, "misses": 0, "bypassed": 0}
+
+    @property
+    def model(self) -> str:
+        return getattr(self.inner, "model", type(self.inner).__name__)
+
+    def target_model(self, meta: Dict[str, Any] = None, prompt_tokens: int = 0) -> Optional[str]:
+        return self.inner.target_model(meta, prompt_tokens)
+
+    def _bump(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _lookup(self, key: str):
+        if self.memory is not None:
+            value = self.memory.get(key)
+            if value is not None:
+                self._bump("hits")
+                self._bump("memory_hits")
+                return value
+        if self.persistent is not None:
+            try:
+                value = self.persistent.get(key)
+            except sqlite3.Error:
+                value = None
+            if value is not None:
+                self._bump("hits")
+                self._bump("persistent_hits")
+                if self.memory is not None:
+                    self.memory.set(key, value)
+                return value
+        self._bump("misses")
+        return None
+
+    def _store(self, key: str, value: Any) -> None:
+        if self.memory is not None:
+            self.memory.set(key, value)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, value)
+            except sqlite3.Error:
+                pass
+
+    async def _alookup(self, key: str):
+        # The SQLite tier does blocking file I/O, so keep it off the event loop.
+        return await sync_to_async(self._lookup, thread_sensitive=False)(key)
+
+    async def _astore(self, key: str, value: Any) -> None:
+        await sync_to_async(self._store, thread_sensitive=False)(key, value)
+
+    def _generate_key(self, prompt: str, meta: Dict[str, Any]) -> str:
+        type_ = meta.get("type")
+        return request_key(self.model, prompt, default_temperature(type_), type_)
+
+    def _chat_key(self, system_prompt: str, question: str, temperature: float, meta: Dict[str, Any]) -> str:
+        return request_key(self.model, chat_prompt(system_prompt, question), temperature, meta.get("type", "chat"))
+
+    def generate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        meta = meta or {}
+        if meta.get("nocache"):
+            self._bump("bypassed")
+            return self.inner.generate(prompt, meta=meta)
+
+        key = self._generate_key(prompt, meta)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        result = self.inner.generate(prompt, meta=meta)
+        self._store(key, result)
+        return result
+
+    def chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                        meta: Dict[str, Any] = None) -> str:
+        meta = meta or {}
+        if meta.get("nocache"):
+            self._bump("bypassed")
+            return self.inner.chat_completion(system_prompt, question, temperature=temperature, meta=meta)
+
+        key = self._chat_key(system_prompt, question, temperature, meta)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        result = self.inner.chat_completion(system_prompt, question, temperature=temperature, meta=meta)
+        self._store(key, result)
+        return result
+
+    async def agenerate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        meta = meta or {}
+        if meta.get("nocache"):
+            self._bump("bypassed")
+            return await self.inner.agenerate(prompt, meta=meta)
+
+        key = self._generate_key(prompt, meta)
+        cached = await self._alookup(key)
+        if cached is not None:
+            return cached
+        result = await self.inner.agenerate(prompt, meta=meta)
+        await self._astore(key, result)
+        return result
+
+    async def achat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> str:
+        meta = meta or {}
+        if meta.get("nocache"):
+            self._bump("bypassed")
+            return await self.inner.achat_completion(system_prompt, question, temperature=temperature, meta=meta)
+
+        key = self._chat_key(system_prompt, question, temperature, meta)
+        cached = await self._alookup(key)
+        if cached is not None:
+            return cached
+        result = await self.inner.achat_completion(system_prompt, question, temperature=temperature, meta=meta)
+        await self._astore(key, result)
+        return result
+
+    # Streams replay a hit as a single delta; a miss is teed into the cache
+    # once the upstream stream has completed.
+
+    def stream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> Iterator[str]:
+        meta = meta or {}
+        type_ = meta.get("type")
+        key = None if meta.get("nocache") else self._generate_key(prompt, meta)
+        if key is None:
+            self._bump("bypassed")
+        else:
+            cached = self._lookup(key)
+            if cached is not None:
+                yield result_text(cached, type_)
+                return
+        parts = []
+        for delta in self.inner.stream_generate(prompt, meta=meta):
+            parts.append(delta)
+            yield delta
+        if key is not None:
+            self._store(key, wrap_result(type_, "".join(parts)))
+
+    def stream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> Iterator[str]:
+        meta = meta or {}
+        key = None if meta.get("nocache") else self._chat_key(system_prompt, question, temperature, meta)
+        if key is None:
+            self._bump("bypassed")
+        else:
+            cached = self._lookup(key)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
+        for delta in self.inner.stream_chat_completion(system_prompt, question, temperature=temperature, meta=meta):
+            parts.append(delta)
+            yield delta
+        if key is not None:
+            self._store(key, "".join(parts))
+
+    async def astream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        meta = meta or {}
+        type_ = meta.get("type")
+        key = None if meta.get("nocache") else self._generate_key(prompt, meta)
+        if key is None:
+            self._bump("bypassed")
+        else:
+            cached = await self._alookup(key)
+            if cached is not None:
+                yield result_text(cached, type_)
+                return
+        parts = []
+        async for delta in self.inner.astream_generate(prompt, meta=meta):
+            parts.append(delta)
+            yield delta
+        if key is not None:
+            await self._astore(key, wrap_result(type_, "".join(parts)))
+
+    async def astream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                                      meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        meta = meta or {}
+        key = None if meta.get("nocache") else self._chat_key(system_prompt, question, temperature, meta)
+        if key is None:
+            self._bump("bypassed")
+        else:
+            cached = await self._alookup(key)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
+        async for delta in self.inner.astream_chat_completion(system_prompt, question, temperature=temperature, meta=meta):
+            parts.append(delta)
+            yield delta
+        if key is not None:
+            await self._astore(key, "".join(parts))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cache = dict(self.counters)
+        cache["evictions"] = {
+            "memory": self.memory.evictions if self.memory is not None else 0,
+            "persistent": self.persistent.evictions if self.persistent is not None else 0,
+        }
+        cache["memory_entries"] = len(self.memory) if self.memory is not None else 0
+        stats = {"cache": cache}
+        if hasattr(self.inner, "stats"):
+            stats.update(self.inner.stats())
+        return stats
+
+
+def build_cache(inner) -> CachedProvider:
+    """Wrap a provider with the tiers configured in settings."""
+    ttl = getattr(settings, "LLM_CACHE_TTL", 86400)
+    memory = MemoryTier(
+        max_entries=getattr(settings, "LLM_CACHE_MAX_ENTRIES", 512),
+        ttl=min(ttl, getattr(settings, "LLM_CACHE_MEMORY_TTL", 3600)),
+    )
+    persistent = None
+    db_path = getattr(settings, "LLM_CACHE_DB", None)
+    if db_path:
+        persistent = SQLiteTier(db_path, ttl=ttl, max_rows=getattr(settings, "LLM_CACHE_MAX_ROWS", 20000))
+    return CachedProvider(inner, memory=memory, persistent=persistent)
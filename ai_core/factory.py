@@ -3,22 +3,62 @@ from django.conf import settings
 
 _provider_instance = None
 
-def get_provider():
-    global _provider_instance
-    if _provider_instance is not None:
-        return _provider_instance
 
-    provider_name = getattr(settings, "AI_PROVIDER", "openai")
+def build_provider(provider_name, model=None, timeout=None):
+    """One concrete provider; model/timeout default to the OPENAI_* settings."""
     if provider_name == "openai":
         from .openapi_provider import OpenAIProvider
-        _provider_instance = OpenAIProvider()
+        # The limiter needs to see 429s, so the SDK's own retries are switched off under it.
+        max_retries = 0 if getattr(settings, "LLM_LIMITER_ENABLED", False) else None
+        return OpenAIProvider(model=model, timeout=timeout, max_retries=max_retries)
     elif provider_name == "mock":
         from .mock_provider import MockProvider
-        _provider_instance = MockProvider()
+        return MockProvider()
     # elif provider_name == "anthropic":
     #     from .anthropic_provider import AnthropicProvider
-    #     _provider_instance = AnthropicProvider()
+    #     return AnthropicProvider()
+    raise ValueError(f"Unsupported provider: {provider_name}")
+
+
+def _wrap_leaf(provider):
+    # Metering is innermost, so every attempt that reaches the provider is recorded;
+    # the limiter sits on top of it so each provider/model gets its own limit.
+    if getattr(settings, "LLM_USAGE_RECORDING", False):
+        from .usage import MeteredProvider
+        provider = MeteredProvider(provider)
+    if getattr(settings, "LLM_LIMITER_ENABLED", False):
+        from .limiter import build_limited
+        provider = build_limited(provider)
+    return provider
+
+
+def build_router():
+    """RouterProvider over settings.LLM_PROVIDERS, routed by settings.LLM_ROUTES."""
+    from .router import RouterProvider
+    providers = {
+        name: _wrap_leaf(build_provider(spec.get("provider", "openai"), spec.get("model"), spec.get("timeout")))
+        for name, spec in settings.LLM_PROVIDERS.items()
+    }
+    return RouterProvider(providers, getattr(settings, "LLM_ROUTES", []))
+
+
+def get_provider():
+    global _provider_instance
+    if _provider_instance is not None:
+        return _provider_instance
+
+    provider_name = getattr(settings, "AI_PROVIDER", "openai")
+    if provider_name == "router":
+        _provider_instance = build_router()
     else:
-        raise ValueError(f"Unsupported provider: {provider_name}")
-    
-    return _provider_instance
\ No newline at end of file
+        _provider_instance = _wrap_leaf(build_provider(provider_name))
+
+    if getattr(settings, "LLM_COALESCE_ENABLED", False):
+        from .singleflight import CoalescingProvider
+        _provider_instance = CoalescingProvider(_provider_instance)
+
+    if getattr(settings, "LLM_CACHE_ENABLED", False):
+        from .cache import build_cache
+        _provider_instance = build_cache(_provider_instance)
+
+    return _provider_instance
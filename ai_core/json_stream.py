@@ -0,0 +1,126 @@
+# ai_core/json_stream.py
+import json
+from typing import Any, Callable, Iterator, List, Tuple
+
+Path = Tuple[Any, ...]
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for a JSON object arriving in text chunks from an LLM.
+
+    feed() scans only the new text and yields (path, value) for every value
+    whose path satisfies `want` as soon as that value is complete, e.g.
+    ("test_cases", 0) for the first test case or ("scope",) for a plan section.
+    Anything before the first "{" (markdown fences, preamble) is skipped.
+    """
+
+    def __init__(self, want: Callable[[Path], bool]):
+        self.want = want
+        self.buffer = ""
+        self.pos = 0
+        self.stack: List[dict] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.done = False
+
+    def _frame(self, kind: str, path: Path) -> dict:
+        return {"kind": kind, "path": path, "key": None, "index": 0,
+                "expect": "key" if kind == "obj" else "value", "start": None}
+
+    def _child_path(self, frame: dict) -> Path:
+        return frame["path"] + ((frame["key"],) if frame["kind"] == "obj" else (frame["index"],))
+
+    def _complete(self, frame: dict, end: int) -> Iterator[Tuple[Path, Any]]:
+        """Close the pending value of `frame`, which spans buffer[start:end]."""
+        start = frame["start"]
+        frame["start"] = None
+        if start is None:
+            return
+        path = self._child_path(frame)
+        if self.want(path):
+            try:
+                yield path, json.loads(self.buffer[start:end])
+            except ValueError:
+                pass
+
+    def feed(self, chunk: str) -> Iterator[Tuple[Path, Any]]:
+        self.buffer += chunk
+        buf = self.buffer
+        while self.pos < len(buf) and not self.done:
+            ch = buf[self.pos]
+            i = self.pos
+            self.pos += 1
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    frame = self.stack[-1]
+                    if frame["kind"] == "obj" and frame["expect"] == "key":
+                        frame["key"] = json.loads(buf[self.string_start:i + 1])
+                        frame["expect"] = "colon"
+                continue
+
+            if not self.stack:
+                if ch == "{":
+                    self.stack.append(self._frame("obj", ()))
+                continue
+
+            frame = self.stack[-1]
+            if ch in _WHITESPACE:
+                continue
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+                if frame["expect"] == "value" and frame["start"] is None:
+                    frame["start"] = i
+            elif ch == ":" and frame["kind"] == "obj":
+                frame["expect"] = "value"
+            elif ch == ",":
+                yield from self._complete(frame, i)
+                if frame["kind"] == "obj":
+                    frame["expect"] = "key"
+                else:
+                    frame["index"] += 1
+            elif ch in "{[":
+                if frame["start"] is None:
+                    frame["start"] = i
+                self.stack.append(self._frame("obj" if ch == "{" else "arr", self._child_path(frame)))
+            elif ch in "}]":
+                yield from self._complete(frame, i)
+                self.stack.pop()
+                if not self.stack:
+                    self.done = True
+                else:
+                    yield from self._complete(self.stack[-1], i + 1)
+            elif frame["expect"] == "value" and frame["start"] is None:
+                # number, true, false or null
+                frame["start"] = i
+
+
+def array_items(key: str) -> Callable[[Path], bool]:
+    """Match each element of the top-level array `key`."""
+    return lambda path: len(path) == 2 and path[0] == key and isinstance(path[1], int)
+
+
+def top_level_keys(path: Path) -> bool:
+    """Match each top-level member of the root object."""
+    return len(path) == 1
+
+
+def loads_output(text: str) -> Any:
+    """
+    Parse the JSON object in a complete model output, tolerating markdown
+    fences and surrounding prose. Raises ValueError if there is none.
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("No JSON object in model output")
+    return json.loads(text[start:end + 1])
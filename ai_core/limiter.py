@@ -0,0 +1,435 @@
+# ai_core/limiter.py
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from django.conf import settings
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+from .base import BaseLLMProvider
+
+# Absolute time.monotonic() by which the current request must be answered.
+_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+SUCCESS, OVERLOAD, ERROR, CANCELLED = "success", "overload", "error", "cancelled"
+
+
+class LLMOverloaded(Exception):
+    """The LLM backend is saturated; the caller should retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """Bound every LLM call made inside the block to `seconds` from now."""
+    with deadline_at(time.monotonic() + seconds):
+        yield
+
+
+@contextmanager
+def deadline_at(deadline: float):
+    """deadline_scope() with an absolute time.monotonic() deadline, e.g. one taken from current_deadline()."""
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    """Absolute deadline of the current request, or None if it has none."""
+    return _deadline.get()
+
+
+def time_remaining() -> Optional[float]:
+    """Seconds until the current request's deadline, or None if it has none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def classify(error: Exception) -> str:
+    """OVERLOAD for rate limits, timeouts and 503s (shrink the limit), else ERROR."""
+    if isinstance(error, (RateLimitError, APITimeoutError, TimeoutError, LLMOverloaded)):
+        return OVERLOAD
+    if isinstance(error, APIStatusError) and error.status_code in (429, 503, 504):
+        return OVERLOAD
+    return ERROR
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms / retry-after), if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_wake, self.future)
+
+
+def _wake(future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit shared by threads and event loops in one process.
+
+    Each success raises the limit by 1/limit (about +1 per limit's worth of
+    calls); an overload signal multiplies it by `backoff`, at most once per
+    `decrease_interval` so one burst of 429s counts as one signal. Callers
+    beyond the limit queue FIFO; they are shed with LLMOverloaded when the
+    queue is full or their deadline (or max_wait) passes first.
+    """
+
+    def __init__(self, initial: int = 8, min_limit: int = 1, max_limit: int = 64, backoff: float = 0.5,
+                 max_queue: int = 200, max_wait: float = 30.0, decrease_interval: float = 1.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self.waiters = deque()
+        self._lock = threading.Lock()
+        self._last_decrease = 0.0
+        self.counters = {"acquired": 0, "queued": 0, "shed": 0, "throttled": 0, "retries": 0}
+
+    def _wait_budget(self) -> float:
+        remaining = time_remaining()
+        return self.max_wait if remaining is None else min(self.max_wait, remaining)
+
+    def _try_acquire_locked(self, wait: float) -> bool:
+        """Take a slot immediately if one is free; raise if the caller cannot queue."""
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            self.counters["acquired"] += 1
+            return True
+        if len(self.waiters) >= self.max_queue or wait <= 0:
+            self.counters["shed"] += 1
+            raise LLMOverloaded("LLM backend is at capacity, try again shortly.", retry_after=1.0)
+        self.counters["queued"] += 1
+        return False
+
+    def _shed_waiter_locked(self, waiter: _Waiter) -> bool:
+        """Drop a waiter that gave up; False if it was granted a slot in the meantime."""
+        if waiter.granted:
+            return False
+        self.waiters.remove(waiter)
+        self.counters["shed"] += 1
+        return True
+
+    def _grant_locked(self) -> None:
+        while self.waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self.counters["acquired"] += 1
+            self.waiters.popleft().grant()
+
+    def acquire(self) -> None:
+        wait = self._wait_budget()
+        with self._lock:
+            if self._try_acquire_locked(wait):
+                return
+            waiter = _Waiter(event=threading.Event())
+            self.waiters.append(waiter)
+        if waiter.event.wait(wait):
+            return
+        with self._lock:
+            if not self._shed_waiter_locked(waiter):
+                return
+        raise LLMOverloaded("Timed out waiting for LLM capacity.", retry_after=wait or 1.0)
+
+    async def aacquire(self) -> None:
+        wait = self._wait_budget()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire_locked(wait):
+                return
+            waiter = _Waiter(loop=loop, future=loop.create_future())
+            self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), wait)
+            return
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not self._shed_waiter_locked(waiter):
+                    return
+            raise LLMOverloaded("Timed out waiting for LLM capacity.", retry_after=wait or 1.0)
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self._release_locked(CANCELLED)
+                else:
+                    self.waiters.remove(waiter)
+            raise
+
+    def _release_locked(self, outcome: str) -> None:
+        self.in_flight -= 1
+        if outcome == SUCCESS:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        elif outcome == OVERLOAD:
+            self.counters["throttled"] += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.decrease_interval:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        self._grant_locked()
+
+    def release(self, outcome: str = SUCCESS) -> None:
+        with self._lock:
+            self._release_locked(outcome)
+
+    def count_retry(self) -> None:
+        with self._lock:
+            self.counters["retries"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.counters, limit=round(self.limit, 2), in_flight=self.in_flight,
+                        queue_depth=len(self.waiters))
+
+
+class RetryPolicy:
+    """Jittered exponential backoff that honors Retry-After and the request deadline."""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def retryable(self, error: Exception) -> bool:
+        if isinstance(error, LLMOverloaded):
+            return False
+        if classify(error) == OVERLOAD or isinstance(error, APIConnectionError):
+            return True
+        return isinstance(error, APIStatusError) and error.status_code >= 500
+
+    def delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to sleep before retry number `attempt` (1-based), or None to give up."""
+        if attempt >= self.max_attempts or not self.retryable(error):
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        server = retry_after(error)
+        if server is not None:
+            delay = server + random.uniform(0, self.base_delay)
+        remaining = time_remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+
+class LimitedProvider(BaseLLMProvider):
+    """
+    Runs every call to `inner` under an AdaptiveLimiter slot and retries
+    transient failures with RetryPolicy. Overload that outlasts the retries
+    is raised as LLMOverloaded so views can answer 503 with Retry-After.
+    """
+
+    def __init__(self, inner, limiter: AdaptiveLimiter, policy: RetryPolicy):
+        self.inner = inner
+        self.limiter = limiter
+        self.policy = policy
+
+    @property
+    def model(self) -> str:
+        return getattr(self.inner, "model", type(self.inner).__name__)
+
+    def target_model(self, meta: Dict[str, Any] = None, prompt_tokens: int = 0) -> Optional[str]:
+        return self.inner.target_model(meta, prompt_tokens)
+
+    def _give_up(self, error: Exception) -> Exception:
+        if classify(error) == OVERLOAD and not isinstance(error, LLMOverloaded):
+            wait = retry_after(error)
+            overloaded = LLMOverloaded(f"LLM backend is overloaded: {error}", retry_after=wait or 1.0)
+            overloaded.__cause__ = error
+            return overloaded
+        return error
+
+    def _call(self, fn: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            attempt += 1
+            self.limiter.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                self.limiter.release(classify(e))
+                delay = self.policy.delay(e, attempt)
+                if delay is None:
+                    raise self._give_up(e)
+                self.limiter.count_retry()
+                time.sleep(delay)
+                continue
+            self.limiter.release(SUCCESS)
+            return result
+
+    async def _acall(self, fn: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.limiter.aacquire()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self.limiter.release(CANCELLED)
+                raise
+            except Exception as e:
+                self.limiter.release(classify(e))
+                delay = self.policy.delay(e, attempt)
+                if delay is None:
+                    raise self._give_up(e)
+                self.limiter.count_retry()
+                await asyncio.sleep(delay)
+                continue
+            self.limiter.release(SUCCESS)
+            return result
+
+    def _stream(self, open_stream: Callable[[], Iterator[str]]) -> Iterator[str]:
+        # Retried only until the first delta; the slot is held for the whole stream.
+        attempt = 0
+        while True:
+            attempt += 1
+            self.limiter.acquire()
+            try:
+                deltas = iter(open_stream())
+                first = next(deltas)
+            except StopIteration:
+                self.limiter.release(SUCCESS)
+                return
+            except Exception as e:
+                self.limiter.release(classify(e))
+                delay = self.policy.delay(e, attempt)
+                if delay is None:
+                    raise self._give_up(e)
+                self.limiter.count_retry()
+                time.sleep(delay)
+                continue
+            break
+        outcome = CANCELLED
+        try:
+            yield first
+            yield from deltas
+            outcome = SUCCESS
+        except Exception as e:
+            outcome = classify(e)
+            raise
+        finally:
+            self.limiter.release(outcome)
+
+    async def _astream(self, open_stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.limiter.aacquire()
+            try:
+                deltas = open_stream()
+                first = await deltas.__anext__()
+            except StopAsyncIteration:
+                self.limiter.release(SUCCESS)
+                return
+            except asyncio.CancelledError:
+                self.limiter.release(CANCELLED)
+                raise
+            except Exception as e:
+                self.limiter.release(classify(e))
+                delay = self.policy.delay(e, attempt)
+                if delay is None:
+                    raise self._give_up(e)
+                self.limiter.count_retry()
+                await asyncio.sleep(delay)
+                continue
+            break
+        outcome = CANCELLED
+        try:
+            yield first
+            async for delta in deltas:
+                yield delta
+            outcome = SUCCESS
+        except Exception as e:
+            outcome = classify(e)
+            raise
+        finally:
+            self.limiter.release(outcome)
+
+    def generate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        return self._call(lambda: self.inner.generate(prompt, meta=meta))
+
+    def chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                        meta: Dict[str, Any] = None) -> str:
+        return self._call(lambda: self.inner.chat_completion(system_prompt, question, temperature=temperature, meta=meta))
+
+    async def agenerate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        return await self._acall(lambda: self.inner.agenerate(prompt, meta=meta))
+
+    async def achat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> str:
+        return await self._acall(
+            lambda: self.inner.achat_completion(system_prompt, question, temperature=temperature, meta=meta)
+        )
+
+    def stream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> Iterator[str]:
+        return self._stream(lambda: self.inner.stream_generate(prompt, meta=meta))
+
+    def stream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> Iterator[str]:
+        return self._stream(
+            lambda: self.inner.stream_chat_completion(system_prompt, question, temperature=temperature, meta=meta)
+        )
+
+    def astream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        return self._astream(lambda: self.inner.astream_generate(prompt, meta=meta))
+
+    def astream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                                meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        return self._astream(
+            lambda: self.inner.astream_chat_completion(system_prompt, question, temperature=temperature, meta=meta)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"limiter": {self.model: self.limiter.stats()}}
+        inner = self.inner.stats() if hasattr(self.inner, "stats") else {}
+        stats.update(inner)
+        return stats
+
+
+def build_limited(inner) -> LimitedProvider:
+    """Wrap `inner` with a limiter and retry policy configured from settings."""
+    limiter = AdaptiveLimiter(**getattr(settings, "LLM_LIMITER", {}))
+    policy = RetryPolicy(**getattr(settings, "LLM_RETRY", {}))
+    return LimitedProvider(inner, limiter, policy)
@@ -1,54 +1,253 @@
 # ai_core/mock_provider.py
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator
 
-class MockProvider:
-    def __init__(self):
-        pass
+import httpx
+from django.conf import settings
+from openai import InternalServerError, RateLimitError
+from .base import BaseLLMProvider, wrap_result
+from .tokens import count_tokens
+from .usage import report_usage
+
+DEFAULT_MOCK_CONFIG = {
+    "latency": "fixed",         # "fixed" or "lognormal"
+    "latency_ms": 0,            # fixed latency, or the median of the lognormal
+    "sigma": 0.5,               # lognormal spread
+    "spike_rate": 0.0,          # probability of a tail-latency spike
+    "spike_ms": 5000,           # extra latency added by a spike
+    "tokens_per_second": 0,     # output pacing (0 = instant); streams sleep between tokens
+    "error_rate": 0.0,          # probability of a 500
+    "rate_limit_rate": 0.0,     # probability of a 429
+    "retry_after": 1,           # Retry-After seconds sent with injected 429s
+    "seed": None,               # seed for latency/fault sampling (artifacts are always deterministic)
+}
+
+_MAX_CASES = re.compile(r"Generate up to (\d+) test cases")
+_SECTION = re.compile(r"^(Feature Description|User Story):\s*\n(.+)$", re.MULTILINE)
+_STREAM_TOKEN = re.compile(r"\S+\s*|\s+")
+
+_CASE_TEMPLATES = [
+    ("Functional", "P0", "Verify {feature} succeeds with valid input"),
+    ("Negative", "P1", "Verify {feature} rejects invalid input with a clear error"),
+    ("Boundary", "P1", "Verify {feature} at minimum and maximum field lengths"),
+    ("Security", "P0", "Verify {feature} is denied to unauthorised users"),
+    ("Regression", "P2", "Verify existing flows still work after {feature} changes"),
+    ("API", "P1", "Verify the {feature} API returns the documented status codes"),
+    ("Performance", "P2", "Verify {feature} responds within the agreed latency under load"),
+    ("Usability", "P2", "Verify {feature} error messages and labels are understandable"),
+]
+
+
+def _mock_request() -> httpx.Request:
+    return httpx.Request("POST", "https://mock.invalid/v1/responses")
+
+
+class MockProvider(BaseLLMProvider):
+    """
+    Offline stand-in for a real LLM.
+
+    Artifacts are schema-valid JSON (TEST_CASE_SCHEMA / TEST_PLAN_SCHEMA),
+    deterministic for a given prompt and sized by the prompt's max_cases.
+    Latency, 429/500 injection and streaming pace follow settings.MOCK_LLM
+    so the service can be load-tested against production-like upstream behaviour.
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.model = "mock"
+        self.config = dict(DEFAULT_MOCK_CONFIG, **(config or getattr(settings, "MOCK_LLM", {}) or {}))
+        self.rng = random.Random(self.config["seed"])
+
+    # ---- artifacts -------------------------------------------------------
+
+    def _artifact_rng(self, prompt: str) -> random.Random:
+        return random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+
+    def _feature(self, prompt: str) -> str:
+        match = _SECTION.search(prompt)
+        text = match.group(2).strip() if match else "the feature"
+        return text[:60].rstrip(" .,;") or "the feature"
+
+    def _test_cases(self, prompt: str) -> Dict[str, Any]:
+        match = _MAX_CASES.search(prompt)
+        count = int(match.group(1)) if match else 5
+        rng = self._artifact_rng(prompt)
+        feature = self._feature(prompt)
+        cases = []
+        for number in range(1, count + 1):
+            type_, priority, title = _CASE_TEMPLATES[(number - 1) % len(_CASE_TEMPLATES)]
+            variant = "" if number <= len(_CASE_TEMPLATES) else f" (variant {math.ceil(number / len(_CASE_TEMPLATES))})"
+            cases.append({
+                "id": f"TC-{number:03d}",
+                "title": title.format(feature=feature) + variant,
+                "priority": priority,
+                "type": type_,
+                "preconditions": "User is registered and the test environment is seeded",
+                "steps": [
+                    f"Given the user opens {feature}",
+                    f"When the user performs the {type_.lower()} scenario with data set {rng.randint(1, 99)}",
+                    "Then the system responds as described in the acceptance criteria",
+                ],
+                "expected_result": f"{feature} behaves as specified for the {type_.lower()} scenario",
+                "tags": [type_.lower(), rng.choice(["smoke", "sanity", "full"])],
+                "automation_candidate": rng.choice(["Yes", "No", "Needs Analysis"]),
+            })
+        return {"test_cases": cases}
+
+    def _test_plan(self, prompt: str) -> Dict[str, Any]:
+        rng = self._artifact_rng(prompt)
+        feature = self._feature(prompt)
+        return {
+            "feature": feature,
+            "objectives": [f"Validate {feature} against its acceptance criteria", "Prevent regressions in related flows"],
+            "scope": {"in_scope": [feature, "Related API endpoints"], "out_of_scope": ["Third-party outages"]},
+            "approach": "Risk-based testing with automated regression for critical paths",
+            "test_types": ["Functional", "Regression", "API", "Security"],
+            "environments": ["QA", "Staging"],
+            "data_and_tools": {"test_data": ["Seeded user accounts"], "tools": [rng.choice(["Playwright", "Cypress"]), "Postman"]},
+            "roles_and_responsibilities": ["QA engineer: execution", "Developer: fixes", "PO: sign-off"],
+            "risks_and_mitigations": [{"risk": "Late requirement changes", "mitigation": "Review scope each sprint"}],
+            "entry_criteria": ["Build deployed to QA", "Acceptance criteria agreed"],
+            "exit_criteria": ["All P0/P1 cases pass", "No open critical defects"],
+        }
+
+    def _output(self, prompt: str, type_: str) -> str:
+        """What a model would return as text for this prompt."""
+        if type_ == "test_cases":
+            return json.dumps(self._test_cases(prompt), indent=2)
+        if type_ == "test_plan":
+            return json.dumps(self._test_plan(prompt), indent=2)
+        if type_ == "chunk_summary":
+            return f"- Features: {self._feature(prompt)}\n- Risks: integration and data migration\n"
+        return f"(This is a mocked response)\n{prompt[:200]}"
+
+    def _answer(self, question: str) -> str:
+        rng = self._artifact_rng(question)
+        tips = [
+            "Start from the acceptance criteria and derive one positive and one negative case for each.",
+            "Check the team's knowledge base articles for environment and data setup.",
+            "Automate the happy path first, then the highest-risk negative paths.",
+            "Log defects with steps, expected and actual results, and attach evidence.",
+        ]
+        rng.shuffle(tips)
+        return f"(This is a mocked response) You asked: {question}\n\n" + "\n".join(f"- {tip}" for tip in tips[:3])
+
+    # ---- upstream behaviour ----------------------------------------------
+
+    def _latency(self) -> float:
+        """Seconds before the first token."""
+        base = self.config["latency_ms"] / 1000.0
+        if self.config["latency"] == "lognormal" and base > 0:
+            delay = self.rng.lognormvariate(math.log(base), self.config["sigma"])
+        else:
+            delay = base
+        if self.rng.random() < self.config["spike_rate"]:
+            delay += self.config["spike_ms"] / 1000.0
+        return delay
+
+    def _token_delay(self) -> float:
+        tps = self.config["tokens_per_second"]
+        return 1.0 / tps if tps else 0.0
+
+    def _fault(self):
+        """An exception to raise for this call, or None."""
+        roll = self.rng.random()
+        if roll < self.config["rate_limit_rate"]:
+            response = httpx.Response(429, request=_mock_request(),
+                                      headers={"retry-after": str(self.config["retry_after"])})
+            return RateLimitError("Mock rate limit exceeded", response=response, body=None)
+        if roll < self.config["rate_limit_rate"] + self.config["error_rate"]:
+            response = httpx.Response(500, request=_mock_request())
+            return InternalServerError("Mock upstream error", response=response, body=None)
+        return None
+
+    def _plan(self, prompt: str, output: str):
+        """Sample latency and faults for one call; report token usage like a real provider."""
+        fault = self._fault()
+        delay = self._latency()
+        if fault is None:
+            report_usage(count_tokens(prompt), count_tokens(output))
+        return fault, delay
+
+    def _complete(self, prompt: str, output: str) -> str:
+        fault, delay = self._plan(prompt, output)
+        time.sleep(delay + self._token_delay() * count_tokens(output))
+        if fault:
+            raise fault
+        return output
+
+    async def _acomplete(self, prompt: str, output: str) -> str:
+        fault, delay = self._plan(prompt, output)
+        await asyncio.sleep(delay + self._token_delay() * count_tokens(output))
+        if fault:
+            raise fault
+        return output
+
+    def _stream(self, prompt: str, output: str) -> Iterator[str]:
+        fault, delay = self._plan(prompt, output)
+        time.sleep(delay)
+        if fault:
+            raise fault
+        step = self._token_delay()
+        for token in _STREAM_TOKEN.findall(output):
+            if step:
+                time.sleep(step)
+            yield token
+
+    async def _astream(self, prompt: str, output: str) -> AsyncIterator[str]:
+        fault, delay = self._plan(prompt, output)
+        await asyncio.sleep(delay)
+        if fault:
+            raise fault
+        step = self._token_delay()
+        for token in _STREAM_TOKEN.findall(output):
+            if step:
+                await asyncio.sleep(step)
+            yield token
+
+    # ---- provider contract -----------------------------------------------
 
     def generate(self, prompt: str, meta: dict = None) -> dict:
-        
         """
         Return mocked test artifacts instead of calling an actual LLM.
         """
-        # Mocked artifacts
-        test_cases = [
-            "Verify valid login with correct username and password",
-            "Verify error message for incorrect password",
-            "Verify account is locked after 3 failed attempts"
-        ]
-        test_plan = {
-            "scope": "Login functionality",
-            "risks": "Weak passwords, brute force attempts",
-            "assumptions": "User already registered"
-        }
+        type_ = (meta or {}).get("type")
+        return wrap_result(type_, self._complete(prompt, self._output(prompt, type_)))
 
-        raw_text = f"""
-        MOCKED TEST ARTIFACTS
-        =====================
-        Prompt received:
-        {prompt}
+    def chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                        meta: dict = None) -> str:
+        """
+        Return a canned assistant answer instead of calling an actual LLM.
+        """
+        return self._complete(f"{system_prompt}\n{question}", self._answer(question))
 
-        Meta:
-        {meta}
+    async def agenerate(self, prompt: str, meta: dict = None) -> dict:
+        type_ = (meta or {}).get("type")
+        return wrap_result(type_, await self._acomplete(prompt, self._output(prompt, type_)))
 
-        Generated Test Cases:
-        {chr(10).join([f"{i+1}. {tc}" for i, tc in enumerate(test_cases)])}
+    async def achat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: dict = None) -> str:
+        return await self._acomplete(f"{system_prompt}\n{question}", self._answer(question))
 
-        Test Plan:
-        - Scope: {test_plan['scope']}
-        - Risks: {test_plan['risks']}
-        - Assumptions: {test_plan['assumptions']}
+    def stream_generate(self, prompt: str, meta: dict = None) -> Iterator[str]:
+        type_ = (meta or {}).get("type")
+        yield from self._stream(prompt, self._output(prompt, type_))
 
-        (This is a mocked response)
-        """
+    def stream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: dict = None) -> Iterator[str]:
+        yield from self._stream(f"{system_prompt}\n{question}", self._answer(question))
 
-        # Return depending on type
-        if meta.get("type") == "test_cases":
-            return {"test_cases": test_cases, "raw": raw_text.strip()}
-        elif meta.get("type") == "test_plan":
-            return {"test_plan": test_plan, "raw": raw_text.strip()}
+    async def astream_generate(self, prompt: str, meta: dict = None) -> AsyncIterator[str]:
+        type_ = (meta or {}).get("type")
+        async for token in self._astream(prompt, self._output(prompt, type_)):
+            yield token
 
-        return {
-            "test_cases": test_cases,
-            "test_plan": test_plan,
-            "raw": raw_text.strip()
-        }
\ No newline at end of file
+    async def astream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                                      meta: dict = None) -> AsyncIterator[str]:
+        async for token in self._astream(f"{system_prompt}\n{question}", self._answer(question)):
+            yield token
@@ -1,45 +1,245 @@
 # ai_core/openai_provider.py
 import os
 import json
-from typing import Any, Dict
-from openai import OpenAI
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List
+from openai import OpenAI, AsyncOpenAI, BadRequestError, NotFoundError, UnprocessableEntityError
 from django.conf import settings
-from .base import BaseLLMProvider
+from .base import BaseLLMProvider, default_temperature, wrap_result
+from .usage import report_usage
+
+
+def _response_text(resp) -> str:
+    """Pull the output text out of a Responses API result."""
+    if hasattr(resp, "output_text"):
+        return resp.output_text
+    text = ""
+    if hasattr(resp, "output"):
+        for item in resp.output:
+            if "content" in item and isinstance(item["content"], list):
+                for c in item["content"]:
+                    if c.get("type") == "output_text":
+                        text += c.get("text", "")
+    return text or str(resp)
+
+
+def _report_response_usage(usage) -> None:
+    """Responses API usage: input_tokens / output_tokens."""
+    if usage is not None:
+        report_usage(getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None))
+
+
+def _report_chat_usage(usage) -> None:
+    """Chat Completions usage: prompt_tokens / completion_tokens."""
+    if usage is not None:
+        report_usage(getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+
+
+def _chat_text(resp) -> str:
+    """Pull the message text out of a Chat Completions result."""
+    try:
+        return resp.choices[0].message.content
+    except Exception:
+        return str(resp)
+
+
+# Whether each model accepts the Responses API, learned on first use and kept
+# for the life of the process. Models missing here have not been probed yet.
+_RESPONSES_SUPPORT: Dict[str, bool] = {}
+_support_lock = threading.Lock()
+
+# Errors meaning "this model/endpoint does not take the Responses API", as
+# opposed to timeouts, rate limits and 5xx, which say nothing about it.
+_CAPABILITY_ERRORS = (BadRequestError, NotFoundError, UnprocessableEntityError)
+
+
+def _remember_support(model: str, supported: bool) -> None:
+    with _support_lock:
+        _RESPONSES_SUPPORT.setdefault(model, supported)
+
 
 class OpenAIProvider(BaseLLMProvider):
-    def __init__(self):
+    def __init__(self, model: str = None, timeout: float = None, max_retries: int = None):
         api_key = os.getenv("OPENAI_API_KEY") or settings.OPENAI_API_KEY
-        self.client = OpenAI(api_key=api_key)
-        self.model = getattr(settings, "OPENAI_MODEL", "gpt-4o-mini")
+        options = {"timeout": timeout} if timeout else {}
+        if max_retries is not None:
+            options["max_retries"] = max_retries
+        self.client = OpenAI(api_key=api_key, **options)
+        self.async_client = AsyncOpenAI(api_key=api_key, **options)
+        self.model = model or getattr(settings, "OPENAI_MODEL", "gpt-4o-mini")
 
-    def _call(self, prompt: str, temperature: float = 0.2) -> str:
-        """Internal wrapper for calling OpenAI and returning text."""
+    def _probe(self, via_responses: Callable[[], Any], via_chat: Callable[[], Any]) -> Any:
+        """
+        Use the Responses API when the model supports it, else Chat Completions.
+        Only the first call per model may try both; any later error is raised
+        instead of being retried on the other API.
+        """
+        supported = _RESPONSES_SUPPORT.get(self.model)
+        if supported is False:
+            return via_chat()
+        if supported:
+            return via_responses()
+        try:
+            result = via_responses()
+        except _CAPABILITY_ERRORS:
+            # A request the chat API also rejects proves nothing, so the
+            # model is only marked chat-only once the fallback succeeds.
+            result = via_chat()
+            _remember_support(self.model, False)
+            return result
+        _remember_support(self.model, True)
+        return result
+
+    async def _aprobe(self, via_responses: Callable[[], Awaitable[Any]], via_chat: Callable[[], Awaitable[Any]]) -> Any:
+        supported = _RESPONSES_SUPPORT.get(self.model)
+        if supported is False:
+            return await via_chat()
+        if supported:
+            return await via_responses()
         try:
+            result = await via_responses()
+        except _CAPABILITY_ERRORS:
+            result = await via_chat()
+            _remember_support(self.model, False)
+            return result
+        _remember_support(self.model, True)
+        return result
+
+    def _complete(self, messages: List[Dict[str, str]], temperature: float, max_output_tokens: int = None) -> str:
+        """Internal wrapper for calling OpenAI and returning text."""
+        extra = {"max_output_tokens": max_output_tokens} if max_output_tokens else {}
+        chat_extra = {"max_tokens": max_output_tokens} if max_output_tokens else {}
+
+        def via_responses():
             resp = self.client.responses.create(
                 model=self.model,
-                input=[{"role": "user", "content": prompt}],
+                input=messages,
                 temperature=temperature,
+                **extra,
             )
-            if hasattr(resp, "output_text"):
-                return resp.output_text
-            text = ""
-            if hasattr(resp, "output"):
-                for item in resp.output:
-                    if "content" in item and isinstance(item["content"], list):
-                        for c in item["content"]:
-                            if c.get("type") == "output_text":
-                                text += c.get("text", "")
-            return text or str(resp)
-        except Exception:
+            _report_response_usage(getattr(resp, "usage", None))
+            return _response_text(resp)
+
+        def via_chat():
             resp = self.client.chat.completions.create(
                 model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+                messages=messages,
+                temperature=temperature,
+                **chat_extra,
+            )
+            _report_chat_usage(getattr(resp, "usage", None))
+            return _chat_text(resp)
+
+        return self._probe(via_responses, via_chat)
+
+    async def _acomplete(self, messages: List[Dict[str, str]], temperature: float, max_output_tokens: int = None) -> str:
+        """Async twin of _complete using the AsyncOpenAI client."""
+        extra = {"max_output_tokens": max_output_tokens} if max_output_tokens else {}
+        chat_extra = {"max_tokens": max_output_tokens} if max_output_tokens else {}
+
+        async def via_responses():
+            resp = await self.async_client.responses.create(
+                model=self.model,
+                input=messages,
+                temperature=temperature,
+                **extra,
+            )
+            _report_response_usage(getattr(resp, "usage", None))
+            return _response_text(resp)
+
+        async def via_chat():
+            resp = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                **chat_extra,
+            )
+            _report_chat_usage(getattr(resp, "usage", None))
+            return _chat_text(resp)
+
+        return await self._aprobe(via_responses, via_chat)
+
+    def _stream(self, messages: List[Dict[str, str]], temperature: float, max_output_tokens: int = None) -> Iterator[str]:
+        """Stream text deltas from whichever API the model supports."""
+        extra = {"max_output_tokens": max_output_tokens} if max_output_tokens else {}
+        chat_extra = {"max_tokens": max_output_tokens} if max_output_tokens else {}
+
+        def via_responses():
+            return "responses", self.client.responses.create(
+                model=self.model,
+                input=messages,
+                temperature=temperature,
+                stream=True,
+                **extra,
+            )
+
+        def via_chat():
+            return "chat", self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
                 temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+                **chat_extra,
             )
-            try:
-                return resp.choices[0].message.content
-            except Exception:
-                return str(resp)
+
+        api, events = self._probe(via_responses, via_chat)
+        if api == "responses":
+            for event in events:
+                type_ = getattr(event, "type", "")
+                if type_ == "response.output_text.delta":
+                    yield event.delta
+                elif type_ == "response.completed":
+                    _report_response_usage(getattr(event.response, "usage", None))
+            return
+
+        for chunk in events:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            elif getattr(chunk, "usage", None):
+                _report_chat_usage(chunk.usage)
+
+    async def _astream(self, messages: List[Dict[str, str]], temperature: float, max_output_tokens: int = None) -> AsyncIterator[str]:
+        extra = {"max_output_tokens": max_output_tokens} if max_output_tokens else {}
+        chat_extra = {"max_tokens": max_output_tokens} if max_output_tokens else {}
+
+        async def via_responses():
+            return "responses", await self.async_client.responses.create(
+                model=self.model,
+                input=messages,
+                temperature=temperature,
+                stream=True,
+                **extra,
+            )
+
+        async def via_chat():
+            return "chat", await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+                **chat_extra,
+            )
+
+        api, events = await self._aprobe(via_responses, via_chat)
+        if api == "responses":
+            async for event in events:
+                type_ = getattr(event, "type", "")
+                if type_ == "response.output_text.delta":
+                    yield event.delta
+                elif type_ == "response.completed":
+                    _report_response_usage(getattr(event.response, "usage", None))
+            return
+
+        async for chunk in events:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            elif getattr(chunk, "usage", None):
+                _report_chat_usage(chunk.usage)
+
+    def _call(self, prompt: str, temperature: float = 0.2) -> str:
+        return self._complete([{"role": "user", "content": prompt}], temperature)
 
     def generate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
         """
@@ -47,53 +247,60 @@ class OpenAIProvider(BaseLLMProvider):
         Returns structured dict depending on meta["type"].
         """
         meta = meta or {}
-        type_ = meta.get("type") 
+        type_ = meta.get("type")
 
         # Adjust temperature for variety
-        temperature = 0.2 if type_ == "test_cases" else 0.1
+        temperature = default_temperature(type_)
         raw = self._call(prompt, temperature=temperature)
+        return wrap_result(type_, raw)
 
-        # Wrap output in consistent dict
-        if type_ == "test_cases":
-            return {"test_cases": raw}
-        elif type_ == "test_plan":
-            return {"test_plan": raw}
-        else:
-            return {"raw": raw}
-        
-    def chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3) -> str:
+    async def agenerate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        meta = meta or {}
+        type_ = meta.get("type")
+        raw = await self._acomplete([{"role": "user", "content": prompt}], default_temperature(type_))
+        return wrap_result(type_, raw)
+
+    def chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                        meta: Dict[str, Any] = None) -> str:
         """Call OpenAI Responses API and return a plain string"""
-        try:
-            resp = self.client.responses.create(
-                model=self.model,
-                input=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": question}
-                ],
-                temperature=temperature,
-                max_tokens=500
-            )
-            if hasattr(resp, "output_text"):
-                return resp.output_text
-            text = ""
-            if hasattr(resp, "output"):
-                for item in resp.output:
-                    if "content" in item and isinstance(item["content"], list):
-                        for c in item["content"]:
-                            if c.get("type") == "output_text":
-                                text += c.get("text", "")
-            return text or str(resp)
-        except Exception as e:
-            resp = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": question}
-                ],
-                temperature=temperature,
-            )
-            try:
-                return resp.choices[0].message.content
-            except Exception:
-                return str(resp)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
+        return self._complete(messages, temperature, max_output_tokens=500)
+
+    async def achat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> str:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
+        return await self._acomplete(messages, temperature, max_output_tokens=500)
+
+    def stream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> Iterator[str]:
+        meta = meta or {}
+        messages = [{"role": "user", "content": prompt}]
+        yield from self._stream(messages, default_temperature(meta.get("type")))
+
+    async def astream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        meta = meta or {}
+        messages = [{"role": "user", "content": prompt}]
+        async for delta in self._astream(messages, default_temperature(meta.get("type"))):
+            yield delta
+
+    def stream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> Iterator[str]:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
+        yield from self._stream(messages, temperature, max_output_tokens=500)
 
+    async def astream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                                      meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
+        async for delta in self._astream(messages, temperature, max_output_tokens=500):
+            yield delta
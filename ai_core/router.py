@@ -0,0 +1,210 @@
+# ai_core/router.py
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from .base import BaseLLMProvider
+from .limiter import LLMOverloaded
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class AllProvidersFailed(RuntimeError):
+    """Every provider in a route's fallback chain raised."""
+
+
+class RouterProvider(BaseLLMProvider):
+    """
+    Picks a fallback chain of named providers per request and tries them in
+    order until one succeeds.
+
+    providers: {name: provider}, e.g. {"small": OpenAIProvider("gpt-4o-mini"), ...}
+    routes: ordered rules; the first one matching the request wins:
+        {"type": "test_plan", "max_tokens": 6000, "chain": ["small", "large"]}
+        {"min_tokens": 20000, "chain": ["large", "small"]}
+        {"chain": ["small", "large"]}            # catch-all
+    "type" matches meta["type"] (a string or a list), the token bounds the
+    estimated prompt size. Per-provider timeouts belong to the providers.
+    """
+
+    def __init__(self, providers: Dict[str, BaseLLMProvider], routes: List[Dict[str, Any]]):
+        if not providers:
+            raise ValueError("RouterProvider needs at least one provider")
+        for route in routes:
+            if not route.get("chain"):
+                raise ValueError(f"Route {route} has an empty chain")
+            unknown = [name for name in route["chain"] if name not in providers]
+            if unknown:
+                raise ValueError(f"Route {route} names unknown providers: {unknown}")
+        self.providers = providers
+        self.routes = routes
+        self.default_chain = list(providers)
+        self._lock = threading.Lock()
+        self.counters = {"routed": {}, "fallbacks": 0, "failures": 0}
+
+    @property
+    def model(self) -> str:
+        # Stable across requests so cache and coalescing keys do not depend on the route taken.
+        return "router:" + ",".join(
+            f"{name}={getattr(p, 'model', type(p).__name__)}" for name, p in self.providers.items()
+        )
+
+    def _matches(self, route: Dict[str, Any], type_: str, tokens: int) -> bool:
+        wanted = route.get("type")
+        if wanted is not None:
+            if isinstance(wanted, str):
+                wanted = [wanted]
+            if type_ not in wanted:
+                return False
+        if tokens < route.get("min_tokens", 0):
+            return False
+        if "max_tokens" in route and tokens > route["max_tokens"]:
+            return False
+        return True
+
+    def _select(self, meta: Dict[str, Any], tokens: int) -> List[str]:
+        type_ = (meta or {}).get("type")
+        for route in self.routes:
+            if self._matches(route, type_, tokens):
+                return route["chain"]
+        return self.default_chain
+
+    def chain(self, prompt: str, meta: Dict[str, Any] = None) -> List[str]:
+        """Provider names to try, in order, for this request."""
+        return self._select(meta, count_tokens(prompt))
+
+    def target_model(self, meta: Dict[str, Any] = None, prompt_tokens: int = 0) -> Optional[str]:
+        """Model of the first provider in the chain a request of this size and type would take."""
+        return self.providers[self._select(meta, prompt_tokens)[0]].target_model(meta, prompt_tokens)
+
+    def _count(self, key: str, name: str = None) -> None:
+        with self._lock:
+            if name is None:
+                self.counters[key] += 1
+            else:
+                self.counters[key][name] = self.counters[key].get(name, 0) + 1
+
+    def _failed(self, name: str, error: Exception, chain: List[str]) -> None:
+        logger.warning("LLM provider %s failed (%s), chain %s", name, error, chain)
+        if name != chain[-1]:
+            self._count("fallbacks")
+
+    def _fail(self, chain: List[str], last_error: Exception) -> None:
+        self._count("failures")
+        if isinstance(last_error, LLMOverloaded):
+            # Every model is saturated: let views answer 503 with Retry-After.
+            raise last_error
+        raise AllProvidersFailed(f"All providers failed ({', '.join(chain)}): {last_error}") from last_error
+
+    def _route(self, method: str, chain: List[str], *args, **kwargs) -> Any:
+        last_error = None
+        for name in chain:
+            try:
+                result = getattr(self.providers[name], method)(*args, **kwargs)
+            except Exception as e:
+                last_error = e
+                self._failed(name, e, chain)
+                continue
+            self._count("routed", name)
+            return result
+        self._fail(chain, last_error)
+
+    async def _aroute(self, method: str, chain: List[str], *args, **kwargs) -> Any:
+        last_error = None
+        for name in chain:
+            try:
+                result = await getattr(self.providers[name], method)(*args, **kwargs)
+            except Exception as e:
+                last_error = e
+                self._failed(name, e, chain)
+                continue
+            self._count("routed", name)
+            return result
+        self._fail(chain, last_error)
+
+    def _route_stream(self, method: str, chain: List[str], *args, **kwargs) -> Iterator[str]:
+        # Falling back is only possible before the first delta reaches the client.
+        last_error = None
+        for name in chain:
+            try:
+                deltas = iter(getattr(self.providers[name], method)(*args, **kwargs))
+                first = next(deltas)
+            except StopIteration:
+                self._count("routed", name)
+                return
+            except Exception as e:
+                last_error = e
+                self._failed(name, e, chain)
+                continue
+            self._count("routed", name)
+            yield first
+            yield from deltas
+            return
+        self._fail(chain, last_error)
+
+    async def _aroute_stream(self, method: str, chain: List[str], *args, **kwargs) -> AsyncIterator[str]:
+        last_error = None
+        for name in chain:
+            try:
+                deltas = getattr(self.providers[name], method)(*args, **kwargs)
+                first = await deltas.__anext__()
+            except StopAsyncIteration:
+                self._count("routed", name)
+                return
+            except Exception as e:
+                last_error = e
+                self._failed(name, e, chain)
+                continue
+            self._count("routed", name)
+            yield first
+            async for delta in deltas:
+                yield delta
+            return
+        self._fail(chain, last_error)
+
+    def generate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        return self._route("generate", self.chain(prompt, meta), prompt, meta=meta)
+
+    def chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                        meta: Dict[str, Any] = None) -> str:
+        chain = self.chain(f"{system_prompt}\n{question}", meta)
+        return self._route("chat_completion", chain, system_prompt, question, temperature=temperature, meta=meta)
+
+    async def agenerate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        return await self._aroute("agenerate", self.chain(prompt, meta), prompt, meta=meta)
+
+    async def achat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> str:
+        chain = self.chain(f"{system_prompt}\n{question}", meta)
+        return await self._aroute("achat_completion", chain, system_prompt, question,
+                                  temperature=temperature, meta=meta)
+
+    def stream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> Iterator[str]:
+        return self._route_stream("stream_generate", self.chain(prompt, meta), prompt, meta=meta)
+
+    def stream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> Iterator[str]:
+        chain = self.chain(f"{system_prompt}\n{question}", meta)
+        return self._route_stream("stream_chat_completion", chain, system_prompt, question,
+                                  temperature=temperature, meta=meta)
+
+    def astream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        return self._aroute_stream("astream_generate", self.chain(prompt, meta), prompt, meta=meta)
+
+    def astream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                                meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        chain = self.chain(f"{system_prompt}\n{question}", meta)
+        return self._aroute_stream("astream_chat_completion", chain, system_prompt, question,
+                                   temperature=temperature, meta=meta)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            router = {"routed": dict(self.counters["routed"]), "fallbacks": self.counters["fallbacks"],
+                      "failures": self.counters["failures"]}
+        router["providers"] = {name: getattr(p, "model", type(p).__name__) for name, p in self.providers.items()}
+        stats = {"router": router}
+        for provider in self.providers.values():
+            for key, value in (provider.stats() if hasattr(provider, "stats") else {}).items():
+                stats.setdefault(key, {}).update(value)
+        return stats
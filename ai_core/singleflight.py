@@ -0,0 +1,158 @@
+# ai_core/singleflight.py
+import asyncio
+import copy
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+from .base import BaseLLMProvider, default_temperature
+from .cache import chat_prompt, request_key
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one execution.
+    The first caller runs the function; callers arriving while it is in
+    flight block (sync) or await (async) and receive the same outcome.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+        self.counters = {"upstream_calls": 0, "coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.counters["upstream_calls"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # asyncio tasks belong to one event loop, so in-flight work is keyed per loop.
+        task_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is not None:
+                self.counters["coalesced"] += 1
+                follower = True
+            else:
+                task = self._tasks[task_key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda _: self._forget(task_key))
+                self.counters["upstream_calls"] += 1
+                follower = False
+        # shield() lets the shared call finish even if one awaiting request is cancelled.
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result) if follower else result
+
+    def _forget(self, task_key: tuple) -> None:
+        with self._lock:
+            self._tasks.pop(task_key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+        stats["in_flight"] = self.in_flight()
+        return stats
+
+
+class CoalescingProvider(BaseLLMProvider):
+    """
+    Shares one upstream call between concurrent identical requests, keyed like
+    the response cache (normalized prompt, model, temperature, type).
+    Streams are passed through untouched.
+    """
+
+    def __init__(self, inner, flight: SingleFlight = None):
+        self.inner = inner
+        self.flight = flight or SingleFlight()
+
+    @property
+    def model(self) -> str:
+        return getattr(self.inner, "model", type(self.inner).__name__)
+
+    def target_model(self, meta: Dict[str, Any] = None, prompt_tokens: int = 0) -> Optional[str]:
+        return self.inner.target_model(meta, prompt_tokens)
+
+    def _generate_key(self, prompt: str, meta: Dict[str, Any]) -> str:
+        type_ = meta.get("type")
+        return "generate:" + request_key(self.model, prompt, default_temperature(type_), type_)
+
+    def _chat_key(self, system_prompt: str, question: str, temperature: float, meta: Dict[str, Any]) -> str:
+        return "chat:" + request_key(self.model, chat_prompt(system_prompt, question), temperature,
+                                     meta.get("type", "chat"))
+
+    def generate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        meta = meta or {}
+        return self.flight.do(self._generate_key(prompt, meta), lambda: self.inner.generate(prompt, meta=meta))
+
+    def chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                        meta: Dict[str, Any] = None) -> str:
+        meta = meta or {}
+        return self.flight.do(
+            self._chat_key(system_prompt, question, temperature, meta),
+            lambda: self.inner.chat_completion(system_prompt, question, temperature=temperature, meta=meta),
+        )
+
+    async def agenerate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        meta = meta or {}
+        return await self.flight.ado(self._generate_key(prompt, meta), lambda: self.inner.agenerate(prompt, meta=meta))
+
+    async def achat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> str:
+        meta = meta or {}
+        return await self.flight.ado(
+            self._chat_key(system_prompt, question, temperature, meta),
+            lambda: self.inner.achat_completion(system_prompt, question, temperature=temperature, meta=meta),
+        )
+
+    def stream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> Iterator[str]:
+        return self.inner.stream_generate(prompt, meta=meta)
+
+    def stream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> Iterator[str]:
+        return self.inner.stream_chat_completion(system_prompt, question, temperature=temperature, meta=meta)
+
+    def astream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        return self.inner.astream_generate(prompt, meta=meta)
+
+    def astream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                                meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        return self.inner.astream_chat_completion(system_prompt, question, temperature=temperature, meta=meta)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"coalescing": self.flight.stats()}
+        if hasattr(self.inner, "stats"):
+            stats.update(self.inner.stats())
+        return stats
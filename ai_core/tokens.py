@@ -0,0 +1,62 @@
+# ai_core/tokens.py
+import re
+
+from django.conf import settings
+
+# Context windows (prompt + completion) of the models we route to.
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1-nano": 1047576,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+# Words, numbers, single punctuation marks. Long words are several BPE tokens.
+_PIECE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def _piece_tokens(piece: str) -> int:
+    return max(1, (len(piece) + 3) // 4) if len(piece) > 4 else 1
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the BPE token count of text without a tokenizer dependency.
+    Errs on the high side for prose; exact counts come back from the API
+    and are recorded per call by MeteredProvider.
+    """
+    if not text:
+        return 0
+    return sum(_piece_tokens(m.group(0)) for m in _PIECE.finditer(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text at the piece boundary where the estimated count reaches max_tokens."""
+    if max_tokens <= 0 or not text:
+        return ""
+    used = 0
+    for m in _PIECE.finditer(text):
+        used += _piece_tokens(m.group(0))
+        if used > max_tokens:
+            return text[:m.start()].rstrip()
+    return text
+
+
+def context_tokens(model: str = None) -> int:
+    """Context window for a model; LLM_CONTEXT_TOKENS overrides per model."""
+    model = model or getattr(settings, "OPENAI_MODEL", "gpt-4o-mini")
+    overrides = getattr(settings, "LLM_CONTEXT_TOKENS", {}) or {}
+    if model in overrides:
+        return overrides[model]
+    if model in MODEL_CONTEXT_TOKENS:
+        return MODEL_CONTEXT_TOKENS[model]
+    # Dated snapshots, e.g. gpt-4o-mini-2024-07-18
+    for name in sorted(MODEL_CONTEXT_TOKENS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_CONTEXT_TOKENS[name]
+    return DEFAULT_CONTEXT_TOKENS
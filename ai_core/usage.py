@@ -0,0 +1,194 @@
+# ai_core/usage.py
+import contextvars
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .base import BaseLLMProvider, result_text
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Token counts reported by the provider for the call currently being metered.
+_scope = contextvars.ContextVar("llm_usage_scope", default=None)
+
+
+def report_usage(prompt_tokens: int = None, completion_tokens: int = None) -> None:
+    """Providers call this with the token counts the upstream API returned."""
+    scope = _scope.get()
+    if scope is None:
+        return
+    if prompt_tokens is not None:
+        scope["prompt_tokens"] = prompt_tokens
+    if completion_tokens is not None:
+        scope["completion_tokens"] = completion_tokens
+
+
+class MeteredProvider(BaseLLMProvider):
+    """
+    Records prompt/completion tokens, latency and outcome of every upstream
+    call through the recorder named by settings.LLM_USAGE_RECORDER.
+    Counts the provider did not report are estimated with count_tokens().
+    """
+
+    def __init__(self, inner, recorder: Callable[[Dict[str, Any]], None] = None):
+        self.inner = inner
+        if recorder is None:
+            path = getattr(settings, "LLM_USAGE_RECORDER", None)
+            recorder = import_string(path) if path else None
+        self.recorder = recorder
+
+    @property
+    def model(self) -> str:
+        return getattr(self.inner, "model", type(self.inner).__name__)
+
+    def target_model(self, meta: Dict[str, Any] = None, prompt_tokens: int = 0) -> Optional[str]:
+        return self.inner.target_model(meta, prompt_tokens)
+
+    def _record(self, call: str, meta: Dict[str, Any], prompt: str, scope: Dict[str, Any],
+                completion: str, started: float, error: Exception = None) -> None:
+        if self.recorder is None:
+            return
+        record = {
+            "model": scope.get("model") or self.model,
+            "call": call,
+            "artifact_type": (meta or {}).get("type") or "",
+            "source": (meta or {}).get("source") or "",
+            "prompt_tokens": scope.get("prompt_tokens"),
+            "completion_tokens": scope.get("completion_tokens"),
+            "tokens_estimated": False,
+            "latency_ms": int((time.perf_counter() - started) * 1000),
+            "success": error is None,
+            "error": str(error) if error else "",
+        }
+        if record["prompt_tokens"] is None or record["completion_tokens"] is None:
+            record["tokens_estimated"] = True
+            if record["prompt_tokens"] is None:
+                record["prompt_tokens"] = count_tokens(prompt)
+            if record["completion_tokens"] is None:
+                record["completion_tokens"] = count_tokens(completion or "")
+        try:
+            self.recorder(record)
+        except Exception:
+            logger.exception("Failed to record LLM usage")
+
+    def _metered(self, call: str, meta: Dict[str, Any], prompt: str, fn: Callable[[], Any],
+                 text: Callable[[Any], str]) -> Any:
+        scope: Dict[str, Any] = {}
+        token = _scope.set(scope)
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            _scope.reset(token)
+            self._record(call, meta, prompt, scope, "", started, error=e)
+            raise
+        _scope.reset(token)
+        self._record(call, meta, prompt, scope, text(result), started)
+        return result
+
+    async def _ametered(self, call: str, meta: Dict[str, Any], prompt: str, fn: Callable[[], Any],
+                        text: Callable[[Any], str]) -> Any:
+        scope: Dict[str, Any] = {}
+        token = _scope.set(scope)
+        started = time.perf_counter()
+        record = sync_to_async(self._record)
+        try:
+            result = await fn()
+        except Exception as e:
+            _scope.reset(token)
+            await record(call, meta, prompt, scope, "", started, error=e)
+            raise
+        _scope.reset(token)
+        await record(call, meta, prompt, scope, text(result), started)
+        return result
+
+    def _metered_stream(self, call: str, meta: Dict[str, Any], prompt: str, deltas: Iterator[str]) -> Iterator[str]:
+        # The stream is consumed across many next() calls, so the scope is
+        # entered around each step rather than once.
+        scope: Dict[str, Any] = {}
+        parts = []
+        started = time.perf_counter()
+        while True:
+            token = _scope.set(scope)
+            try:
+                delta = next(deltas)
+            except StopIteration:
+                break
+            except Exception as e:
+                self._record(call, meta, prompt, scope, "".join(parts), started, error=e)
+                raise
+            finally:
+                _scope.reset(token)
+            parts.append(delta)
+            yield delta
+        self._record(call, meta, prompt, scope, "".join(parts), started)
+
+    async def _ametered_stream(self, call: str, meta: Dict[str, Any], prompt: str,
+                               deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+        scope: Dict[str, Any] = {}
+        parts = []
+        started = time.perf_counter()
+        record = sync_to_async(self._record)
+        while True:
+            token = _scope.set(scope)
+            try:
+                delta = await deltas.__anext__()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                await record(call, meta, prompt, scope, "".join(parts), started, error=e)
+                raise
+            finally:
+                _scope.reset(token)
+            parts.append(delta)
+            yield delta
+        await record(call, meta, prompt, scope, "".join(parts), started)
+
+    def generate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        type_ = (meta or {}).get("type")
+        return self._metered("generate", meta, prompt, lambda: self.inner.generate(prompt, meta=meta),
+                             lambda result: result_text(result, type_))
+
+    def chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                        meta: Dict[str, Any] = None) -> str:
+        return self._metered(
+            "chat", meta, f"{system_prompt}\n{question}",
+            lambda: self.inner.chat_completion(system_prompt, question, temperature=temperature, meta=meta),
+            lambda result: result,
+        )
+
+    async def agenerate(self, prompt: str, meta: Dict[str, Any] = None) -> Dict[str, Any]:
+        type_ = (meta or {}).get("type")
+        return await self._ametered("generate", meta, prompt, lambda: self.inner.agenerate(prompt, meta=meta),
+                                    lambda result: result_text(result, type_))
+
+    async def achat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> str:
+        return await self._ametered(
+            "chat", meta, f"{system_prompt}\n{question}",
+            lambda: self.inner.achat_completion(system_prompt, question, temperature=temperature, meta=meta),
+            lambda result: result,
+        )
+
+    def stream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> Iterator[str]:
+        return self._metered_stream("stream_generate", meta, prompt, iter(self.inner.stream_generate(prompt, meta=meta)))
+
+    def stream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                               meta: Dict[str, Any] = None) -> Iterator[str]:
+        deltas = self.inner.stream_chat_completion(system_prompt, question, temperature=temperature, meta=meta)
+        return self._metered_stream("stream_chat", meta, f"{system_prompt}\n{question}", iter(deltas))
+
+    def astream_generate(self, prompt: str, meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        return self._ametered_stream("stream_generate", meta, prompt, self.inner.astream_generate(prompt, meta=meta))
+
+    def astream_chat_completion(self, system_prompt: str, question: str, temperature: float = 0.3,
+                                meta: Dict[str, Any] = None) -> AsyncIterator[str]:
+        deltas = self.inner.astream_chat_completion(system_prompt, question, temperature=temperature, meta=meta)
+        return self._ametered_stream("stream_chat", meta, f"{system_prompt}\n{question}", deltas)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.inner.stats() if hasattr(self.inner, "stats") else {}
@@ -0,0 +1,11 @@
+"""
+Benchmarks for document extraction and prompt assembly.
+
+    python -m benchmarks run --output results.json
+    python -m benchmarks run --baseline main.json --threshold 15
+    python -m benchmarks compare main.json results.json --threshold 15
+    python -m benchmarks kb --articles 100000
+    python -m benchmarks vectors --rows 500000
+
+See benchmarks/__main__.py for options.
+"""
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import sys
+
+from .runner import DEFAULT_SIZES, compare, load, run
+from .stages import STAGES
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(",") if size.strip()]
+
+
+def _report(rows, regressions, threshold):
+    for row in rows:
+        flag = "  REGRESSION" if row in regressions else ""
+        print(f"{row['stage']:18} {row['pages']:5}p  {row['baseline'] * 1000:10.2f} -> "
+              f"{row['current'] * 1000:10.2f} ms  {row['change_pct']:+7.1f}%{flag}")
+    if regressions:
+        print(f"{len(regressions)} stage(s) more than {threshold}% slower than the baseline.")
+        return 1
+    return 0
+
+
+def _write(results, path):
+    if path:
+        with open(path, "w") as fh:
+            json.dump(results, fh, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = commands.add_parser("run", help="Measure the stages and write results as JSON.")
+    run_cmd.add_argument("--stages", default=",".join(STAGES),
+                         help=f"Comma-separated stages (default all: {', '.join(STAGES)}).")
+    run_cmd.add_argument("--sizes", type=_sizes, default=list(DEFAULT_SIZES),
+                         help="Comma-separated input sizes in pages (default 1,10,50,100,500).")
+    run_cmd.add_argument("--repeat", type=int, default=3, help="Timed runs per measurement (median reported).")
+    run_cmd.add_argument("--output", help="Write results to this JSON file (default stdout).")
+    run_cmd.add_argument("--baseline", help="Results JSON to compare against; exit 1 on regressions.")
+    run_cmd.add_argument("--threshold", type=float, default=10.0,
+                         help="Percent slowdown that counts as a regression (default 10).")
+
+    cmp_cmd = commands.add_parser("compare", help="Compare two results files.")
+    cmp_cmd.add_argument("baseline")
+    cmp_cmd.add_argument("current")
+    cmp_cmd.add_argument("--threshold", type=float, default=10.0)
+
+    kb_cmd = commands.add_parser("kb", help="KnowledgeBase search latency on a throwaway database.")
+    kb_cmd.add_argument("--articles", type=int, default=100_000)
+    kb_cmd.add_argument("--queries", type=int, default=50)
+    kb_cmd.add_argument("--output", help="Write results to this JSON file (default stdout).")
+
+    vec_cmd = commands.add_parser("vectors", help="Semantic KB top-k latency on a throwaway vector index.")
+    vec_cmd.add_argument("--rows", type=int, default=500_000)
+    vec_cmd.add_argument("--queries", type=int, default=50)
+    vec_cmd.add_argument("--dim", type=int, default=256)
+    vec_cmd.add_argument("--output", help="Write results to this JSON file (default stdout).")
+
+    args = parser.parse_args(argv)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "qa_ai_assistant.settings")
+
+    if args.command == "compare":
+        return _report(*compare(load(args.baseline), load(args.current), args.threshold), args.threshold)
+    if args.command == "kb":
+        from . import kb
+
+        results = kb.run(args.articles, args.queries, log=lambda line: print(line, file=sys.stderr))
+        _write(results, args.output)
+        return 0
+    if args.command == "vectors":
+        from . import vectors
+
+        results = vectors.run(args.rows, args.queries, args.dim, log=lambda line: print(line, file=sys.stderr))
+        _write(results, args.output)
+        return 0
+
+    stages = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    results = run(stages, args.sizes, args.repeat, log=lambda line: print(line, file=sys.stderr))
+    _write(results, args.output)
+    if args.baseline:
+        return _report(*compare(load(args.baseline), results, args.threshold), args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
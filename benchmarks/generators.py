@@ -0,0 +1,147 @@
+"""Deterministic synthetic inputs, sized in pages of roughly PAGE_CHARS characters."""
+import io
+import json
+import random
+
+from docx import Document
+
+PAGE_CHARS = 3000
+LINE_CHARS = 90
+
+_WORDS = (
+    "user login password reset account checkout payment refund order cart invoice report "
+    "dashboard admin role permission token session timeout error validation field email "
+    "notification export import search filter sort page api request response status audit "
+    "shall must should system display allow prevent within seconds valid invalid required"
+).split()
+
+
+def _sentences(rng, chars):
+    out, size = [], 0
+    while size < chars:
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 18))]
+        sentence = " ".join(words).capitalize() + "."
+        out.append(sentence)
+        size += len(sentence) + 1
+    return out
+
+
+def page_blocks(pages, seed=0):
+    """[(heading, [paragraph, ...]), ...] per page; the shared skeleton every format renders."""
+    rng = random.Random(seed)
+    blocks = []
+    for number in range(1, pages + 1):
+        heading = f"{number} {rng.choice(_WORDS).capitalize()} {rng.choice(_WORDS)} requirements"
+        sentences = _sentences(rng, PAGE_CHARS - len(heading))
+        paragraphs = [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+        blocks.append((heading, paragraphs))
+    return blocks
+
+
+def _wrap(text, width=LINE_CHARS):
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + len(word) + 1 > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages, seed=0):
+    """A text PDF (Helvetica, one content stream per page) written without external libraries."""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    next_id = 4
+    for heading, paragraphs in page_blocks(pages, seed):
+        lines = [heading, ""] + [line for p in paragraphs for line in _wrap(p) + [""]]
+        stream = ["BT /F1 9 Tf 11 TL 40 800 Td"]
+        stream += [f"({_pdf_escape(line)}) '" for line in lines]
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1")
+        page_id, content_id = next_id, next_id + 1
+        next_id += 2
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content)
+        objects[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{k} 0 R" for k in kids).encode(), len(kids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = out.tell()
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (obj_id, objects[obj_id]))
+    xref = out.tell()
+    size = max(objects) + 1
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+    for obj_id in range(1, size):
+        out.write(b"%010d 00000 n \n" % offsets.get(obj_id, 0))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+    return out.getvalue()
+
+
+def make_docx(pages, seed=0):
+    doc = Document()
+    for heading, paragraphs in page_blocks(pages, seed):
+        doc.add_heading(heading, level=1)
+        for paragraph in paragraphs:
+            doc.add_paragraph(paragraph)
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def make_adf(pages, seed=0):
+    """A Jira description in Atlassian Document Format (dict, as the REST API returns it)."""
+    content = []
+    for heading, paragraphs in page_blocks(pages, seed):
+        content.append({"type": "heading", "attrs": {"level": 2},
+                        "content": [{"type": "text", "text": heading}]})
+        for index, paragraph in enumerate(paragraphs):
+            node = {"type": "paragraph", "content": [{"type": "text", "text": paragraph},
+                                                      {"type": "hardBreak"}]}
+            if index % 3 == 2:
+                node = {"type": "bulletList", "content": [{"type": "listItem", "content": [node]}]}
+            content.append(node)
+    return {"type": "doc", "version": 1, "content": content}
+
+
+def make_xhtml(pages, seed=0):
+    """A Confluence page body in storage format (XHTML with ac: macros)."""
+    parts = []
+    for heading, paragraphs in page_blocks(pages, seed):
+        parts.append(f"<h2>{heading}</h2>")
+        for index, paragraph in enumerate(paragraphs):
+            if index % 3 == 2:
+                parts.append(f'<ac:structured-macro ac:name="info"><ac:rich-text-body><p>{paragraph}</p>'
+                             f"</ac:rich-text-body></ac:structured-macro>")
+            elif index % 4 == 3:
+                cells = "".join(f"<td>{word}</td>" for word in paragraph.split()[:6])
+                parts.append(f"<table><tbody><tr>{cells}</tr></tbody></table>")
+            else:
+                parts.append(f"<p>{paragraph}</p>")
+    return "".join(parts)
+
+
+def make_text(pages, seed=0):
+    return "\n\n".join(heading + "\n" + "\n".join(paragraphs) for heading, paragraphs in page_blocks(pages, seed))
+
+
+def input_size(value):
+    """Size of a generated input in bytes, for throughput."""
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(json.dumps(value).encode("utf-8"))
@@ -0,0 +1,132 @@
+"""
+KnowledgeBase retrieval at scale: FTS5/BM25 search against the previous
+icontains scan, on a throwaway SQLite database (never the project's).
+"""
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from .generators import _WORDS
+
+CATEGORIES = ("universal", "project_specific", "onboarding", "troubleshooting", "tools")
+_SYLLABLES = "ba be bi bo bu da de di do du ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu " \
+             "ra re ri ro ru sa se si so su ta te ti to tu va ve vi vo vu za ze zi zo zu".split()
+
+
+class Vocabulary:
+    """Domain words plus pseudo-words drawn with Zipf frequencies, so posting lists look like real text."""
+
+    def __init__(self, rng, size=20000):
+        words = list(_WORDS)
+        seen = set(words)
+        while len(words) < size:
+            word = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        rng.shuffle(words)
+        self.words = words
+        self.cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, size + 1)))
+        self.rng = rng
+
+    def sample(self, count):
+        return self.rng.choices(self.words, cum_weights=self.cum_weights, k=count)
+
+    def text(self, chars):
+        words, size = [], 0
+        while size < chars:
+            chunk = self.sample(40)
+            words.extend(chunk)
+            size += sum(len(w) + 1 for w in chunk)
+        return " ".join(words)
+
+
+def _questions(vocabulary, count):
+    return [" ".join(vocabulary.sample(vocabulary.rng.randint(3, 7))) + "?" for _ in range(count)]
+
+
+def _timed(fn, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "queries": len(timings),
+        "ms_median": round(statistics.median(timings) * 1000, 3),
+        "ms_p95": round(timings[int(len(timings) * 0.95) - 1] * 1000, 3),
+    }
+
+
+def run(articles, queries=50, seed=0, log=print):
+    import django
+
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connections
+    from django.db.models import Q
+
+    from qa_api import kb_search
+    from qa_api.models import KnowledgeBase, Team
+
+    path = os.path.join(tempfile.mkdtemp(prefix="kb-bench-"), "kb.sqlite3")
+    connection = connections["default"]
+    connection.close()
+    connection.settings_dict["NAME"] = path
+    call_command("migrate", verbosity=0)
+
+    rng = random.Random(seed)
+    vocabulary = Vocabulary(rng)
+    teams = [Team.objects.create(name=f"Team {i}", context_info="bench") for i in range(7)]
+    started = time.perf_counter()
+    batch = []
+    for number in range(articles):
+        batch.append(KnowledgeBase(
+            title=" ".join(vocabulary.sample(5)).capitalize(),
+            content=vocabulary.text(rng.randint(400, 2500)),
+            category=rng.choice(CATEGORIES),
+            project_team=rng.choice(teams + [None]),
+            tags=rng.sample(_WORDS, 3),
+            created_by="bench",
+        ))
+        if len(batch) == 2000:
+            KnowledgeBase.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        KnowledgeBase.objects.bulk_create(batch)
+    load_seconds = time.perf_counter() - started
+    log(f"loaded {articles} articles (indexed by triggers) in {load_seconds:.1f}s")
+
+    questions = _questions(vocabulary, queries)
+    team_id = teams[0].id
+
+    def legacy(question):
+        # The substring scan this index replaced (whole question as one needle).
+        lowered = question.lower()
+        list(KnowledgeBase.objects.filter(category="universal").filter(
+            Q(title__icontains=lowered) | Q(content__icontains=lowered))[:5])
+        list(KnowledgeBase.objects.filter(project_team_id=team_id).filter(
+            Q(title__icontains=lowered) | Q(content__icontains=lowered))[:5])
+
+    def ranked(question):
+        kb_search.search(question, category="universal", limit=5, any_term=True)
+        kb_search.search(question, team_id=team_id, limit=5, any_term=True)
+
+    results = {
+        "articles": articles,
+        "load_seconds": round(load_seconds, 2),
+        "db_mb": round(os.path.getsize(path) / 1e6, 1),
+        "fts_bm25": _timed(ranked, questions),
+        "legacy_icontains": _timed(legacy, questions),
+        "fts_hits": sum(bool(kb_search.search(q, category="universal", limit=5, any_term=True)) for q in questions),
+    }
+    started = time.perf_counter()
+    kb_search.rebuild()
+    results["rebuild_seconds"] = round(time.perf_counter() - started, 2)
+    connection.close()
+    os.remove(path)
+    return results
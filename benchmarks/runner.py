@@ -0,0 +1,149 @@
+"""Runs each (stage, pages) measurement in a fresh process and compares result files."""
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = (1, 10, 50, 100, 500)
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _measure(stage_name, pages, repeat):
+    """Body of the child process: generate the input, time `repeat` runs, then one traced run."""
+    import django
+
+    django.setup()
+    from .generators import input_size
+    from .stages import STAGES
+
+    stage = STAGES[stage_name]
+    data = stage.generate(pages)
+    rss_before = _peak_rss_mb()
+
+    stage.run(stage.prepare(data))  # warm-up: imports, caches
+    timings = []
+    for _ in range(repeat):
+        arg = stage.prepare(data)
+        gc.collect()
+        started = time.perf_counter()
+        stage.run(arg)
+        timings.append(time.perf_counter() - started)
+    rss_after = _peak_rss_mb()
+
+    # tracemalloc slows the code down, so allocations come from a separate run.
+    arg = stage.prepare(data)
+    gc.collect()
+    tracemalloc.start()
+    stage.run(arg)
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+    size = input_size(data)
+    return {
+        "stage": stage_name,
+        "pages": pages,
+        "input_bytes": size,
+        "repeat": repeat,
+        "seconds_median": round(median, 6),
+        "seconds_min": round(min(timings), 6),
+        "pages_per_sec": round(pages / median, 2) if median else None,
+        "mb_per_sec": round(size / median / 1e6, 3) if median else None,
+        "peak_rss_mb": rss_after,
+        "stage_rss_mb": round(rss_after - rss_before, 1) if rss_after is not None else None,
+        "alloc_peak_mb": round(alloc_peak / 1e6, 3),
+    }
+
+
+def _child(queue, stage_name, pages, repeat):
+    try:
+        queue.put(_measure(stage_name, pages, repeat))
+    except Exception as e:
+        queue.put({"stage": stage_name, "pages": pages, "error": f"{type(e).__name__}: {e}"})
+
+
+def measure(stage_name, pages, repeat):
+    """One measurement in a fresh spawned process, so peak RSS belongs to this stage alone."""
+    ctx = get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_child, args=(queue, stage_name, pages, repeat))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(stages, sizes, repeat, log=print):
+    results = []
+    for stage_name in stages:
+        for pages in sizes:
+            result = measure(stage_name, pages, repeat)
+            results.append(result)
+            if "error" in result:
+                log(f"{stage_name:18} {pages:5}p  ERROR {result['error']}")
+            else:
+                log(f"{stage_name:18} {pages:5}p  {result['seconds_median'] * 1000:10.2f} ms  "
+                    f"{result['pages_per_sec']:10.1f} p/s  rss {result['peak_rss_mb']} MB  "
+                    f"alloc {result['alloc_peak_mb']} MB")
+    return {
+        "meta": {
+            "commit": _commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold, min_seconds=0.001):
+    """
+    Regressions: stages whose median time grew by more than `threshold` percent.
+    Entries faster than min_seconds in the baseline are too noisy to judge.
+    """
+    base = {(r["stage"], r["pages"]): r for r in baseline["results"] if "error" not in r}
+    regressions, rows = [], []
+    for result in current["results"]:
+        key = (result["stage"], result["pages"])
+        if "error" in result or key not in base:
+            continue
+        before, after = base[key]["seconds_median"], result["seconds_median"]
+        change = (after / before - 1) * 100 if before else 0.0
+        row = {"stage": key[0], "pages": key[1], "baseline": before, "current": after, "change_pct": round(change, 1)}
+        rows.append(row)
+        if before >= min_seconds and change > threshold:
+            regressions.append(row)
+    return rows, regressions
+
+
+def load(path):
+    with open(path) as fh:
+        return json.load(fh)
@@ -0,0 +1,89 @@
+"""The code paths being measured. Each stage builds its input once, then `run` is timed."""
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from . import generators
+
+
+class Stage:
+    name = None
+    description = ""
+
+    def generate(self, pages):
+        raise NotImplementedError
+
+    def prepare(self, data):
+        """Per-run argument built from the generated input (outside the timed region)."""
+        return data
+
+    def run(self, arg):
+        raise NotImplementedError
+
+
+class PDFExtraction(Stage):
+    name = "pdf_extract"
+    description = "qa_api.parsing.extract_text_from_upload on a PDF"
+
+    def generate(self, pages):
+        return generators.make_pdf(pages)
+
+    def prepare(self, data):
+        return SimpleUploadedFile("bench.pdf", data)
+
+    def run(self, upload):
+        from qa_api.parsing import extract_text_from_upload
+        return extract_text_from_upload(upload)
+
+
+class DOCXExtraction(PDFExtraction):
+    name = "docx_extract"
+    description = "qa_api.parsing.extract_text_from_upload on a DOCX"
+
+    def generate(self, pages):
+        return generators.make_docx(pages)
+
+    def prepare(self, data):
+        return SimpleUploadedFile("bench.docx", data)
+
+
+class ConfluenceStorage(Stage):
+    name = "confluence_xhtml"
+    description = "ConfluenceService._extract_from_storage_format on storage-format XHTML"
+
+    def generate(self, pages):
+        return generators.make_xhtml(pages)
+
+    def run(self, content):
+        from confluence.services.confluence_services import ConfluenceService
+        return ConfluenceService()._extract_from_storage_format(content)
+
+
+class JiraADF(Stage):
+    name = "jira_adf"
+    description = "StoryParser._extract_text_from_adf on an ADF description"
+
+    def generate(self, pages):
+        return generators.make_adf(pages)
+
+    def run(self, adf):
+        from jira_xray_app.services.user_story_parser import StoryParser
+        return StoryParser()._extract_text_from_adf(adf)
+
+
+class RequirementText(Stage):
+    name = "requirement_text"
+    description = "qa_api.prompts.build_requirement_text over extracted document text"
+
+    def generate(self, pages):
+        return generators.make_text(pages)
+
+    def run(self, text):
+        from qa_api.prompts import build_requirement_text
+        return build_requirement_text(
+            "As a user I want to reset my password", "Given a registered email...", "Password reset",
+            text, "Generic web application",
+        )
+
+
+STAGES = {stage.name: stage for stage in (
+    PDFExtraction(), DOCXExtraction(), ConfluenceStorage(), JiraADF(), RequirementText(),
+)}
@@ -0,0 +1,62 @@
+"""
+Semantic KB retrieval at scale: top-k latency of qa_api.vector_index over
+synthetic passages, unfiltered and with the assistant's team/category
+filters, in a throwaway index directory.
+"""
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from .kb import CATEGORIES, Vocabulary, _questions, _timed
+
+BATCH = 10_000
+TEAMS = 50
+
+
+def run(rows, queries=50, dim=256, k=10, seed=0, log=print):
+    from qa_api.vector_index import VectorIndex, embed
+
+    rng = random.Random(seed)
+    vocabulary = Vocabulary(rng)
+    path = tempfile.mkdtemp(prefix="kb-vectors-")
+    universal = CATEGORIES.index("universal")
+    try:
+        index = VectorIndex(path, dim)
+        started = time.perf_counter()
+        embed_seconds = 0.0
+        for start in range(0, rows, BATCH):
+            batch = []
+            for key in range(start, min(rows, start + BATCH)):
+                text = vocabulary.text(rng.randint(200, 600))
+                embedding_started = time.perf_counter()
+                vector = embed(text, dim)
+                embed_seconds += time.perf_counter() - embedding_started
+                batch.append((key, vector, rng.randrange(TEAMS), rng.randrange(len(CATEGORIES))))
+            index.upsert_many(batch)
+        load_seconds = time.perf_counter() - started
+        log(f"indexed {rows} passages in {load_seconds:.1f}s")
+
+        questions = _questions(vocabulary, queries)
+        vectors = [index.query_vector(q) for q in questions]
+        searches = {
+            "all": lambda v: index.search(v, k),
+            "team": lambda v: index.search(v, k, team_id=7),
+            "team_with_universal": lambda v: index.search(v, k, team_id=7, include_universal_code=universal),
+            "category": lambda v: index.search(v, k, category=universal),
+        }
+        results = {
+            "rows": rows,
+            "dim": dim,
+            "k": k,
+            "load_seconds": round(load_seconds, 2),
+            "embed_us_per_passage": round(embed_seconds / max(rows, 1) * 1e6, 1),
+            "index_mb": round(sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 2**20, 1),
+            "query_embed": _timed(index.query_vector, questions),
+        }
+        for name, search in searches.items():
+            results[name] = _timed(search, vectors)
+        return results
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'qa_api.middleware.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'qa_api.middleware.LLMDeadlineMiddleware',
 ]
 
 ROOT_URLCONF = 'qa_ai_assistant.urls'
@@ -139,10 +141,133 @@ JIRA_API_TOKEN=os.getenv("JIRA_API_TOKEN")
 JIRA_DOMAIN = os.getenv("JIRA_DOMAIN")  # e.g. your-domain.atlassian.net
 
 #Later when I will switch to AI_PROVIDER = "openai"
-AI_PROVIDER = "openai"  # or "mock" for testing without real LLM calls
+AI_PROVIDER = "openai"  # or "mock" for testing without real LLM calls, or "router" for LLM_ROUTES
 
 # LLM configs
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DEFAULT_LLM_PROVIDER = os.getenv("DEFAULT_LLM_PROVIDER", "openai")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-MAX_CONTEXT_CHARS = int(os.getenv("MAX_CONTEXT_CHARS", "120000"))
+
+# AI_PROVIDER = "mock": simulated upstream behaviour for offline load tests (see ai_core/mock_provider.py)
+MOCK_LLM = {
+    "latency": os.getenv("MOCK_LLM_LATENCY", "fixed"),  # "fixed" or "lognormal"
+    "latency_ms": int(os.getenv("MOCK_LLM_LATENCY_MS", "0")),  # fixed value or lognormal median
+    "sigma": float(os.getenv("MOCK_LLM_SIGMA", "0.5")),
+    "spike_rate": float(os.getenv("MOCK_LLM_SPIKE_RATE", "0")),
+    "spike_ms": int(os.getenv("MOCK_LLM_SPIKE_MS", "5000")),
+    "tokens_per_second": float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "0")),
+    "error_rate": float(os.getenv("MOCK_LLM_ERROR_RATE", "0")),
+    "rate_limit_rate": float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0")),
+}
+
+# AI_PROVIDER = "router": named providers (timeout in seconds) and ordered routing rules.
+# A rule matches on meta["type"] and/or the estimated prompt tokens; its chain is
+# tried in order until one provider succeeds. Unmatched requests use every provider.
+LLM_PROVIDERS = {
+    "small": {"provider": "openai", "model": os.getenv("LLM_SMALL_MODEL", "gpt-4o-mini"), "timeout": 60},
+    "large": {"provider": "openai", "model": os.getenv("LLM_LARGE_MODEL", "gpt-4.1"), "timeout": 180},
+}
+LLM_ROUTES = [
+    {"type": ["assistant", "chunk_summary"], "chain": ["small", "large"]},
+    {"type": "test_plan", "max_tokens": 6000, "chain": ["small", "large"]},
+    {"min_tokens": 20000, "chain": ["large", "small"]},
+    {"chain": ["small", "large"]},
+]
+
+# Prompt token budgeting: a prompt gets min(model context - output reserve, LLM_MAX_PROMPT_TOKENS)
+LLM_MAX_PROMPT_TOKENS = int(os.getenv("LLM_MAX_PROMPT_TOKENS", "30000"))
+LLM_OUTPUT_RESERVE_TOKENS = int(os.getenv("LLM_OUTPUT_RESERVE_TOKENS", "4096"))
+LLM_CONTEXT_TOKENS = {}  # per-model context window overrides, e.g. {"my-finetune": 16385}
+ASSISTANT_KB_TOKENS = int(os.getenv("ASSISTANT_KB_TOKENS", "1500"))  # KB snippets in the assistant prompt
+
+# Per-call token accounting (one LLMCall row per upstream call)
+LLM_USAGE_RECORDING = os.getenv("LLM_USAGE_RECORDING", "true").lower() == "true"
+LLM_USAGE_RECORDER = "qa_api.usage.record_llm_call"
+
+# Adaptive concurrency limit (AIMD) and retries for upstream LLM calls, per provider
+LLM_LIMITER_ENABLED = os.getenv("LLM_LIMITER_ENABLED", "true").lower() == "true"
+LLM_LIMITER = {
+    "initial": int(os.getenv("LLM_LIMITER_INITIAL", "8")),
+    "min_limit": 1,
+    "max_limit": int(os.getenv("LLM_LIMITER_MAX", "64")),
+    "max_queue": int(os.getenv("LLM_LIMITER_MAX_QUEUE", "200")),
+    "max_wait": float(os.getenv("LLM_LIMITER_MAX_WAIT", "30")),  # seconds a call may queue
+}
+LLM_RETRY = {"max_attempts": 4, "base_delay": 0.5, "max_delay": 20.0}
+LLM_REQUEST_DEADLINE = float(os.getenv("LLM_REQUEST_DEADLINE", "120"))  # seconds; X-Request-Timeout may lower it
+
+# LLM response cache (in-process LRU + SQLite file shared by all workers)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_MEMORY_TTL = int(os.getenv("LLM_CACHE_MEMORY_TTL", "3600"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", str(BASE_DIR / "llm_cache.sqlite3"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "20000"))
+
+# Share one upstream call between concurrent identical LLM requests
+LLM_COALESCE_ENABLED = os.getenv("LLM_COALESCE_ENABLED", "true").lower() == "true"
+
+# Batch test case generation fan-out
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+# Document uploads are spooled to disk as they stream in and rejected early past these limits
+FILE_UPLOAD_HANDLERS = ["qa_api.uploads.SpooledUploadHandler"]
+DOCUMENT_UPLOAD_MAX_BYTES = int(os.getenv("DOCUMENT_UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))  # per file
+DOCUMENT_REQUEST_MAX_BYTES = int(os.getenv("DOCUMENT_REQUEST_MAX_BYTES", str(250 * 1024 * 1024)))  # per request
+DOCUMENT_INGEST_MAX_BYTES = int(os.getenv("DOCUMENT_INGEST_MAX_BYTES", str(1024 * 1024 * 1024)))  # per process
+DOCUMENT_TEXT_MAX_CHARS = int(os.getenv("DOCUMENT_TEXT_MAX_CHARS", "4000000"))  # text read for chunked generation
+
+# Parallel document text extraction (process pool; 0 workers = extract inline)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACTION_PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", "16"))
+EXTRACTION_FILE_TIMEOUT = float(os.getenv("EXTRACTION_FILE_TIMEOUT", "60"))  # seconds per uploaded file
+EXTRACTION_WORKER_MEMORY_MB = int(os.getenv("EXTRACTION_WORKER_MEMORY_MB", "1024"))  # address-space cap per worker
+EXTRACTION_MAX_TASKS_PER_CHILD = int(os.getenv("EXTRACTION_MAX_TASKS_PER_CHILD", "100"))
+
+# Extracted PDF/DOCX text cached by content hash (zlib-compressed, least recently used evicted past the cap)
+EXTRACTED_TEXT_CACHE_ENABLED = os.getenv("EXTRACTED_TEXT_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTED_TEXT_CACHE_MAX_BYTES = int(os.getenv("EXTRACTED_TEXT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+EXTRACTED_TEXT_CACHE_COMPRESSION = int(os.getenv("EXTRACTED_TEXT_CACHE_COMPRESSION", "6"))  # zlib level
+
+# Background generation jobs (?async=1), drained by `manage.py run_jobs`
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # seconds between polls when idle
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))  # doubled per failed attempt
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))  # a silent worker loses its job after this
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "900"))  # LLM deadline per attempt, seconds
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "86400"))  # seconds a finished job stays readable
+JOB_PURGE_INTERVAL = float(os.getenv("JOB_PURGE_INTERVAL", "300"))
+
+# Per-request database query count and timings in X-DB-* / Server-Timing response headers
+QUERY_STATS_HEADERS = os.getenv("QUERY_STATS_HEADERS", str(DEBUG)).lower() == "true"
+
+# Offline semantic KB retrieval (hashed TF-IDF vectors in memory-mapped files, qa_api.kb_vectors)
+KB_VECTOR_INDEX_ENABLED = os.getenv("KB_VECTOR_INDEX_ENABLED", "true").lower() == "true"
+KB_VECTOR_DIR = os.getenv("KB_VECTOR_DIR", str(BASE_DIR / "kb_vectors"))
+KB_VECTOR_DIM = int(os.getenv("KB_VECTOR_DIM", "256"))  # changing it needs `manage.py rebuild_kb_index`
+KB_VECTOR_MIN_SCORE = float(os.getenv("KB_VECTOR_MIN_SCORE", "0.1"))  # cosine similarity
+# Articles are split into overlapping passages for assistant context (qa_api.passages)
+KB_PASSAGE_TOKENS = int(os.getenv("KB_PASSAGE_TOKENS", "160"))
+KB_PASSAGE_OVERLAP_TOKENS = int(os.getenv("KB_PASSAGE_OVERLAP_TOKENS", "32"))
+KB_IMPORT_BATCH_SIZE = int(os.getenv("KB_IMPORT_BATCH_SIZE", "500"))  # rows validated and written together
+# Popularity prior (log usage_count) added to the assistant's fused article scores, qa_api.kb_search
+KB_POPULARITY_WEIGHT = float(os.getenv("KB_POPULARITY_WEIGHT", "0.0005"))
+# Well-rated assistant answers re-served for the same or a near-identical question (qa_api.answer_cache)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MIN_RATING = int(os.getenv("ANSWER_CACHE_MIN_RATING", "4"))  # user_feedback, 1-5
+ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.85"))  # cosine, question vectors
+# FAQ answers served from an in-memory token index before any retrieval or LLM call (qa_api.faq)
+FAQ_MATCHING_ENABLED = os.getenv("FAQ_MATCHING_ENABLED", "true").lower() == "true"
+FAQ_MATCH_MIN_SCORE = float(os.getenv("FAQ_MATCH_MIN_SCORE", "0.8"))  # Jaccard similarity of question words
+FAQ_FUZZY_MATCHING = os.getenv("FAQ_FUZZY_MATCHING", "true").lower() == "true"  # tolerate misspelled words
+FAQ_FUZZY_CUTOFF = float(os.getenv("FAQ_FUZZY_CUTOFF", "0.85"))  # difflib ratio to a known word
+# KnowledgeBase.usage_count / FAQ.frequency hits are buffered in memory and written every this many
+# seconds (qa_api.counters); 0 leaves them to explicit flushes and the one at exit
+COUNTER_FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL", "10"))
+
+# Map-reduce generation for documents that do not fit the prompt budget
+CHUNK_CHARS = int(os.getenv("CHUNK_CHARS", "24000"))
+CHUNK_PARALLELISM = int(os.getenv("CHUNK_PARALLELISM", "4"))
+CHUNKED_GENERATION_AUTO = os.getenv("CHUNKED_GENERATION_AUTO", "true").lower() == "true"
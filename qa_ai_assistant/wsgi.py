@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'qa_ai_assistant.settings')
 
 application = get_wsgi_application()
+
+# Serve FAQ answers from memory from the first request on
+from qa_api import faq  # noqa: E402
+
+faq.warm()
@@ -0,0 +1,144 @@
+"""
+Semantic cache of QA assistant answers.
+
+Every answer is logged as a QAQuery with its question's fingerprint (team
+plus sorted, stemmed content words) and the KB articles its prompt drew on
+(`sources`). Once a user rates an answer ANSWER_CACHE_MIN_RATING or better,
+its question is embedded in the "answers" vector index (qa_api.kb_vectors).
+A later question from the same team is answered with it, instead of an LLM
+call, when its fingerprint matches or its embedding is within
+ANSWER_CACHE_MIN_SIMILARITY, and every article retrieved for the new
+question is among the answer's sources (so knowledge added since is never
+skipped).
+
+Saving or deleting a cited article marks the answer stale (qa_api.signals),
+as does a low rating on a copy served from the cache. Served copies are
+logged with `cached_from` set, which is what cache_stats() counts.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+
+from . import kb_vectors
+from .models import QAQuery
+from .vector_index import tokens
+
+ANSWER_CANDIDATES = 5  # nearest cached questions considered per lookup
+
+
+def normalize(question):
+    """Order-insensitive form of a question: its distinct stemmed content words, sorted."""
+    return " ".join(sorted(set(tokens(question))))
+
+
+def fingerprint(question, team_id=None):
+    return hashlib.sha256(f"{team_id or ''}\x00{normalize(question)}".encode("utf-8")).hexdigest()
+
+
+def _cacheable():
+    """Answers that may be served: well rated, current, and not themselves served from the cache."""
+    return QAQuery.objects.filter(
+        user_feedback__gte=settings.ANSWER_CACHE_MIN_RATING,
+        cache_stale=False,
+        cached_from__isnull=True,
+    ).exclude(fingerprint="")
+
+
+def _source_ids(retrieval):
+    return sorted({passage["article_id"] for passage in retrieval.passages})
+
+
+def lookup(question, retrieval):
+    """The cached QAQuery that answers question given what was retrieved for it, or None."""
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    team_id = retrieval.team_id
+    key = fingerprint(question, team_id)
+    similar = dict(kb_vectors.search_answers(
+        question, limit=ANSWER_CANDIDATES, team_id=team_id, min_score=settings.ANSWER_CACHE_MIN_SIMILARITY,
+    ))
+    sources = _source_ids(retrieval)
+    candidates = (
+        _cacheable()
+        .filter(Q(fingerprint=key) | Q(pk__in=list(similar)))
+        .filter(**({"project_team_id": team_id} if team_id else {"project_team__isnull": True}))
+        .only("id", "response", "fingerprint", "user_feedback")
+    )
+    if sources:
+        # still one query: keep candidates whose sources cover every article retrieved now
+        candidates = candidates.annotate(
+            covered=Count("sources", filter=Q(sources__in=sources), distinct=True)
+        ).filter(covered=len(sources))
+    return max(
+        candidates,
+        key=lambda q: (q.fingerprint == key, similar.get(q.pk, 0.0), q.user_feedback, q.pk),
+        default=None,
+    )
+
+
+def record(question, response, retrieval, response_time, cached_from=None):
+    """Log an assistant answer as a QAQuery, with what the cache needs to serve it later."""
+    sources = [] if cached_from else _source_ids(retrieval)
+    with transaction.atomic():
+        query = QAQuery.objects.create(
+            question=question,
+            response=response,
+            project_team_id=retrieval.team_id,
+            response_time=response_time,
+            fingerprint=fingerprint(question, retrieval.team_id),
+            cached_from=cached_from,
+        )
+        QAQuery.sources.through.objects.bulk_create(
+            [QAQuery.sources.through(qaquery_id=query.pk, knowledgebase_id=pk) for pk in sources]
+        )
+    return query
+
+
+def rated(query):
+    """
+    Update the cache for a new rating of query: a good rating on an answer
+    makes it servable; a low one withdraws it, and a low rating on a served
+    copy withdraws the answer it was copied from.
+    """
+    if query.user_feedback >= settings.ANSWER_CACHE_MIN_RATING:
+        if query.fingerprint and query.cached_from_id is None and not query.cache_stale:
+            transaction.on_commit(lambda: kb_vectors.index_answers([query]))
+        return
+    if query.cached_from_id:
+        QAQuery.objects.filter(pk=query.cached_from_id).update(cache_stale=True)
+    stale = [pk for pk in (query.pk, query.cached_from_id) if pk]
+    transaction.on_commit(lambda: kb_vectors.remove_answers(stale))
+
+
+def invalidate_articles(article_ids):
+    """Mark the answers that cited these articles stale; returns their ids."""
+    stale = list(
+        QAQuery.objects.filter(sources__in=article_ids, cache_stale=False).values_list("id", flat=True).distinct()
+    )
+    if stale:
+        QAQuery.objects.filter(pk__in=stale).update(cache_stale=True)
+        transaction.on_commit(lambda: kb_vectors.remove_answers(stale))
+    return stale
+
+
+def rebuild(batch_size=2000):
+    """Re-embed every servable answer; returns the number indexed."""
+    queries = _cacheable().only("id", "question", "project_team_id").iterator(chunk_size=batch_size)
+    return kb_vectors.rebuild_answers(queries, batch_size)
+
+
+def cache_stats(since=None):
+    """Answers served from the cache vs generated, with their mean response times, since a datetime."""
+    queries = QAQuery.objects.all() if since is None else QAQuery.objects.filter(created_at__gte=since)
+    stats = queries.aggregate(
+        total=Count("id"),
+        hits=Count("id", filter=Q(cached_from__isnull=False)),
+        hit_response_time=Avg("response_time", filter=Q(cached_from__isnull=False)),
+        miss_response_time=Avg("response_time", filter=Q(cached_from__isnull=True)),
+    )
+    stats["hit_rate"] = round(stats["hits"] / stats["total"], 4) if stats["total"] else 0.0
+    for field in ("hit_response_time", "miss_response_time"):
+        stats[field] = round(stats[field], 3) if stats[field] is not None else None
+    return stats
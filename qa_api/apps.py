@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class QaApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'qa_api'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (registers the KnowledgeBase index and FAQ receivers)
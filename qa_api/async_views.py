@@ -0,0 +1,224 @@
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+
+from . import answer_cache
+from .serializers import QAQueryCreateSerializer
+from .chunking import ChunkedJob
+from .jobs import accepted, enqueue_generation, wants_job
+from .retrieval import related_docs_version
+from .streaming import wants_stream, sse_event, sse_response, aartifact_stream
+from .views import (
+    GenerateTestCasesFromPrompt,
+    GenerateTestCasesFromDocument,
+    GenerateTestPlanFromPrompt,
+    GenerateTestPlanFromDocument,
+    GenerateTestPlanFromConfluenceUrl,
+    QAAssistantMixin,
+    _dry_run,
+    _nocache,
+    _overloaded,
+)
+from ai_core.factory import get_provider
+from ai_core.limiter import LLMOverloaded
+
+
+def _request_data(request):
+    """Request payload: JSON body, or form fields plus uploaded files merged the way DRF's request.data does."""
+    if request.content_type == "application/json":
+        return json.loads(request.body or b"{}")
+    data = request.POST.copy()
+    data.update(request.FILES)
+    return data
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+class AsyncAPIView(View):
+    """
+    Native async Django view. DRF's APIView dispatch is synchronous, so these
+    views parse and validate with the same serializers but never hold a worker
+    thread while waiting on the LLM.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # API clients do not carry a CSRF token, same as DRF's APIView.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+
+class AsyncGenerationView(AsyncAPIView):
+    """Async twin of a GenerationAPIView; prompt building is reused from sync_view."""
+    sync_view = None
+
+    async def post(self, request):
+        try:
+            data = _request_data(request)
+        except ValueError:
+            return JsonResponse({"detail": "Malformed JSON body."}, status=400)
+        except APIException as e:
+            # upload limits enforced by SpooledUploadHandler while the body is parsed
+            return JsonResponse({"detail": e.detail}, status=e.status_code)
+
+        view = self.sync_view()
+        s = view.serializer_class(data=data)
+        if not s.is_valid():
+            return JsonResponse(s.errors, status=400)
+
+        try:
+            prompt, meta = await sync_to_async(view.build_prompt)(s.validated_data)
+        except ValueError as ve:
+            return JsonResponse({"detail": str(ve)}, status=400)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=502)
+        if _dry_run(request.GET):
+            return JsonResponse(view.dry_run_report(prompt, meta))
+        meta["nocache"] = _nocache(request.GET)
+        if wants_job(request.GET):
+            job = await sync_to_async(enqueue_generation)(request.path, prompt, meta)
+            return JsonResponse(accepted(request, job), status=202)
+
+        provider = get_provider()
+        if isinstance(prompt, ChunkedJob):
+            try:
+                return JsonResponse(await prompt.arun(provider, meta))
+            except LLMOverloaded as e:
+                return _overloaded(e, JsonResponse)
+            except Exception as e:
+                return JsonResponse({"error": str(e)}, status=502)
+        if wants_stream(request.GET):
+            return sse_response(aartifact_stream(provider.astream_generate(prompt, meta=meta), meta.get("type")))
+        try:
+            result = await provider.agenerate(prompt, meta=meta)
+            return JsonResponse(result)
+        except LLMOverloaded as e:
+            return _overloaded(e, JsonResponse)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=502)
+
+
+class AsyncGenerateTestCasesFromPrompt(AsyncGenerationView):
+    sync_view = GenerateTestCasesFromPrompt
+
+
+class AsyncGenerateTestCasesFromDocument(AsyncGenerationView):
+    sync_view = GenerateTestCasesFromDocument
+
+
+class AsyncGenerateTestPlanFromPrompt(AsyncGenerationView):
+    sync_view = GenerateTestPlanFromPrompt
+
+
+class AsyncGenerateTestPlanFromDocument(AsyncGenerationView):
+    sync_view = GenerateTestPlanFromDocument
+
+
+class AsyncGenerateTestPlanFromConfluenceUrl(AsyncGenerationView):
+    sync_view = GenerateTestPlanFromConfluenceUrl
+
+
+class AsyncQAAssistantView(QAAssistantMixin, AsyncAPIView):
+    """Async twin of QAAssistantAPIView"""
+
+    async def post(self, request):
+        try:
+            data = _request_data(request)
+        except ValueError:
+            return JsonResponse({"detail": "Malformed JSON body."}, status=400)
+        except APIException as e:
+            # upload limits enforced by SpooledUploadHandler while the body is parsed
+            return JsonResponse({"detail": e.detail}, status=e.status_code)
+
+        serializer = QAQueryCreateSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        start_time = time.time()
+        question = serializer.validated_data['question']
+        project_team_id = serializer.validated_data.get('project_team_id')
+
+        try:
+            entry = await sync_to_async(self._faq_answer)(question, project_team_id, nocache=_nocache(request.GET))
+            if entry:
+                payload = self._faq_response(question, entry, start_time)
+                if wants_stream(request.GET):
+                    return sse_response(_aiter(self._faq_events(payload)))
+                return JsonResponse(payload)
+
+            retrieval = await sync_to_async(self._retrieve)(
+                question, project_team_id, related_docs_version(request.GET)
+            )
+            cached = await sync_to_async(self._cached_answer)(question, retrieval, nocache=_nocache(request.GET))
+            system_prompt = self._build_system_prompt(question, retrieval)
+
+            provider = get_provider()
+            if wants_stream(request.GET):
+                return sse_response(self._astream_ai_response(
+                    question, retrieval, cached, system_prompt, start_time, nocache=_nocache(request.GET)
+                ))
+
+            if cached:
+                ai_response = cached.response
+            else:
+                ai_response = await provider.achat_completion(
+                    system_prompt, question, temperature=0.3,
+                    meta={"type": "assistant", "nocache": _nocache(request.GET)}
+                )
+
+            followups = self._get_suggested_followups(question, retrieval)
+            related_docs = retrieval.related_docs()
+
+            query_obj = await sync_to_async(answer_cache.record)(
+                question, ai_response, retrieval, time.time() - start_time, cached_from=cached
+            )
+
+            return JsonResponse({
+                'query_id': query_obj.id,
+                'response': ai_response,
+                'suggested_followups': followups,
+                'related_docs': related_docs,
+                'response_time': query_obj.response_time,
+                'cached': cached is not None
+            })
+
+        except LLMOverloaded as e:
+            return _overloaded(e, JsonResponse)
+        except Exception as e:
+            return JsonResponse({'error': f'Failed to generate response: {str(e)}'}, status=500)
+
+    async def _astream_ai_response(self, question, retrieval, cached, system_prompt, start_time, nocache=False):
+        yield sse_event("related_docs", retrieval.related_docs())
+
+        parts = []
+        if cached:
+            parts.append(cached.response)
+            yield sse_event("token", {"text": cached.response})
+        else:
+            provider = get_provider()
+            try:
+                async for delta in provider.astream_chat_completion(
+                    system_prompt, question, temperature=0.3, meta={"type": "assistant", "nocache": nocache}
+                ):
+                    parts.append(delta)
+                    yield sse_event("token", {"text": delta})
+            except Exception as e:
+                yield sse_event("error", {"error": f"Failed to generate response: {str(e)}"})
+                return
+
+        query_obj = await sync_to_async(answer_cache.record)(
+            question, "".join(parts), retrieval, time.time() - start_time, cached_from=cached
+        )
+        yield sse_event("done", {
+            "query_id": query_obj.id,
+            "suggested_followups": self._get_suggested_followups(question, retrieval),
+            "response_time": query_obj.response_time,
+            "cached": cached is not None
+        })
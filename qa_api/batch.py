@@ -0,0 +1,135 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.db import close_old_connections
+
+from .models import Team
+from .prompts import budget_requirement_text, test_case_prompt
+
+DEFAULT_APP_CONTEXT = "Generic web/mobile application for feature-level QA."
+
+
+def team_contexts(team_ids):
+    """context_info for every team in one query, same fallback as _assemble_context."""
+    ids = {team_id for team_id in team_ids if team_id}
+    return {
+        team_id: context_info or "Generic QA context"
+        for team_id, context_info in Team.objects.filter(id__in=ids).values_list("id", "context_info")
+    }
+
+
+def fetch_stories(story_keys):
+    """
+    Parsed Jira stories by key, fetched with a single search call.
+    Jira rejects the whole search when any key does not exist, so on failure
+    each key is fetched on its own and only the bad ones fail.
+    Returns (stories, errors), both keyed by story key.
+    """
+    if not story_keys:
+        return {}, {}
+    from jira_xray_app.services.jira_service import JiraService
+    from jira_xray_app.services.user_story_parser import StoryParser
+
+    parser, jira = StoryParser(), JiraService()
+    try:
+        issues = jira.get_stories_by_keys(sorted(story_keys))
+        return {issue.get("key", ""): parser.parse_issue(issue) for issue in issues}, {}
+    except Exception as e:
+        if len(story_keys) == 1:
+            return {}, {key: str(e) for key in story_keys}
+
+    stories, errors = {}, {}
+    for key in sorted(story_keys):
+        try:
+            stories[key] = parser.parse_issue(jira.get_story_by_key(key))
+        except Exception as e:
+            errors[key] = str(e)
+    return stories, errors
+
+
+def build_batch_prompts(items, default_team_id=None, default_max_cases=8):
+    """
+    Resolve team context once per team and Jira stories in one call, then
+    build a test case prompt per item, fitted to the prompt token budget
+    like the single-item endpoints. A story that cannot be fetched fails
+    only its own item.
+    Returns a list of (index, key, prompt, error) tuples.
+    """
+    contexts = team_contexts([item.get("team_id") or default_team_id for item in items])
+    story_keys = {item["story_key"].strip() for item in items if item.get("story_key", "").strip()}
+    stories, story_errors = fetch_stories(story_keys)
+
+    prompts = []
+    for index, item in enumerate(items):
+        key = item.get("story_key", "").strip() or None
+        team_id = item.get("team_id") or default_team_id
+        app_context = contexts.get(team_id) or item.get("app_context", "") or DEFAULT_APP_CONTEXT
+
+        user_story = item.get("user_story", "")
+        ac = item.get("acceptance_criteria", "")
+        feature_description = item.get("feature_description", "")
+        if key:
+            story = stories.get(key)
+            if story is None:
+                prompts.append((index, key, None, story_errors.get(key) or f"User story {key} not found"))
+                continue
+            user_story = user_story or story.get("summary", "")
+            ac = ac or story.get("acceptance_criteria", "")
+            feature_description = feature_description or story.get("description", "")
+
+        max_cases = item.get("max_cases") or default_max_cases
+        requirement_text, _ = budget_requirement_text(
+            user_story, ac, feature_description, "", app_context,
+            overhead_text=test_case_prompt(app_context, "", max_cases),
+            meta={"type": "test_cases", "source": "batch"},
+        )
+        prompt = test_case_prompt(app_context, requirement_text, max_cases)
+        prompts.append((index, key, prompt, None))
+    return prompts
+
+
+def _generate(provider, prompt, meta):
+    try:
+        return provider.generate(prompt, meta=dict(meta))
+    finally:
+        close_old_connections()
+
+
+def run_batch(provider, prompts, concurrency, meta):
+    """
+    Fan prompts out to the provider on at most `concurrency` threads.
+    Yields one result dict per item in completion order.
+    """
+    for index, key, prompt, error in prompts:
+        if error:
+            yield {"index": index, "story_key": key, "status": "error", "error": error}
+
+    pending = [(index, key, prompt) for index, key, prompt, error in prompts if not error]
+    if not pending:
+        return
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(pending)))
+    try:
+        futures = {
+            executor.submit(contextvars.copy_context().run, _generate, provider, prompt, meta): (index, key)
+            for index, key, prompt in pending
+        }
+        for future in as_completed(futures):
+            index, key = futures[future]
+            try:
+                yield {"index": index, "story_key": key, "status": "ok", "result": future.result()}
+            except Exception as e:
+                yield {"index": index, "story_key": key, "status": "error", "error": str(e)}
+    finally:
+        # Stop queued items if the client goes away mid-stream.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def batch_summary(results):
+    """Aggregate response for a finished batch: results in input order plus counts."""
+    items = sorted(results, key=lambda item: item["index"])
+    failed = sum(1 for item in items if item["status"] == "error")
+    return {
+        "results": items,
+        "succeeded": len(items) - failed,
+        "failed": failed,
+    }
@@ -0,0 +1,242 @@
+import asyncio
+import contextvars
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from ai_core.base import result_text, wrap_result
+from ai_core.json_stream import loads_output
+from ai_core.limiter import LLMOverloaded
+from .prompts import (
+    build_requirement_text, budget_requirement_text, chunk_summary_prompt, test_case_prompt, test_plan_prompt
+)
+
+# Lines that open a new section: "3.2 Login", "3.2) Login", "# Login", "LOGIN AND SESSIONS"
+_HEADING = re.compile(
+    r"^\s*(?:#{1,6}\s+\S"
+    r"|\d+(?:\.\d+)*[.)]?\s+[A-Z]\S*"
+    r"|[A-Z][A-Z0-9 &/,\-]{2,79}$)"
+)
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def split_sections(text):
+    """Split document text into sections, each starting at a heading line."""
+    sections, current = [], []
+    for line in text.splitlines():
+        if current and len(line) < 120 and _HEADING.match(line):
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if current:
+        sections.append("\n".join(current).strip())
+    return [section for section in sections if section]
+
+
+def _split_oversized(section, max_chars):
+    """Break a section longer than max_chars at paragraph, then line, then hard boundaries."""
+    if len(section) <= max_chars:
+        return [section]
+    for separator in ("\n\n", "\n"):
+        parts = section.split(separator)
+        if len(parts) > 1:
+            pieces, current = [], ""
+            for part in parts:
+                candidate = f"{current}{separator}{part}" if current else part
+                if len(candidate) <= max_chars:
+                    current = candidate
+                    continue
+                if current:
+                    pieces.append(current)
+                current = part
+            if current:
+                pieces.append(current)
+            return [p for piece in pieces for p in _split_oversized(piece, max_chars)]
+    return [section[i:i + max_chars] for i in range(0, len(section), max_chars)]
+
+
+def chunk_document(text, max_chars=None):
+    """Pack consecutive sections into chunks of at most max_chars characters."""
+    max_chars = max_chars or settings.CHUNK_CHARS
+    chunks, current = [], ""
+    for section in split_sections(text):
+        for piece in _split_oversized(section, max_chars):
+            if current and len(current) + len(piece) + 2 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _dedupe_key(test_case):
+    return " ".join(_WORD.findall(str(test_case.get("title", "")).lower()))
+
+
+def _similar(a, b):
+    """Token Jaccard similarity of two dedupe keys."""
+    ta, tb = set(a.split()), set(b.split())
+    if not ta or not tb:
+        return False
+    return len(ta & tb) / len(ta | tb) >= 0.8
+
+
+def merge_test_cases(outputs):
+    """Merge per-chunk test case outputs, dropping near-duplicate titles and renumbering ids."""
+    merged, keys = [], []
+    for output in outputs:
+        try:
+            cases = loads_output(output).get("test_cases", [])
+        except (ValueError, AttributeError):
+            continue
+        for case in cases:
+            if not isinstance(case, dict):
+                continue
+            key = _dedupe_key(case)
+            if key and any(key == k or _similar(key, k) for k in keys):
+                continue
+            keys.append(key)
+            merged.append(case)
+    for number, case in enumerate(merged, start=1):
+        case["id"] = f"TC-{number:03d}"
+    return merged
+
+
+class ChunkedJob:
+    """
+    Map-reduce generation over a document too large for one prompt.
+    Chunk prompts run in parallel; merge() or one more provider call on
+    reduce_prompt() turns their outputs into a generate()-shaped result.
+    """
+    map_type = None
+
+    def __init__(self, app_context, chunks, max_cases=8):
+        self.app_context = app_context
+        self.chunks = chunks
+        self.max_cases = max_cases
+
+    def map_prompts(self):
+        raise NotImplementedError
+
+    def reduce_prompt(self, outputs):
+        """Prompt for a final provider call, or None if merge() finishes the job."""
+        return None
+
+    def merge(self, outputs):
+        raise NotImplementedError
+
+    def _finish(self, result, failed):
+        result = dict(result)
+        result["chunks"] = len(self.chunks)
+        if failed:
+            result["failed_chunks"] = failed
+        return result
+
+    def _all_failed(self, errors):
+        """Error to raise when no chunk succeeded; overload wins so the view can answer 503."""
+        overloaded = [e for e in errors if isinstance(e, LLMOverloaded)]
+        if overloaded:
+            return overloaded[-1]
+        return RuntimeError("Every chunk of the document failed to generate.")
+
+    def _map_meta(self, meta):
+        return dict(meta, type=self.map_type, chunked=True)
+
+    def run(self, provider, meta, parallelism=None):
+        parallelism = parallelism or settings.CHUNK_PARALLELISM
+        map_meta = self._map_meta(meta)
+        errors = []
+
+        def call(prompt):
+            try:
+                return result_text(provider.generate(prompt, meta=map_meta), self.map_type)
+            except Exception as e:
+                errors.append(e)
+                return None
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=min(parallelism, len(self.chunks))) as executor:
+            # Each task runs in a copy of the request context so the LLM deadline applies to it.
+            futures = [executor.submit(contextvars.copy_context().run, call, p) for p in self.map_prompts()]
+            outputs = [future.result() for future in futures]
+        ok = [output for output in outputs if output is not None]
+        if not ok:
+            raise self._all_failed(errors)
+
+        prompt = self.reduce_prompt(ok)
+        result = provider.generate(prompt, meta=meta) if prompt else self.merge(ok)
+        return self._finish(result, len(outputs) - len(ok))
+
+    async def arun(self, provider, meta, parallelism=None):
+        semaphore = asyncio.Semaphore(parallelism or settings.CHUNK_PARALLELISM)
+        map_meta = self._map_meta(meta)
+        errors = []
+
+        async def call(prompt):
+            async with semaphore:
+                try:
+                    return result_text(await provider.agenerate(prompt, meta=map_meta), self.map_type)
+                except Exception as e:
+                    errors.append(e)
+                    return None
+
+        outputs = await asyncio.gather(*(call(prompt) for prompt in self.map_prompts()))
+        ok = [output for output in outputs if output is not None]
+        if not ok:
+            raise self._all_failed(errors)
+
+        prompt = self.reduce_prompt(ok)
+        result = await provider.agenerate(prompt, meta=meta) if prompt else self.merge(ok)
+        return self._finish(result, len(outputs) - len(ok))
+
+
+class ChunkedTestCases(ChunkedJob):
+    """Test cases per chunk, merged and de-duplicated locally; max_cases applies per chunk."""
+    map_type = "test_cases"
+
+    def map_prompts(self):
+        return [
+            test_case_prompt(
+                self.app_context,
+                build_requirement_text("", "", "", chunk, self.app_context),
+                self.max_cases,
+            )
+            for chunk in self.chunks
+        ]
+
+    def merge(self, outputs):
+        return wrap_result("test_cases", json.dumps({"test_cases": merge_test_cases(outputs)}))
+
+
+class ChunkedTestPlan(ChunkedJob):
+    """Per-chunk requirement summaries combined into one test plan prompt."""
+    map_type = "chunk_summary"
+
+    def map_prompts(self):
+        total = len(self.chunks)
+        return [
+            chunk_summary_prompt(self.app_context, chunk, index, total)
+            for index, chunk in enumerate(self.chunks, start=1)
+        ]
+
+    def reduce_prompt(self, outputs):
+        summaries = "\n\n".join(
+            f"Part {index} summary:\n{output.strip()}" for index, output in enumerate(outputs, start=1)
+        )
+        requirement_text, _ = budget_requirement_text(
+            "", "", "", summaries, self.app_context,
+            overhead_text=test_plan_prompt(self.app_context, ""), meta={"type": "test_plan"}
+        )
+        return test_plan_prompt(self.app_context, requirement_text)
+
+
+def wants_chunking(validated, budget):
+    """Chunk when asked to, or automatically when the document would be trimmed to fit the budget."""
+    if validated.get("chunked"):
+        return True
+    return settings.CHUNKED_GENERATION_AUTO and budget.trimmed("doc_text")
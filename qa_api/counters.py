@@ -0,0 +1,136 @@
+"""
+Write-behind counters for hot-path tallies.
+
+KnowledgeBase.usage_count (articles retrieved for the assistant) and
+FAQ.frequency (questions answered from an FAQ) are counted in process
+memory, never with a write per request. Every COUNTER_FLUSH_INTERVAL seconds
+a daemon thread calls flush(), which writes every counter's pending hits in
+one transaction, one `UPDATE ... SET field = field + n WHERE id IN (...)`
+per distinct increment. Pending hits are also flushed at interpreter exit,
+and put back for the next flush if a write fails.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+
+from .models import FAQ, KnowledgeBase
+
+logger = logging.getLogger(__name__)
+
+_counters = []
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+class WriteBehindCounter:
+    """Pending increments of one integer field, keyed by primary key."""
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self._pending = Counter()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<WriteBehindCounter {self.model.__name__}.{self.field}>"
+
+    def add(self, pk, count=1):
+        self.add_many([pk], count)
+
+    def add_many(self, pks, count=1):
+        with self._lock:
+            for pk in pks:
+                self._pending[pk] += count
+        _ensure_flusher()
+
+    def pending(self, pk):
+        """Hits counted in this process but not written yet."""
+        return self._pending.get(pk, 0)
+
+    def take(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        return pending
+
+    def restore(self, pending):
+        with self._lock:
+            self._pending.update(pending)
+
+    def write(self, pending):
+        by_increment = defaultdict(list)
+        for pk, count in pending.items():
+            by_increment[count].append(pk)
+        for count, pks in by_increment.items():
+            self.model.objects.filter(pk__in=pks).update(**{self.field: F(self.field) + count})
+
+
+def register(model, field):
+    counter = WriteBehindCounter(model, field)
+    _counters.append(counter)
+    return counter
+
+
+def flush():
+    """Write every counter's pending hits in one transaction; returns the number of hits written."""
+    taken = [(counter, counter.take()) for counter in _counters]
+    taken = [(counter, pending) for counter, pending in taken if pending]
+    if not taken:
+        return 0
+    try:
+        with transaction.atomic():
+            for counter, pending in taken:
+                counter.write(pending)
+    except DatabaseError as e:
+        logger.warning("Flushing usage counters failed, keeping them for the next flush: %s", e)
+        for counter, pending in taken:
+            counter.restore(pending)
+        return 0
+    return sum(sum(pending.values()) for _, pending in taken)
+
+
+def discard():
+    """Drop every pending hit without writing it (tests)."""
+    for counter in _counters:
+        counter.take()
+
+
+class _Flusher(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(daemon=True, name="usage-counter-flusher")
+        self.interval = interval
+        self.pid = os.getpid()
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                flush()
+                connection.close()  # this thread's own connection, reopened on the next flush
+        finally:
+            connection.close()
+
+
+def _ensure_flusher():
+    """Start this process's flush thread on first use (after any fork); COUNTER_FLUSH_INTERVAL <= 0 disables it."""
+    global _flusher
+    if _flusher is not None and _flusher.pid == os.getpid():
+        return
+    interval = settings.COUNTER_FLUSH_INTERVAL
+    if interval <= 0:
+        return
+    with _flusher_lock:
+        if _flusher is None or _flusher.pid != os.getpid():
+            _flusher = _Flusher(interval)
+            _flusher.start()
+
+
+atexit.register(flush)
+
+kb_usage = register(KnowledgeBase, "usage_count")
+faq_frequency = register(FAQ, "frequency")
@@ -0,0 +1,322 @@
+import atexit
+import logging
+import math
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+
+from .parsing import count_pdf_pages, extract_docx, extract_pdf_pages, iter_text
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# ---- worker side (no Django settings available here) ---------------------
+
+def _init_worker(memory_limit_bytes):
+    if memory_limit_bytes and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+
+
+def _on_alarm(signum, frame):
+    raise TimeoutError("extraction task timed out")
+
+
+def _run_task(kind, path, start, end, timeout):
+    """Extract one task in a worker process. Returns (text, error)."""
+    if timeout and hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.alarm(max(1, math.ceil(timeout)))
+    try:
+        if kind == "pdf":
+            return extract_pdf_pages(path, start, end), None
+        return extract_docx(path), None
+    except TimeoutError:
+        return "", "timed out"
+    except MemoryError:
+        return "", "exceeded worker memory limit"
+    except Exception as e:
+        return "", str(e)
+    finally:
+        if timeout and hasattr(signal, "SIGALRM"):
+            signal.alarm(0)
+
+
+# ---- request side ---------------------------------------------------------
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            memory_mb = settings.EXTRACTION_WORKER_MEMORY_MB
+            # spawn: workers must not inherit the server's threads and DB connections.
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.EXTRACTION_WORKERS,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(memory_mb * 1024 * 1024 if memory_mb else 0,),
+                max_tasks_per_child=settings.EXTRACTION_MAX_TASKS_PER_CHILD or None,
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    """Drop a pool whose worker died (e.g. killed by the OOM killer) so the next call starts fresh."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_file(kind, path, ranges, timeout):
+    """(pool, futures) for one file's tasks, replacing the pool once if it is already broken."""
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            return pool, [pool.submit(_run_task, kind, path, start, end, timeout) for start, end in ranges]
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            if attempt:
+                raise
+
+
+@atexit.register
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _kind(upload):
+    name = (upload.name or "").lower()
+    if name.endswith(".pdf"):
+        return "pdf"
+    if name.endswith(".docx"):
+        return "docx"
+    return None
+
+
+def _materialize(upload):
+    """A filesystem path workers can open, and whether it is ours to delete."""
+    if hasattr(upload, "temporary_file_path"):
+        return upload.temporary_file_path(), False
+    suffix = os.path.splitext(upload.name or "")[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        upload.seek(0)
+        shutil.copyfileobj(upload, tmp)
+    return tmp.name, True
+
+
+def _page_ranges(path, workers):
+    """[start, end) ranges for one PDF; the whole file if its page tree cannot be read here."""
+    try:
+        pages = count_pdf_pages(path)
+    except Exception:
+        return [(0, None)]
+    size = max(1, min(settings.EXTRACTION_PAGES_PER_TASK, math.ceil(pages / workers)))
+    return [(start, min(start + size, pages)) for start in range(0, pages, size)] or [(0, None)]
+
+
+class _Planned:
+    """
+    One upload and, for PDF/DOCX, its extracted-text cache key plus either
+    the cached text or the pool futures extracting it.
+    """
+
+    def __init__(self, upload, kind, key=None, cached=None, futures=None, pool=None, deadline=None):
+        self.upload = upload
+        self.kind = kind
+        self.key = key
+        self.cached = cached
+        self.futures = futures or []
+        self.pool = pool
+        self.deadline = deadline
+
+
+def _plan(files, temp_paths):
+    """
+    Look every PDF/DOCX up in the extracted-text cache and submit the misses
+    to the pool up front, so later files extract while earlier ones are read.
+    """
+    # Imported here: pool workers import this module without Django set up.
+    from .textcache import cache_key, get_text
+
+    planned = []
+    timeout = settings.EXTRACTION_FILE_TIMEOUT
+    for upload in files:
+        kind = _kind(upload)
+        if kind is None:
+            planned.append(_Planned(upload, kind))
+            continue
+        key = cache_key(upload)
+        cached = get_text(key)
+        if cached is not None or not settings.EXTRACTION_WORKERS:
+            planned.append(_Planned(upload, kind, key, cached))
+            continue
+        path, owned = _materialize(upload)
+        if owned:
+            temp_paths.append(path)
+        ranges = _page_ranges(path, settings.EXTRACTION_WORKERS) if kind == "pdf" else [(0, None)]
+        pool, futures = _submit_file(kind, path, ranges, timeout)
+        planned.append(_Planned(upload, kind, key, futures=futures, pool=pool,
+                                deadline=time.monotonic() + timeout))
+    return planned
+
+
+def _safe_text(upload):
+    try:
+        yield from iter_text(upload)
+    except Exception as e:
+        logger.warning("Reading %s failed: %s", upload.name, e)
+
+
+def _extract_here(item):
+    """Extract a PDF/DOCX in this process (EXTRACTION_WORKERS = 0) and cache the result."""
+    from .textcache import put_text
+
+    try:
+        item.upload.seek(0)
+        text = extract_pdf_pages(item.upload) if item.kind == "pdf" else extract_docx(item.upload)
+    except Exception as e:
+        logger.warning("Extraction of %s failed: %s", item.upload.name, e)
+        return ""
+    put_text(item.key, text)
+    return text
+
+
+def _store_finished(item):
+    """Cache a pool-extracted file if every one of its tasks has already succeeded."""
+    from .textcache import put_text
+
+    if item.key is None or not item.futures:
+        return
+    texts = []
+    for future in item.futures:
+        if not future.done() or future.cancelled() or future.exception() is not None:
+            return
+        text, error = future.result()
+        if error:
+            return
+        texts.append(text)
+    put_text(item.key, "\n\n".join(text for text in texts if text.strip()))
+
+
+def _segments(item):
+    """
+    Iterables of text pieces for one upload, in page order; the caller
+    separates segments with a blank line. A failing file stops contributing.
+    """
+    if item.kind is None:
+        yield _safe_text(item.upload)
+        return
+    if item.cached is not None:
+        yield (item.cached,)
+        return
+    if not item.futures:
+        yield (_extract_here(item),)
+        return
+    try:
+        for future in item.futures:
+            text, error = future.result(timeout=max(0.0, item.deadline - time.monotonic()))
+            if error:
+                raise RuntimeError(error)
+            yield (text,)
+    except FutureTimeout:
+        logger.warning("Extraction of %s timed out after %ss", item.upload.name, settings.EXTRACTION_FILE_TIMEOUT)
+    except BrokenProcessPool:
+        logger.warning("Extraction worker died while reading %s", item.upload.name)
+        _discard_pool(item.pool)
+    except RuntimeError as e:
+        logger.warning("Extraction of %s failed: %s", item.upload.name, e)
+
+
+def iter_document_text(files):
+    """
+    Yield the uploads' text in upload and page order as it becomes available.
+
+    PDFs are split into page ranges and every file becomes one or more tasks on
+    a shared process pool, so large uploads are extracted across all cores.
+    Workers run under an address-space cap, and a file that does not finish
+    within EXTRACTION_FILE_TIMEOUT stops contributing text. Text files are
+    decoded in chunks. PDF/DOCX text is cached by content hash (see
+    qa_api.textcache), so a re-uploaded file is not parsed again. Closing the
+    generator early cancels pending work; files whose tasks had all finished
+    are still cached.
+    """
+    temp_paths = []
+    planned = []
+    try:
+        planned = _plan(files, temp_paths)
+        first = True
+        for item in planned:
+            for segment in _segments(item):
+                started = False
+                for piece in segment:
+                    if not piece or (not started and not piece.strip()):
+                        continue
+                    if not started:
+                        if not first:
+                            yield "\n\n"
+                        first, started = False, True
+                    yield piece
+    finally:
+        for item in planned:
+            _store_finished(item)
+            for future in item.futures:
+                future.cancel()
+        for path in temp_paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+class TextReader:
+    """Reads a stream of text pieces up to a character limit at a time, keeping the rest for later."""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.pending = ""
+        self.exhausted = False
+
+    def _next(self):
+        if self.pending:
+            piece, self.pending = self.pending, ""
+            return piece
+        piece = next(self.pieces, None)
+        if piece is None:
+            self.exhausted = True
+        return piece
+
+    def read(self, max_chars):
+        parts, size = [], 0
+        while size < max_chars:
+            piece = self._next()
+            if piece is None:
+                break
+            take = piece[:max_chars - size]
+            parts.append(take)
+            size += len(take)
+            self.pending = piece[len(take):]
+        if not self.pending and not self.exhausted:
+            # Look ahead so callers can tell "exactly max_chars" from "more to come".
+            self.pending = self._next() or ""
+        return "".join(parts)
+
+    def close(self):
+        self.pieces.close()
@@ -0,0 +1,248 @@
+"""
+In-memory FAQ matcher for the QA assistant.
+
+Each process keeps the FAQ table as an inverted index from normalized token
+(qa_api.vector_index.tokens: lowercased, stemmed, stopwords dropped) to FAQ
+ids, one per team plus one (team None) for FAQs every team shares. match()
+scores the FAQs that share a token with the question by the Jaccard
+similarity of their token sets. At FAQ_MATCH_MIN_SCORE or above, the FAQ
+answer is returned without retrieval or an LLM call. With
+FAQ_FUZZY_MATCHING, question words the index has never seen are first
+replaced by the closest known word, which catches typos.
+
+The index is built at startup (warm(), called from the WSGI/ASGI entry
+points) or on first use. Saving or deleting an FAQ touches a stamp file
+next to the vector indexes (qa_api.signals). Every process checks the stamp
+before matching and rebuilds its index when it has changed. Hits bump
+FAQ.frequency through the write-behind counters in qa_api.counters.
+
+candidates() finds frequently asked questions in QAQuery that no FAQ
+answers yet, for promotion into FAQs.
+"""
+import difflib
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count, F, Max, Sum
+
+from . import counters
+from .models import FAQ, QAQuery
+from .vector_index import tokens
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_GROUPS = 500  # most-asked fingerprint groups considered by candidates()
+
+
+def _jaccard(shared, first, second):
+    return shared / (first + second - shared)
+
+
+class FAQIndex:
+    """Inverted index over FAQ rows [(id, question, answer, category, project_team_id)]."""
+
+    def __init__(self, rows):
+        self.entries = {}  # id -> (token set, entry dict)
+        self.postings = {}  # team id or None -> {token: [FAQ ids]}
+        self.vocabulary = defaultdict(set)  # first letter -> known tokens, for fuzzy matching
+        for pk, question, answer, category, team_id in rows:
+            words = frozenset(tokens(question))
+            if not words:
+                continue
+            self.entries[pk] = (words, {
+                "id": pk, "question": question, "answer": answer, "category": category, "project_team": team_id,
+            })
+            postings = self.postings.setdefault(team_id, {})
+            for word in words:
+                postings.setdefault(word, []).append(pk)
+                self.vocabulary[word[0]].add(word)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _correct(self, word, cutoff):
+        known = self.vocabulary.get(word[0], ())
+        if word in known:
+            return word
+        close = difflib.get_close_matches(word, [w for w in known if abs(len(w) - len(word)) <= 2], 1, cutoff)
+        return close[0] if close else word
+
+    def match(self, question, team_id=None, min_score=0.8, fuzzy=False, fuzzy_cutoff=0.85):
+        """
+        The best entry for question among the team's FAQs and the shared ones,
+        as its dict plus "score", or None below min_score. A team FAQ wins a tie.
+        """
+        words = set(tokens(question))
+        if not words:
+            return None
+        if fuzzy:
+            words = {self._correct(word, fuzzy_cutoff) for word in words}
+        shared = Counter()
+        for team in {team_id, None}:
+            postings = self.postings.get(team, {})
+            for word in words:
+                shared.update(postings.get(word, ()))
+        best = None
+        for pk, count in shared.items():
+            faq_words, entry = self.entries[pk]
+            rank = (_jaccard(count, len(words), len(faq_words)), entry["project_team"] is not None)
+            if rank[0] >= min_score and (best is None or rank > best[0]):
+                best = (rank, entry)
+        return dict(best[1], score=round(best[0][0], 4)) if best else None
+
+
+_index = None
+_stamp = None
+_index_lock = threading.Lock()
+
+
+def _stamp_path():
+    return os.path.join(str(settings.KB_VECTOR_DIR), "faq.stamp")
+
+
+def _current_stamp():
+    try:
+        return os.stat(_stamp_path()).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load():
+    """(Re)build this process's index from the FAQ table."""
+    global _index, _stamp
+    stamp = _current_stamp()  # read first: a change committed during the query triggers another load
+    index = FAQIndex(FAQ.objects.values_list("id", "question", "answer", "category", "project_team_id"))
+    with _index_lock:
+        _index, _stamp = index, stamp
+    return index
+
+
+def warm():
+    """Load the index at process start; skipped (until first use) when the database is not ready."""
+    try:
+        load()
+    except DatabaseError as e:
+        logger.info("FAQ index not loaded at startup: %s", e)
+
+
+def get_index():
+    if _index is None or _current_stamp() != _stamp:
+        return load()
+    return _index
+
+
+def changed():
+    """Make every process rebuild its index before its next match (FAQ receivers, after commit)."""
+    path = _stamp_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a"):
+            pass
+        os.utime(path)
+    except OSError as e:
+        logger.warning("Could not mark the FAQ index changed: %s", e)
+
+
+def match(question, team_id=None):
+    """The FAQ answering question for the team (see FAQIndex.match), or None."""
+    if not settings.FAQ_MATCHING_ENABLED:
+        return None
+    return get_index().match(
+        question,
+        team_id=team_id or None,
+        min_score=settings.FAQ_MATCH_MIN_SCORE,
+        fuzzy=settings.FAQ_FUZZY_MATCHING,
+        fuzzy_cutoff=settings.FAQ_FUZZY_CUTOFF,
+    )
+
+
+def record_hit(faq_id):
+    """Count one answer from an FAQ in FAQ.frequency (written behind, qa_api.counters)."""
+    counters.faq_frequency.add(faq_id)
+
+
+# -- promotion ---------------------------------------------------------
+
+def candidates(team_id=None, since=None, min_count=3, limit=20):
+    """
+    Questions asked at least min_count times that no FAQ answers yet, most
+    asked first, as [{"question", "answer", "query_id", "count",
+    "average_rating", "project_team"}]. Questions are grouped by their
+    answer-cache fingerprint (same team, same content words), and groups
+    whose words are FAQ_MATCH_MIN_SCORE-similar are merged. The answer is
+    the best-rated, then latest, one in the group.
+    """
+    queries = QAQuery.objects.exclude(fingerprint="")
+    if team_id:
+        queries = queries.filter(project_team_id=team_id)
+    if since is not None:
+        queries = queries.filter(created_at__gte=since)
+    groups = list(
+        queries.values("fingerprint", "project_team_id")
+        .annotate(count=Count("id"), rated=Count("user_feedback"), rating_sum=Sum("user_feedback"), latest=Max("id"))
+        .order_by("-count", "-latest")[:CANDIDATE_GROUPS]
+    )
+    best = {}
+    representatives = (
+        queries.filter(fingerprint__in={g["fingerprint"] for g in groups})
+        .order_by(F("user_feedback").desc(nulls_last=True), "-id")
+        .values_list("id", "question", "response", "fingerprint", "project_team_id")
+    )
+    for pk, question, response, fingerprint, group_team in representatives.iterator():
+        best.setdefault((fingerprint, group_team), (pk, question, response))
+
+    clusters = []
+    for group in groups:
+        key = (group["fingerprint"], group["project_team_id"])
+        if key not in best:
+            continue
+        words = set(tokens(best[key][1]))
+        for cluster in clusters:
+            common = len(words & cluster["words"])
+            if (cluster["project_team"] == group["project_team_id"] and common and
+                    _jaccard(common, len(words), len(cluster["words"])) >= settings.FAQ_MATCH_MIN_SCORE):
+                break
+        else:
+            pk, question, response = best[key]
+            cluster = {"words": words, "question": question, "answer": response, "query_id": pk,
+                       "project_team": group["project_team_id"], "count": 0, "rated": 0, "rating_sum": 0}
+            clusters.append(cluster)
+        cluster["count"] += group["count"]
+        cluster["rated"] += group["rated"]
+        cluster["rating_sum"] += group["rating_sum"] or 0
+
+    index = get_index()
+    found = []
+    for cluster in sorted(clusters, key=lambda c: c["count"], reverse=True):
+        if cluster["count"] < min_count:
+            break
+        if index.match(cluster["question"], cluster["project_team"], min_score=settings.FAQ_MATCH_MIN_SCORE):
+            continue  # already answered by an FAQ
+        found.append({
+            "question": cluster["question"],
+            "answer": cluster["answer"],
+            "query_id": cluster["query_id"],
+            "count": cluster["count"],
+            "average_rating": round(cluster["rating_sum"] / cluster["rated"], 2) if cluster["rated"] else None,
+            "project_team": cluster["project_team"],
+        })
+        if len(found) >= limit:
+            break
+    return found
+
+
+def promote(query, category, question=None, answer=None):
+    """Create an FAQ from a QAQuery (optionally reworded); its frequency starts at how often it was asked."""
+    asked = QAQuery.objects.filter(fingerprint=query.fingerprint, project_team_id=query.project_team_id).count() \
+        if query.fingerprint else 1
+    return FAQ.objects.create(
+        question=(question or query.question)[:500],
+        answer=answer or query.response,
+        category=category,
+        project_team_id=query.project_team_id,
+        frequency=asked,
+    )
@@ -0,0 +1,265 @@
+"""
+Database-backed queue for generate/... requests submitted with ?async=1.
+
+The request builds the prompt (documents are extracted while their uploads
+still exist), stores it as a GenerationJob and returns its id. Worker
+processes started by `manage.py run_jobs` claim jobs with a conditional
+UPDATE, so no broker is needed and any number of workers can share the
+table. A running job holds a lease its worker keeps renewing; a job whose
+lease lapses (the worker died) is picked up again.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from ai_core.factory import get_provider
+from ai_core.limiter import LLMOverloaded, deadline_scope
+from .batch import batch_summary, run_batch
+from .chunking import ChunkedJob, ChunkedTestCases, ChunkedTestPlan
+from .models import GenerationJob
+
+logger = logging.getLogger(__name__)
+
+_CHUNKED_JOBS = {cls.__name__: cls for cls in (ChunkedTestCases, ChunkedTestPlan)}
+_ACTIVE = (GenerationJob.QUEUED, GenerationJob.RUNNING)
+_FINISHED = (GenerationJob.SUCCEEDED, GenerationJob.FAILED, GenerationJob.CANCELLED)
+
+
+def wants_job(params):
+    """True when the caller asked to run the request in the background (?async=1)."""
+    return params.get("async", "").lower() in ("1", "true", "yes")
+
+
+# ---- submitting ------------------------------------------------------------
+
+def _enqueue(endpoint, payload, meta):
+    return GenerationJob.objects.create(
+        endpoint=endpoint[:200],
+        artifact_type=meta.get("type") or "",
+        payload=dict(payload, meta=meta),
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def enqueue_generation(endpoint, prompt, meta):
+    """Queue a built prompt, or a ChunkedJob, from a GenerationAPIView."""
+    if isinstance(prompt, ChunkedJob):
+        payload = {"chunked": {
+            "class": type(prompt).__name__,
+            "app_context": prompt.app_context,
+            "chunks": prompt.chunks,
+            "max_cases": prompt.max_cases,
+        }}
+    else:
+        payload = {"prompt": prompt}
+    return _enqueue(endpoint, payload, meta)
+
+
+def enqueue_batch(endpoint, prompts, concurrency, meta):
+    """Queue build_batch_prompts() output for run_batch()."""
+    return _enqueue(endpoint, {"batch": {"prompts": prompts, "concurrency": concurrency}}, meta)
+
+
+def accepted(request, job):
+    """Body of the 202 returned when a job is queued."""
+    return {
+        "job_id": str(job.id),
+        "status": job.status,
+        "status_url": request.build_absolute_uri(reverse("job-detail", args=[job.id])),
+    }
+
+
+def describe(job):
+    """What GET jobs/<id>/ returns."""
+    body = {
+        "job_id": str(job.id),
+        "status": job.status,
+        "endpoint": job.endpoint,
+        "type": job.artifact_type,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "expires_at": job.expires_at,
+    }
+    if job.status == GenerationJob.SUCCEEDED:
+        body["result"] = job.result
+    if job.error:
+        body["error"] = job.error
+    return body
+
+
+def get_job(job_id):
+    """The job, or None if it does not exist or its result has expired."""
+    return (GenerationJob.objects.filter(id=job_id)
+            .exclude(expires_at__lte=timezone.now()).first())
+
+
+def cancel(job):
+    """
+    Cancel a queued or running job; False if it already finished. A running
+    job's worker cannot interrupt an in-flight LLM call, but its result is
+    discarded and the job is not retried.
+    """
+    now = timezone.now()
+    cancelled = GenerationJob.objects.filter(id=job.id, status__in=_ACTIVE).update(
+        status=GenerationJob.CANCELLED, finished_at=now, lease_expires_at=None,
+        expires_at=now + timedelta(seconds=settings.JOB_RESULT_TTL),
+    )
+    job.refresh_from_db()
+    return bool(cancelled)
+
+
+# ---- running ---------------------------------------------------------------
+
+def execute(payload, provider=None):
+    """Run a job payload to the same response body its endpoint would have returned."""
+    provider = provider or get_provider()
+    meta = payload["meta"]
+    if "chunked" in payload:
+        spec = payload["chunked"]
+        job = _CHUNKED_JOBS[spec["class"]](spec["app_context"], spec["chunks"], spec["max_cases"])
+        return job.run(provider, meta)
+    if "batch" in payload:
+        spec = payload["batch"]
+        prompts = [tuple(item) for item in spec["prompts"]]
+        return batch_summary(run_batch(provider, prompts, spec["concurrency"], meta))
+    return provider.generate(payload["prompt"], meta=meta)
+
+
+def _claimable(now):
+    return Q(status=GenerationJob.QUEUED, run_after__lte=now) | Q(status=GenerationJob.RUNNING, lease_expires_at__lt=now)
+
+
+def claim(worker_id):
+    """Take the next ready job (or one whose worker's lease lapsed) for this worker, or None."""
+    now = timezone.now()
+    ready = GenerationJob.objects.filter(_claimable(now)).order_by("run_after", "created_at")
+    for job_id in ready.values_list("id", flat=True)[:10]:
+        # Only one worker's UPDATE can still match the row.
+        claimed = GenerationJob.objects.filter(_claimable(now), id=job_id).update(
+            status=GenerationJob.RUNNING, worker=worker_id, attempts=F("attempts") + 1,
+            started_at=now, lease_expires_at=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+        )
+        if claimed:
+            return GenerationJob.objects.get(id=job_id)
+    return None
+
+
+def _settle(job, worker_id, **fields):
+    """Write a job's outcome if this worker still holds it (it was not cancelled or taken over)."""
+    fields.setdefault("lease_expires_at", None)
+    return GenerationJob.objects.filter(id=job.id, status=GenerationJob.RUNNING, worker=worker_id).update(**fields)
+
+
+def _finished(status, **fields):
+    now = timezone.now()
+    return dict(fields, status=status, finished_at=now,
+                expires_at=now + timedelta(seconds=settings.JOB_RESULT_TTL))
+
+
+def _retry_delay(job, error):
+    if isinstance(error, LLMOverloaded) and error.retry_after:
+        return error.retry_after
+    return settings.JOB_RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+
+
+def _failed(job, worker_id, error):
+    if isinstance(error, ValueError) or job.attempts >= job.max_attempts:
+        logger.warning("Job %s failed after %s attempt(s): %s", job.id, job.attempts, error)
+        return _settle(job, worker_id, **_finished(GenerationJob.FAILED, error=str(error)))
+    delay = _retry_delay(job, error)
+    logger.info("Job %s attempt %s failed (%s), retrying in %.1fs", job.id, job.attempts, error, delay)
+    return _settle(job, worker_id, status=GenerationJob.QUEUED, error=str(error), worker="",
+                   run_after=timezone.now() + timedelta(seconds=delay))
+
+
+class _Lease(threading.Thread):
+    """Renews a running job's lease until stopped."""
+
+    def __init__(self, job, worker_id):
+        super().__init__(daemon=True)
+        self.job = job
+        self.worker_id = worker_id
+        self.stopped = threading.Event()
+
+    def run(self):
+        lease = settings.JOB_LEASE_SECONDS
+        try:
+            while not self.stopped.wait(lease / 3):
+                held = GenerationJob.objects.filter(
+                    id=self.job.id, status=GenerationJob.RUNNING, worker=self.worker_id
+                ).update(lease_expires_at=timezone.now() + timedelta(seconds=lease))
+                if not held:
+                    return  # cancelled or taken over; the result will be discarded
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job, worker_id):
+    """Execute one claimed job and record its result, retry or failure."""
+    if job.attempts > job.max_attempts:
+        # Its earlier workers died mid-job (e.g. OOM killed); do not keep feeding it to new ones.
+        _settle(job, worker_id, **_finished(GenerationJob.FAILED, error="Worker lost while running the job."))
+        return
+    lease = _Lease(job, worker_id)
+    lease.start()
+    try:
+        with deadline_scope(settings.JOB_TIMEOUT):
+            result = execute(job.payload)
+    except Exception as e:
+        _failed(job, worker_id, e)
+    else:
+        if not _settle(job, worker_id, **_finished(GenerationJob.SUCCEEDED, result=result, error="")):
+            logger.info("Job %s finished after it was cancelled; result discarded", job.id)
+    finally:
+        lease.stop()
+
+
+def purge_expired():
+    """Delete finished jobs whose result has expired. Returns the number removed."""
+    return GenerationJob.objects.filter(status__in=_FINISHED, expires_at__lte=timezone.now()).delete()[0]
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def work(stop=None, once=False, poll_interval=None):
+    """
+    Drain the queue until `stop` (a threading/multiprocessing Event) is set,
+    or until it is empty when once=True. Returns the number of jobs run.
+    """
+    worker_id = worker_name()
+    poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+    next_purge = 0.0
+    ran = 0
+    while stop is None or not stop.is_set():
+        if time.monotonic() >= next_purge:
+            purge_expired()
+            next_purge = time.monotonic() + settings.JOB_PURGE_INTERVAL
+        job = claim(worker_id)
+        if job is None:
+            if once:
+                break
+            if stop is not None:
+                stop.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+        run_job(job, worker_id)
+        ran += 1
+    return ran
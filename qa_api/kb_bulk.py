@@ -0,0 +1,192 @@
+"""
+Bulk import and export of KnowledgeBase articles as NDJSON or CSV.
+
+import_articles() reads records one at a time from an iterator of lines (a
+request body, an upload or a file), validates them KB_IMPORT_BATCH_SIZE at
+a time and writes each batch of valid rows in one transaction: bulk_create
+for new articles, bulk_update for rows whose id already exists (the row
+replaces the article). Bulk writes skip the save() receivers, so each batch
+then updates the search indexes once: tags and passages (qa_api.kb_tags,
+qa_api.passages), cached answers citing updated articles (qa_api.answer_cache)
+and, after commit, the vector indexes. The FTS5 index follows through its
+triggers.
+
+export_lines() streams articles from queryset.iterator() in the same
+formats, so an export can be imported again.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import answer_cache, kb_tags, kb_vectors, passages
+from .models import KnowledgeBase, Team
+from .serializers import KnowledgeBaseImportSerializer
+
+NDJSON, CSV = "ndjson", "csv"
+FORMATS = (NDJSON, CSV)
+CONTENT_TYPES = {NDJSON: "application/x-ndjson", CSV: "text/csv"}
+EXPORT_FIELDS = ("id", "title", "content", "category", "project_team_id", "tags", "created_by", "last_updated",
+                 "usage_count")
+UPDATE_FIELDS = ("title", "content", "category", "project_team", "tags", "created_by", "last_updated")
+MAX_REPORTED_ERRORS = 100
+
+
+def guess_format(name="", content_type=""):
+    """csv for a .csv name or a CSV content type, ndjson otherwise."""
+    if (name or "").lower().endswith(".csv") or "csv" in (content_type or "").lower():
+        return CSV
+    return NDJSON
+
+
+def _from_csv(row):
+    # blank cells mean "not given"; tags are a JSON array or comma-separated
+    record = {key: value for key, value in row.items() if key is not None and value != ""}
+    tags = record.get("tags")
+    if tags is not None:
+        if tags.lstrip().startswith("["):
+            record["tags"] = json.loads(tags)
+        else:
+            record["tags"] = [tag.strip() for tag in tags.split(",") if tag.strip()]
+    return record
+
+
+def records(lines, fmt):
+    """(line number, record dict or ValueError) for each record in lines (bytes or str, newlines kept)."""
+    decoded = (line.decode("utf-8-sig") if isinstance(line, bytes) else line for line in lines)
+    if fmt == CSV:
+        reader = csv.DictReader(decoded)
+        for row in reader:
+            try:
+                yield reader.line_num, _from_csv(row)
+            except ValueError as e:
+                yield reader.line_num, ValueError(f"tags: {e}")
+        return
+    for number, line in enumerate(decoded, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f"invalid JSON: {e}")
+            continue
+        yield number, record if isinstance(record, dict) else ValueError("not a JSON object")
+
+
+def _validate(chunk, created_by):
+    """([(line, validated data)], [(line, errors)]) for a chunk; team ids are checked in one query."""
+    valid, errors = [], []
+    for line, record in chunk:
+        if isinstance(record, ValueError):
+            errors.append((line, {"non_field_errors": [str(record)]}))
+            continue
+        serializer = KnowledgeBaseImportSerializer(data={"created_by": created_by, **record})
+        if serializer.is_valid():
+            valid.append((line, serializer.validated_data))
+        else:
+            errors.append((line, serializer.errors))
+    teams = {data["project_team_id"] for _, data in valid if data.get("project_team_id")}
+    if teams:
+        missing = teams - set(Team.objects.filter(pk__in=teams).values_list("id", flat=True))
+        if missing:
+            errors.extend((line, {"project_team_id": [f"Team {data['project_team_id']} does not exist."]})
+                          for line, data in valid if data.get("project_team_id") in missing)
+            valid = [(line, data) for line, data in valid if data.get("project_team_id") not in missing]
+    return valid, errors
+
+
+def _write(valid):
+    """Write one validated batch and update the search indexes for it; returns (created, updated)."""
+    now = timezone.now()
+    by_id, new = {}, []
+    for _, data in valid:
+        article = KnowledgeBase(**data)
+        article.last_updated = now
+        if article.pk:
+            by_id[article.pk] = article  # the last row for an id wins
+        else:
+            new.append(article)
+    existing = set(KnowledgeBase.objects.filter(pk__in=list(by_id)).values_list("id", flat=True)) if by_id else set()
+    changed = [article for pk, article in by_id.items() if pk in existing]
+    new.extend(article for pk, article in by_id.items() if pk not in existing)
+
+    with transaction.atomic():
+        KnowledgeBase.objects.bulk_create(new)
+        if changed:
+            KnowledgeBase.objects.bulk_update(changed, UPDATE_FIELDS)
+            answer_cache.invalidate_articles([article.pk for article in changed])
+        articles = new + changed
+        kb_tags.sync_many(articles)
+        removed = passages.sync_many(articles)
+
+        def reindex():
+            kb_vectors.remove_passages(removed)
+            kb_vectors.index_articles(articles)
+
+        transaction.on_commit(reindex)
+    return len(new), len(changed)
+
+
+def import_articles(lines, fmt=NDJSON, batch_size=None, created_by="bulk import"):
+    """
+    Import the articles in lines; invalid rows are skipped and reported.
+    Returns {"created", "updated", "failed", "errors": [{"line", "errors"}]}
+    with at most MAX_REPORTED_ERRORS errors listed.
+    """
+    batch_size = batch_size or settings.KB_IMPORT_BATCH_SIZE
+    result = {"created": 0, "updated": 0, "failed": 0, "errors": []}
+
+    def report(errors):
+        result["failed"] += len(errors)
+        room = MAX_REPORTED_ERRORS - len(result["errors"])
+        result["errors"].extend({"line": line, "errors": e} for line, e in errors[:max(room, 0)])
+
+    def process(chunk):
+        valid, errors = _validate(chunk, created_by)
+        if valid:
+            try:
+                created, updated = _write(valid)
+            except IntegrityError as e:
+                errors.extend((line, {"non_field_errors": [f"batch not written: {e}"]}) for line, _ in valid)
+            else:
+                result["created"] += created
+                result["updated"] += updated
+        report(sorted(errors, key=lambda error: error[0]))
+
+    chunk = []
+    for item in records(lines, fmt):
+        chunk.append(item)
+        if len(chunk) >= batch_size:
+            process(chunk)
+            chunk = []
+    if chunk:
+        process(chunk)
+    return result
+
+
+class _Line:
+    """csv.writer target that hands back each formatted row instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(queryset, fmt=NDJSON, chunk_size=2000):
+    """The queryset's articles as NDJSON or CSV lines, read with iterator() so only a chunk is in memory."""
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    if fmt == CSV:
+        writer = csv.writer(_Line())
+        yield writer.writerow(EXPORT_FIELDS)
+        tags = EXPORT_FIELDS.index("tags")
+        updated = EXPORT_FIELDS.index("last_updated")
+        for row in rows:
+            row = list(row)
+            row[tags] = json.dumps(row[tags], ensure_ascii=False)
+            row[updated] = row[updated].isoformat() if row[updated] else ""
+            yield writer.writerow(row)
+        return
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
@@ -0,0 +1,264 @@
+"""
+Ranked KnowledgeBase search.
+
+On SQLite this queries the FTS5 index created by migration 0008 (BM25
+ranking, phrase and prefix queries, highlighted snippets).
+On other databases, or before the migration has run, it falls back to
+substring matching on the individual query terms (and exact tag matches
+through the kb_tags index). hybrid_ranking() adds semantic matches from
+qa_api.kb_vectors for assistant questions, and popularity_ranked() an
+article usage prior.
+"""
+import math
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Q
+
+from . import counters, kb_tags, kb_vectors
+from .models import KnowledgeBase, KnowledgeBaseTag
+
+FTS_TABLE = "qa_api_knowledgebase_fts"
+VOCAB_TABLE = "qa_api_knowledgebase_fts_vocab"
+# FTS5's BM25 IDF is ~0 for terms in at least half the articles: leave them out of OR queries
+COMMON_TERM_RATIO = 0.5
+PRUNE_MIN_ARTICLES = 1000  # below this every term is cheap and may still matter within a filter
+# bm25() column weights: title, content, tags
+WEIGHTS = (5.0, 1.0, 3.0)
+SNIPPET_TOKENS = 24
+RRF_K = 60  # reciprocal rank fusion damping: 1 / (RRF_K + rank)
+HIGHLIGHT = ("<mark>", "</mark>")
+
+_PHRASE = re.compile(r'"([^"]+)"')
+_TERM = re.compile(r"\w+\*?", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from how i if in into is it me my of on or our "
+    "should so that the their then there these this to us was we what when where which who why will "
+    "with would you your".split()
+)
+
+
+def _quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def parse_query(text):
+    """([phrases], [terms]) from user input; "quoted text" is a phrase, a trailing * a prefix."""
+    phrases = [p.strip() for p in _PHRASE.findall(text or "") if p.strip()]
+    rest = _PHRASE.sub(" ", text or "")
+    terms = []
+    for term in _TERM.findall(rest.lower()):
+        if term.rstrip("*") and term.rstrip("*") not in _STOPWORDS and term not in terms:
+            terms.append(term)
+    return phrases, terms
+
+
+def match_expression(phrases, terms, any_term=False):
+    """
+    FTS5 MATCH expression for parsed input, or None if it has no searchable
+    terms. Every token is quoted so punctuation cannot break the query syntax.
+    any_term=True ORs the terms (questions); otherwise all must match (search box).
+    """
+    parts = [_quote(p) for p in phrases]
+    parts += [_quote(t[:-1]) + "*" if t.endswith("*") else _quote(t) for t in terms]
+    if not parts:
+        return None
+    return (" OR " if any_term else " AND ").join(parts)
+
+
+_indexed_databases = set()
+
+
+def fts_available():
+    """True when the default database has the FTS5 index (remembered once seen)."""
+    if connection.vendor != "sqlite":
+        return False
+    name = str(connection.settings_dict["NAME"])
+    if name in _indexed_databases:
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        found = cursor.fetchone() is not None
+    if found:
+        _indexed_databases.add(name)
+    return found
+
+
+def _prune_common(terms):
+    """
+    Drop plain terms found in COMMON_TERM_RATIO or more of the articles from an
+    OR query. They barely move BM25 scores but make the query match (and
+    score) nearly every article. The rarest term is always kept; small
+    knowledge bases are left alone.
+    """
+    plain = [t for t in terms if not t.endswith("*")]
+    if len(plain) < 2:
+        return terms
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT term, doc, (SELECT count(*) FROM qa_api_knowledgebase) FROM {VOCAB_TABLE} "
+            f"WHERE term IN ({', '.join(['%s'] * len(plain))})", plain
+        )
+        found = cursor.fetchall()
+    # no row means no term is indexed at all, so none is common either
+    articles = found[0][2] if found else 0
+    frequency = {term: doc for term, doc, _ in found}
+    if articles < PRUNE_MIN_ARTICLES:
+        return terms
+    common = articles * COMMON_TERM_RATIO
+    kept = [t for t in terms if t.endswith("*") or frequency.get(t, 0) < common]
+    if not any(not t.endswith("*") for t in kept):
+        kept.append(min(plain, key=lambda t: frequency.get(t, 0)))
+    return kept
+
+
+def _filters(category, team_id, include_universal, tags=None, tag_mode=kb_tags.ANY):
+    sql, params = [], []
+    tags = kb_tags.normalize(tags)
+    if tags:
+        # the same indexed lookup kb_tags.article_ids builds, as SQL for the raw FTS query
+        table = KnowledgeBaseTag._meta.db_table
+        placeholders = ", ".join(["%s"] * len(tags))
+        subquery = f"SELECT article_id FROM {table} WHERE tag IN ({placeholders})"
+        if tag_mode == kb_tags.ALL and len(tags) > 1:
+            subquery += f" GROUP BY article_id HAVING count(*) = {len(tags)}"
+        sql.append(f"kb.id IN ({subquery})")
+        params.extend(tags)
+    if category:
+        sql.append("kb.category = %s")
+        params.append(category)
+    if team_id is not None:
+        if include_universal:
+            sql.append("(kb.project_team_id = %s OR kb.category = 'universal')")
+        else:
+            sql.append("kb.project_team_id = %s")
+        params.append(team_id)
+    return sql, params
+
+
+def _fts_search(expression, category, team_id, include_universal, limit, tags, tag_mode):
+    where, params = _filters(category, team_id, include_universal, tags, tag_mode)
+    sql = (
+        f"SELECT kb.id, bm25({FTS_TABLE}, %s, %s, %s) AS score, "
+        f"snippet({FTS_TABLE}, 1, %s, %s, '…', %s) "
+        f"FROM {FTS_TABLE} JOIN qa_api_knowledgebase kb ON kb.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s" + "".join(f" AND {clause}" for clause in where) +
+        " ORDER BY score LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*WEIGHTS, *HIGHLIGHT, SNIPPET_TOKENS, expression, *params, limit])
+        return cursor.fetchall()
+
+
+def _fallback_search(text, category, team_id, include_universal, limit, any_term, tags, tag_mode):
+    phrases, terms = parse_query(text)
+    needles = phrases + [t.rstrip("*") for t in terms]
+    if not needles:
+        return []
+    conditions = [
+        Q(title__icontains=n) | Q(content__icontains=n) | Q(id__in=kb_tags.article_ids([n])) for n in needles
+    ]
+    condition = conditions[0]
+    for extra in conditions[1:]:
+        condition = (condition | extra) if any_term else (condition & extra)
+    queryset = kb_tags.filter_articles(KnowledgeBase.objects.filter(condition), tags, tag_mode)
+    if category:
+        queryset = queryset.filter(category=category)
+    if team_id is not None:
+        team = Q(project_team_id=team_id)
+        queryset = queryset.filter(team | Q(category="universal") if include_universal else team)
+    return [(pk, None, None) for pk in queryset.order_by("-last_updated").values_list("id", flat=True)[:limit]]
+
+
+def ranking(text, category=None, team_id=None, include_universal=False, limit=10, any_term=False,
+            tags=None, tag_mode=kb_tags.ANY):
+    """[(article id, score, snippet)] for search(), best first, without loading the articles."""
+    phrases, terms = parse_query(text)
+    if not (phrases or terms):
+        return []
+    rows = []
+    if fts_available():
+        try:
+            pruned = _prune_common(terms) if any_term else terms
+            if pruned != terms:
+                rows = _fts_search(match_expression(phrases, pruned, any_term),
+                                   category, team_id, include_universal, limit, tags, tag_mode)
+            if not rows:
+                rows = _fts_search(match_expression(phrases, terms, any_term),
+                                   category, team_id, include_universal, limit, tags, tag_mode)
+        except DatabaseError:
+            rows = _fallback_search(text, category, team_id, include_universal, limit, any_term, tags, tag_mode)
+    else:
+        rows = _fallback_search(text, category, team_id, include_universal, limit, any_term, tags, tag_mode)
+    return rows
+
+
+def load(rows, queryset=None):
+    """The articles of ranking rows in rank order, each with `.score` and `.snippet` set (one query)."""
+    queryset = KnowledgeBase.objects.select_related("project_team") if queryset is None else queryset
+    articles = queryset.in_bulk([pk for pk, _, _ in rows])
+    results = []
+    for pk, score, snippet in rows:
+        article = articles.get(pk)
+        if article is None:
+            continue
+        article.score = score
+        article.snippet = snippet
+        results.append(article)
+    return results
+
+
+def search(text, category=None, team_id=None, include_universal=False, limit=10, any_term=False,
+           tags=None, tag_mode=kb_tags.ANY):
+    """
+    KnowledgeBase articles best matching `text`, best first, each with
+    `.score` (BM25, lower is better; None in fallback mode) and `.snippet`
+    (content excerpt with matches wrapped in <mark>). `tags` restricts the
+    results to articles with any/all (tag_mode) of those tags.
+    """
+    return load(ranking(text, category, team_id, include_universal, limit, any_term, tags, tag_mode))
+
+
+def hybrid_ranking(text, category=None, team_id=None, include_universal=False, limit=5):
+    """
+    [(article id, fused score, snippet)] for a natural-language question:
+    keyword (BM25, any term) and semantic (qa_api.kb_vectors) rankings merged
+    by reciprocal rank fusion, so an article found by either can rank and one
+    found by both ranks highest. Scores are higher-is-better; snippets are
+    set for keyword hits only. Articles are not loaded (see load()).
+    """
+    keyword = ranking(text, category=category, team_id=team_id, include_universal=include_universal,
+                      limit=limit * 2, any_term=True)
+    semantic = kb_vectors.search(text, limit=limit * 2, team_id=team_id, category=category,
+                                 include_universal=include_universal)
+    fused, snippets = {}, {}
+    for rank, (pk, _, snippet) in enumerate(keyword):
+        fused[pk] = fused.get(pk, 0.0) + 1.0 / (RRF_K + rank)
+        snippets[pk] = snippet
+    for rank, (pk, _) in enumerate(semantic):
+        fused[pk] = fused.get(pk, 0.0) + 1.0 / (RRF_K + rank)
+    best = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [(pk, fused[pk], snippets.get(pk)) for pk in best]
+
+
+def popularity_ranked(articles):
+    """
+    Articles loaded from hybrid_ranking rows, re-ordered after adding a
+    popularity prior to their fused score: KB_POPULARITY_WEIGHT *
+    log(1 + usage_count), counting hits not yet flushed (qa_api.counters).
+    At the default weight, 100 uses are worth a few places in one ranking.
+    """
+    weight = settings.KB_POPULARITY_WEIGHT
+    for article in articles:
+        article.score += weight * math.log1p(article.usage_count + counters.kb_usage.pending(article.pk))
+    return sorted(articles, key=lambda article: article.score, reverse=True)
+
+
+def rebuild():
+    """Re-index every article (after restoring a dump or editing the table with triggers disabled)."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
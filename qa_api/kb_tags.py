@@ -0,0 +1,110 @@
+"""
+Tag index for KnowledgeBase articles.
+
+KnowledgeBase.tags stays the source of truth; KnowledgeBaseTag holds one
+normalized (article, tag) row per tag so "any of"/"all of" filters and
+per-tag facet counts use the tag index instead of parsing every row's JSON.
+Plain ORM queries, so the same code runs on SQLite and PostgreSQL.
+
+Rows are kept in step by the post_save receiver in qa_api.signals and
+removed with their article by the foreign key cascade. Writes that skip
+save() (bulk_create, queryset.update) need sync()/sync_many()/rebuild()
+afterwards.
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from .models import KnowledgeBase, KnowledgeBaseTag
+
+MAX_TAG_CHARS = KnowledgeBaseTag._meta.get_field("tag").max_length
+ANY, ALL = "any", "all"
+
+
+def normalize(tags):
+    """Distinct lowercased, trimmed tag strings, in first-seen order; non-strings and blanks are ignored."""
+    if not isinstance(tags, (list, tuple, set)):
+        return []
+    seen = []
+    for tag in tags:
+        if not isinstance(tag, str):
+            continue
+        tag = " ".join(tag.split()).lower()[:MAX_TAG_CHARS]
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+def sync(article):
+    """Make the article's index rows match its tags, touching only the tags that changed."""
+    wanted = set(normalize(article.tags))
+    with transaction.atomic():
+        current = set(KnowledgeBaseTag.objects.filter(article=article).values_list("tag", flat=True))
+        if current - wanted:
+            KnowledgeBaseTag.objects.filter(article=article, tag__in=current - wanted).delete()
+        KnowledgeBaseTag.objects.bulk_create(
+            [KnowledgeBaseTag(article=article, tag=tag) for tag in wanted - current], ignore_conflicts=True
+        )
+
+
+def sync_many(articles):
+    """sync() for a batch of saved articles in one read, one delete and one insert (bulk imports)."""
+    wanted = {(article.pk, tag) for article in articles for tag in normalize(article.tags)}
+    with transaction.atomic():
+        current = {
+            (article_id, tag): pk for pk, article_id, tag in KnowledgeBaseTag.objects.filter(
+                article_id__in=[article.pk for article in articles]
+            ).values_list("id", "article_id", "tag")
+        }
+        stale = [pk for key, pk in current.items() if key not in wanted]
+        if stale:
+            KnowledgeBaseTag.objects.filter(id__in=stale).delete()
+        KnowledgeBaseTag.objects.bulk_create(
+            [KnowledgeBaseTag(article_id=pk, tag=tag) for pk, tag in wanted - current.keys()], ignore_conflicts=True
+        )
+
+
+def rebuild(batch_size=2000):
+    """Re-create every index row from KnowledgeBase.tags; returns the number of rows written."""
+    written = 0
+    with transaction.atomic():
+        KnowledgeBaseTag.objects.all().delete()
+        rows = []
+        for pk, tags in KnowledgeBase.objects.values_list("id", "tags").iterator(chunk_size=batch_size):
+            rows.extend(KnowledgeBaseTag(article_id=pk, tag=tag) for tag in normalize(tags))
+            if len(rows) >= batch_size:
+                KnowledgeBaseTag.objects.bulk_create(rows)
+                written += len(rows)
+                rows = []
+        KnowledgeBaseTag.objects.bulk_create(rows)
+        written += len(rows)
+    return written
+
+
+def article_ids(tags, mode=ANY):
+    """
+    Subquery of the ids of articles carrying any (mode="any") or all
+    (mode="all") of the tags, for `filter(id__in=...)`; None if no tags given.
+    """
+    tags = normalize(tags)
+    if not tags:
+        return None
+    rows = KnowledgeBaseTag.objects.filter(tag__in=tags)
+    if mode == ALL and len(tags) > 1:
+        return (rows.values("article_id")
+                .annotate(matched=Count("tag")).filter(matched=len(tags)).values("article_id"))
+    return rows.values("article_id")
+
+
+def filter_articles(queryset, tags, mode=ANY):
+    """KnowledgeBase queryset narrowed to articles with any/all of the tags (unchanged if none given)."""
+    ids = article_ids(tags, mode)
+    return queryset if ids is None else queryset.filter(id__in=ids)
+
+
+def facets(queryset=None, limit=50):
+    """[{"tag", "count"}] over the articles in queryset (all articles by default), most used first."""
+    rows = KnowledgeBaseTag.objects.all()
+    if queryset is not None:
+        rows = rows.filter(article_id__in=queryset.order_by().values("id"))
+    counts = rows.values("tag").annotate(count=Count("article_id")).order_by("-count", "tag")
+    return list(counts[:limit])
@@ -0,0 +1,179 @@
+"""
+Semantic retrieval over the knowledge base with qa_api.vector_index.
+
+Three indexes under settings.KB_VECTOR_DIR: "articles", one vector per
+KnowledgeBase article (title, tags and content embedded together),
+"passages", one per KnowledgePassage (article title plus passage text), and
+"answers", one per cacheable assistant answer (its question, keyed by
+QAQuery id, see qa_api.answer_cache). The receivers in qa_api.signals keep
+the first two current on save/delete; `manage.py rebuild_kb_index`
+re-embeds everything (after bulk writes, or a KB_VECTOR_DIM change).
+"""
+import logging
+import os
+
+from django.conf import settings
+
+from .models import KnowledgeBase, KnowledgePassage
+from .vector_index import NO_CATEGORY, NO_TEAM, VectorIndex, embed
+
+logger = logging.getLogger(__name__)
+
+ARTICLES, PASSAGES, ANSWERS = "articles", "passages", "answers"
+CATEGORY_CODES = {value: code for code, (value, _) in enumerate(KnowledgeBase.CATEGORY_CHOICES)}
+UNIVERSAL = CATEGORY_CODES["universal"]
+INDEXED_FIELDS = ("id", "title", "content", "tags", "category", "project_team_id")
+
+_indexes = {}
+
+
+def get_index(name=ARTICLES):
+    """This process's VectorIndex `name` for the configured directory and dimension."""
+    key = (os.path.join(str(settings.KB_VECTOR_DIR), name), settings.KB_VECTOR_DIM)
+    if key not in _indexes:
+        _indexes[key] = VectorIndex(*key)
+    return _indexes[key]
+
+
+def article_text(article):
+    # title repeated so its words outweigh the same words deep in the body
+    tags = " ".join(t for t in article.tags if isinstance(t, str)) if isinstance(article.tags, list) else ""
+    return f"{article.title}\n{article.title}\n{tags}\n{article.content}"
+
+
+def _row(key, text, article):
+    return (
+        key,
+        embed(text, settings.KB_VECTOR_DIM),
+        article.project_team_id,
+        CATEGORY_CODES.get(article.category, NO_CATEGORY),
+    )
+
+
+def _passage_row(passage, article):
+    return _row(passage.pk, f"{article.title}\n{passage.text}", article)
+
+
+def _update(name, upserts=(), deletes=()):
+    """Apply index changes; failures are logged, never raised (the database stays authoritative)."""
+    if not settings.KB_VECTOR_INDEX_ENABLED:
+        return
+    try:
+        index = get_index(name)
+        index.delete_many(list(deletes))
+        index.upsert_many(list(upserts))
+    except OSError as e:
+        logger.warning("Updating the KB vector index %s failed: %s", name, e)
+
+
+def index_articles(articles):
+    """Add or replace the vectors of saved articles and of their current passages."""
+    if not settings.KB_VECTOR_INDEX_ENABLED:
+        return
+    _update(ARTICLES, upserts=[_row(a.pk, article_text(a), a) for a in articles])
+    by_article = {a.pk: a for a in articles}
+    passages = KnowledgePassage.objects.filter(article_id__in=list(by_article)).only("id", "article_id", "text")
+    _update(PASSAGES, upserts=[_passage_row(p, by_article[p.article_id]) for p in passages])
+
+
+def remove_articles(pks, passage_pks=()):
+    _update(ARTICLES, deletes=pks)
+    _update(PASSAGES, deletes=passage_pks)
+
+
+def remove_passages(pks):
+    _update(PASSAGES, deletes=pks)
+
+
+def _answer_row(query):
+    return (query.pk, embed(query.question, settings.KB_VECTOR_DIM), query.project_team_id, NO_CATEGORY)
+
+
+def index_answers(queries):
+    """Add or replace the question vectors of cacheable QAQuery answers."""
+    _update(ANSWERS, upserts=[_answer_row(q) for q in queries])
+
+
+def remove_answers(pks):
+    _update(ANSWERS, deletes=pks)
+
+
+def _rebuild(name, rows, batch_size):
+    index = get_index(name)
+    index.clear()
+    batch, indexed = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index.upsert_many(batch)
+            indexed += len(batch)
+            batch = []
+    index.upsert_many(batch)
+    return indexed + len(batch)
+
+
+def rebuild(batch_size=2000):
+    """Re-embed every article and passage into fresh indexes; returns (articles, passages) indexed."""
+    articles = KnowledgeBase.objects.only(*INDEXED_FIELDS).iterator(chunk_size=batch_size)
+    article_count = _rebuild(ARTICLES, (_row(a.pk, article_text(a), a) for a in articles), batch_size)
+    passages = (
+        KnowledgePassage.objects.select_related("article")
+        .only("id", "text", "article__title", "article__category", "article__project_team_id")
+        .iterator(chunk_size=batch_size)
+    )
+    passage_count = _rebuild(PASSAGES, (_passage_row(p, p.article) for p in passages), batch_size)
+    return article_count, passage_count
+
+
+def rebuild_answers(queries, batch_size=2000):
+    """Re-embed the given QAQuery answers into a fresh answer index; returns the number indexed."""
+    return _rebuild(ANSWERS, (_answer_row(q) for q in queries), batch_size)
+
+
+def _search(name, text, limit, team_id, category, include_universal):
+    if not settings.KB_VECTOR_INDEX_ENABLED:
+        return []
+    index = get_index(name)
+    return index.search(
+        index.query_vector(text),
+        k=limit,
+        team_id=int(team_id) if team_id is not None else None,
+        category=CATEGORY_CODES.get(category, NO_CATEGORY) if category else None,
+        include_universal_code=UNIVERSAL if include_universal else None,
+        min_score=settings.KB_VECTOR_MIN_SCORE,
+    )
+
+
+def search(text, limit=10, team_id=None, category=None, include_universal=False):
+    """[(article id, cosine similarity)] of the articles semantically closest to text, best first."""
+    return _search(ARTICLES, text, limit, team_id, category, include_universal)
+
+
+def search_passages(text, limit=10, team_id=None, category=None, include_universal=False):
+    """[(passage id, cosine similarity)] of the passages semantically closest to text, best first."""
+    return _search(PASSAGES, text, limit, team_id, category, include_universal)
+
+
+def search_answers(text, limit=5, team_id=None, min_score=0.0):
+    """
+    [(QAQuery id, cosine similarity)] of the indexed answers whose question
+    is closest to text, best first, for the team (or for no team when None).
+    Questions are compared on their plain embeddings: no IDF weighting, as
+    both sides are short questions.
+    """
+    if not settings.KB_VECTOR_INDEX_ENABLED:
+        return []
+    return get_index(ANSWERS).search(
+        embed(text, settings.KB_VECTOR_DIM),
+        k=limit,
+        team_id=NO_TEAM if team_id is None else int(team_id),
+        min_score=min_score,
+    )
+
+
+def score_passages(text, pks):
+    """{passage id: cosine similarity to text} for the given passages that are indexed."""
+    if not settings.KB_VECTOR_INDEX_ENABLED or not pks:
+        return {}
+    index = get_index(PASSAGES)
+    return index.scores(index.query_vector(text), pks)
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from qa_api import kb_bulk, kb_tags
+from qa_api.models import KnowledgeBase
+
+
+class Command(BaseCommand):
+    help = "Stream KnowledgeBase articles to an NDJSON or CSV file (or stdout), in a form import_kb accepts back."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default="-", help="File to write, or - for standard output (default).")
+        parser.add_argument("--format", choices=kb_bulk.FORMATS,
+                            help="Output format (default: csv for *.csv, ndjson otherwise).")
+        parser.add_argument("--category", help="Only articles in this category.")
+        parser.add_argument("--project-id", type=int, help="Only this team's articles and universal ones.")
+        parser.add_argument("--tag", action="append", default=[], help="Only articles with this tag (repeatable).")
+
+    def handle(self, *args, **options):
+        path = options["output"]
+        fmt = options["format"] or kb_bulk.guess_format(path)
+        queryset = KnowledgeBase.objects.order_by("id")
+        if options["category"]:
+            queryset = queryset.filter(category=options["category"])
+        if options["project_id"]:
+            queryset = queryset.filter(Q(project_team_id=options["project_id"]) | Q(category="universal"))
+        queryset = kb_tags.filter_articles(queryset, options["tag"])
+        try:
+            target = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+        except OSError as e:
+            raise CommandError(e)
+        written = 0
+        try:
+            for line in kb_bulk.export_lines(queryset, fmt):
+                target.write(line)
+                written += 1
+        finally:
+            if target is not sys.stdout:
+                target.close()
+        if path != "-":
+            rows = written - 1 if fmt == kb_bulk.CSV else written
+            self.stdout.write(f"Exported {rows} article(s) to {path}.")
@@ -0,0 +1,40 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from qa_api import kb_bulk
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import KnowledgeBase articles from an NDJSON or CSV file (or - for stdin), "
+        "in batches that update the search indexes once each. Rows with an existing id replace that article."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - to read standard input.")
+        parser.add_argument("--format", choices=kb_bulk.FORMATS,
+                            help="Input format (default: csv for *.csv, ndjson otherwise).")
+        parser.add_argument("--batch-size", type=int, default=settings.KB_IMPORT_BATCH_SIZE,
+                            help="Rows validated and written per transaction (default KB_IMPORT_BATCH_SIZE).")
+        parser.add_argument("--created-by", default="bulk import",
+                            help="created_by for rows that do not set it.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or kb_bulk.guess_format(path)
+        try:
+            source = sys.stdin.buffer if path == "-" else open(path, "rb")
+        except OSError as e:
+            raise CommandError(e)
+        with source:
+            result = kb_bulk.import_articles(source, fmt, batch_size=options["batch_size"],
+                                             created_by=options["created_by"])
+        for error in result["errors"]:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        if result["failed"] > len(result["errors"]):
+            self.stderr.write(f"... and {result['failed'] - len(result['errors'])} more invalid row(s).")
+        self.stdout.write(
+            f"Created {result['created']}, updated {result['updated']}, skipped {result['failed']} article(s)."
+        )
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from qa_api import answer_cache, kb_search, kb_tags, kb_vectors, passages
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the KnowledgeBase search indexes from the knowledge base table: "
+        "the tag index, article passages, the semantic vector indexes (articles, passages and cached answers), "
+        "and the full-text (FTS5) index on SQLite."
+    )
+
+    def handle(self, *args, **options):
+        tagged = kb_tags.rebuild()
+        self.stdout.write(f"Indexed {tagged} article tag(s).")
+        split = passages.rebuild()
+        self.stdout.write(f"Split articles into {split} passage(s).")
+        if settings.KB_VECTOR_INDEX_ENABLED:
+            articles, embedded = kb_vectors.rebuild()
+            self.stdout.write(f"Embedded {articles} article(s) and {embedded} passage(s) in {settings.KB_VECTOR_DIR}.")
+            answers = answer_cache.rebuild()
+            self.stdout.write(f"Embedded {answers} cached answer(s).")
+        if not kb_search.fts_available():
+            self.stdout.write(
+                "No FTS5 index on this database: run `manage.py migrate` on SQLite "
+                "(other databases use substring search)."
+            )
+            return
+        indexed = kb_search.rebuild()
+        self.stdout.write(f"Indexed {indexed} article(s).")
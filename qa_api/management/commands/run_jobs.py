@@ -0,0 +1,67 @@
+import signal
+import time
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+def _serve(stop, poll_interval):
+    """Worker process entry point (spawned, so Django is set up again here)."""
+    import django
+
+    django.setup()
+    from qa_api.jobs import work
+
+    # Ctrl-C reaches the whole process group; let the parent decide when to stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(stop=stop, poll_interval=poll_interval)
+
+
+class Command(BaseCommand):
+    help = "Run background generation jobs (?async=1) on a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.JOB_WORKERS,
+                            help="Worker processes (default JOB_WORKERS).")
+        parser.add_argument("--poll", type=float, default=settings.JOB_POLL_INTERVAL,
+                            help="Seconds between queue polls when idle (default JOB_POLL_INTERVAL).")
+        parser.add_argument("--once", action="store_true",
+                            help="Drain the queue in this process and exit.")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            from qa_api.jobs import work
+
+            ran = work(once=True, poll_interval=options["poll"])
+            self.stdout.write(f"Ran {ran} job(s).")
+            return
+
+        ctx = get_context("spawn")
+        stop = ctx.Event()
+        stopping = []
+
+        def request_stop(signum, frame):
+            # Only flag it here: setting the Event inside a handler can deadlock on its lock.
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        def start():
+            process = ctx.Process(target=_serve, args=(stop, options["poll"]), daemon=True)
+            process.start()
+            return process
+
+        processes = [start() for _ in range(max(1, options["workers"]))]
+        self.stdout.write(f"Started {len(processes)} job worker(s).")
+        while not stopping:
+            time.sleep(1.0)
+            for index, process in enumerate(processes):
+                if not process.is_alive() and not stopping:
+                    self.stderr.write(f"Job worker {process.pid} exited ({process.exitcode}); restarting.")
+                    processes[index] = start()
+        self.stdout.write("Stopping after the current jobs finish...")
+        stop.set()
+        for process in processes:
+            process.join()
@@ -0,0 +1,157 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from ai_core.limiter import current_deadline, deadline_at, deadline_scope
+
+
+def _bounded(content, deadline):
+    """Iterate streaming content with the request's deadline in force while each chunk is produced."""
+    iterator = iter(content)
+    while True:
+        with deadline_at(deadline):
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+async def _abounded(content, deadline):
+    iterator = content.__aiter__()
+    while True:
+        with deadline_at(deadline):
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+        yield chunk
+
+
+class LLMDeadlineMiddleware:
+    """
+    Gives every LLM call made while handling a request a deadline: the
+    client's X-Request-Timeout header (seconds), capped at LLM_REQUEST_DEADLINE.
+    The limiter stops queueing and retrying once it passes. Streamed
+    responses (SSE, NDJSON) make their calls after the view returns, so their
+    content is iterated under the same absolute deadline.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _seconds(self, request):
+        limit = settings.LLM_REQUEST_DEADLINE
+        try:
+            requested = float(request.headers.get("X-Request-Timeout", ""))
+        except ValueError:
+            return limit
+        return min(limit, requested) if requested > 0 else limit
+
+    def _bound_stream(self, response, deadline):
+        if getattr(response, "streaming", False):
+            if response.is_async:
+                response.streaming_content = _abounded(response.streaming_content, deadline)
+            else:
+                response.streaming_content = _bounded(response.streaming_content, deadline)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with deadline_scope(self._seconds(request)):
+            response = self.get_response(request)
+            deadline = current_deadline()
+        return self._bound_stream(response, deadline)
+
+    async def __acall__(self, request):
+        with deadline_scope(self._seconds(request)):
+            response = await self.get_response(request)
+            deadline = current_deadline()
+        return self._bound_stream(response, deadline)
+
+
+class QueryStats:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# The request being counted; context variables follow the request into sync_to_async threads
+_request_stats = ContextVar("request_query_stats", default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.seconds += time.perf_counter() - started
+
+
+def _install(connection, **kwargs):
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+class QueryStatsMiddleware:
+    """
+    Counts the database queries a request runs and times them and the whole
+    request. With QUERY_STATS_HEADERS on, the numbers are returned in
+    X-DB-Queries, X-DB-Time-Ms and X-Response-Time-Ms plus a Server-Timing
+    header (streamed responses report what ran before streaming started).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        # every connection, including ones opened later in other threads
+        connection_created.connect(_install, dispatch_uid="qa_api.query_stats")
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+
+    def _report(self, response, stats, started):
+        if not settings.QUERY_STATS_HEADERS:
+            return response
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = stats.seconds * 1000
+        response["X-DB-Queries"] = str(stats.queries)
+        response["X-DB-Time-Ms"] = f"{db_ms:.1f}"
+        response["X-Response-Time-Ms"] = f"{total_ms:.1f}"
+        response["Server-Timing"] = f'db;dur={db_ms:.1f};desc="{stats.queries} queries", total;dur={total_ms:.1f}'
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, started = QueryStats(), time.perf_counter()
+        token = _request_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self._report(response, stats, started)
+
+    async def __acall__(self, request):
+        stats, started = QueryStats(), time.perf_counter()
+        token = _request_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self._report(response, stats, started)
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa_api', '0004_alter_team_key_contacts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('call_type', models.CharField(max_length=30)),
+                ('artifact_type', models.CharField(blank=True, max_length=30)),
+                ('source', models.CharField(blank=True, max_length=50)),
+                ('prompt_tokens', models.IntegerField(default=0)),
+                ('completion_tokens', models.IntegerField(default=0)),
+                ('tokens_estimated', models.BooleanField(default=False)),
+                ('latency_ms', models.IntegerField(default=0)),
+                ('success', models.BooleanField(default=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa_api', '0005_llmcall'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64)),
+                ('extractor_version', models.CharField(max_length=50)),
+                ('text', models.BinaryField()),
+                ('size', models.IntegerField()),
+                ('chars', models.IntegerField(default=0)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sha256', 'extractor_version'), name='extractedtext_unique_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# External-content FTS5 index over KnowledgeBase, kept in sync by triggers so
+# bulk_create/update()/raw SQL writes are covered too (signals would miss them).
+CREATE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS qa_api_knowledgebase_fts USING fts5(
+        title, content, tags,
+        content='qa_api_knowledgebase', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS qa_api_knowledgebase_fts_ai AFTER INSERT ON qa_api_knowledgebase BEGIN
+        INSERT INTO qa_api_knowledgebase_fts(rowid, title, content, tags)
+        VALUES (new.id, new.title, new.content, new.tags);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS qa_api_knowledgebase_fts_ad AFTER DELETE ON qa_api_knowledgebase BEGIN
+        INSERT INTO qa_api_knowledgebase_fts(qa_api_knowledgebase_fts, rowid, title, content, tags)
+        VALUES ('delete', old.id, old.title, old.content, old.tags);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS qa_api_knowledgebase_fts_au AFTER UPDATE ON qa_api_knowledgebase BEGIN
+        INSERT INTO qa_api_knowledgebase_fts(qa_api_knowledgebase_fts, rowid, title, content, tags)
+        VALUES ('delete', old.id, old.title, old.content, old.tags);
+        INSERT INTO qa_api_knowledgebase_fts(rowid, title, content, tags)
+        VALUES (new.id, new.title, new.content, new.tags);
+    END
+    """,
+    # Per-term document counts, used to leave near-zero-IDF terms out of OR queries
+    "CREATE VIRTUAL TABLE IF NOT EXISTS qa_api_knowledgebase_fts_vocab "
+    "USING fts5vocab(qa_api_knowledgebase_fts, 'row')",
+    "INSERT INTO qa_api_knowledgebase_fts(qa_api_knowledgebase_fts) VALUES ('rebuild')",
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS qa_api_knowledgebase_fts_ai",
+    "DROP TRIGGER IF EXISTS qa_api_knowledgebase_fts_ad",
+    "DROP TRIGGER IF EXISTS qa_api_knowledgebase_fts_au",
+    "DROP TABLE IF EXISTS qa_api_knowledgebase_fts_vocab",
+    "DROP TABLE IF EXISTS qa_api_knowledgebase_fts",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return  # qa_api.kb_search falls back to substring matching elsewhere
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa_api', '0007_generationjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
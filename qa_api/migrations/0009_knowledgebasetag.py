@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_existing_tags(apps, schema_editor):
+    # Same normalization as qa_api.kb_tags.normalize, frozen here for the migration
+    KnowledgeBase = apps.get_model('qa_api', 'KnowledgeBase')
+    KnowledgeBaseTag = apps.get_model('qa_api', 'KnowledgeBaseTag')
+    rows = []
+    for pk, tags in KnowledgeBase.objects.values_list('id', 'tags').iterator():
+        seen = set()
+        for tag in tags if isinstance(tags, list) else []:
+            if not isinstance(tag, str):
+                continue
+            tag = " ".join(tag.split()).lower()[:100]
+            if tag and tag not in seen:
+                seen.add(tag)
+                rows.append(KnowledgeBaseTag(article_id=pk, tag=tag))
+    KnowledgeBaseTag.objects.bulk_create(rows, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa_api', '0008_knowledgebase_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeBaseTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=100)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_index', to='qa_api.knowledgebase')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tag', 'article'], name='knowledgebasetag_tag')],
+                'constraints': [models.UniqueConstraint(fields=('article', 'tag'), name='knowledgebasetag_unique')],
+            },
+        ),
+        migrations.RunPython(index_existing_tags, migrations.RunPython.noop),
+    ]
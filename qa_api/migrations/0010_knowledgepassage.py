@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def split_existing_articles(apps, schema_editor):
+    # Vectors for these passages come from `manage.py rebuild_kb_index`
+    from ai_core.tokens import count_tokens
+    from qa_api.passages import split_passages
+
+    KnowledgeBase = apps.get_model('qa_api', 'KnowledgeBase')
+    KnowledgePassage = apps.get_model('qa_api', 'KnowledgePassage')
+    rows = []
+    for pk, content in KnowledgeBase.objects.values_list('id', 'content').iterator():
+        for position, (start, end) in enumerate(split_passages(content or "")):
+            text = content[start:end]
+            rows.append(KnowledgePassage(article_id=pk, position=position, start=start, end=end,
+                                         text=text, tokens=count_tokens(text)))
+    KnowledgePassage.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa_api', '0009_knowledgebasetag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgePassage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('start', models.IntegerField()),
+                ('end', models.IntegerField()),
+                ('text', models.TextField()),
+                ('tokens', models.IntegerField()),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='passages', to='qa_api.knowledgebase')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('article', 'position'), name='knowledgepassage_unique_position')],
+            },
+        ),
+        migrations.RunPython(split_existing_articles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa_api', '0010_knowledgepassage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qaquery',
+            name='cache_stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='qaquery',
+            name='cached_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cache_hits', to='qa_api.qaquery'),
+        ),
+        migrations.AddField(
+            model_name='qaquery',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='qaquery',
+            name='sources',
+            field=models.ManyToManyField(blank=True, related_name='answers', to='qa_api.knowledgebase'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# Re-index an article only when an indexed column changes. The 0008 trigger fired
+# on every UPDATE, so each usage_count flush (qa_api.counters) rewrote the FTS rows.
+DROP = "DROP TRIGGER IF EXISTS qa_api_knowledgebase_fts_au"
+
+TRIGGER = """
+    CREATE TRIGGER qa_api_knowledgebase_fts_au AFTER UPDATE{columns} ON qa_api_knowledgebase BEGIN
+        INSERT INTO qa_api_knowledgebase_fts(qa_api_knowledgebase_fts, rowid, title, content, tags)
+        VALUES ('delete', old.id, old.title, old.content, old.tags);
+        INSERT INTO qa_api_knowledgebase_fts(rowid, title, content, tags)
+        VALUES (new.id, new.title, new.content, new.tags);
+    END
+"""
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return  # no FTS index outside SQLite (see 0008)
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa_api', '0011_qaquery_answer_cache'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run([DROP, TRIGGER.format(columns=" OF title, content, tags")]),
+            run([DROP, TRIGGER.format(columns="")]),
+        ),
+    ]
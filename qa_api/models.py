@@ -1,4 +1,7 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
@@ -38,6 +41,45 @@ class KnowledgeBase(models.Model):
         return self.title
 
 
+class KnowledgeBaseTag(models.Model):
+    """
+    One (article, tag) pair of KnowledgeBase.tags, normalized, so tag filters
+    and facet counts are indexed lookups on any database (qa_api.kb_tags).
+    """
+    article = models.ForeignKey(KnowledgeBase, on_delete=models.CASCADE, related_name='tag_index')
+    tag = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["article", "tag"], name="knowledgebasetag_unique"),
+        ]
+        indexes = [models.Index(fields=["tag", "article"], name="knowledgebasetag_tag")]
+
+    def __str__(self):
+        return self.tag
+
+
+class KnowledgePassage(models.Model):
+    """
+    An overlapping window of a KnowledgeBase article's content, the unit the
+    assistant retrieves and puts in its prompt (qa_api.passages).
+    """
+    article = models.ForeignKey(KnowledgeBase, on_delete=models.CASCADE, related_name='passages')
+    position = models.IntegerField()  # 0-based order within the article
+    start = models.IntegerField()  # text == article.content[start:end]
+    end = models.IntegerField()
+    text = models.TextField()
+    tokens = models.IntegerField()  # estimated, ai_core.tokens.count_tokens
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["article", "position"], name="knowledgepassage_unique_position"),
+        ]
+
+    def __str__(self):
+        return f"{self.article_id}#{self.position}"
+
+
 class QAQuery(models.Model):
     question = models.TextField()
     response = models.TextField()
@@ -45,6 +87,13 @@ class QAQuery(models.Model):
     project_team = models.ForeignKey(Team, on_delete=models.SET_NULL, null=True)
     response_time = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # answer cache (qa_api.answer_cache): team + normalized question, the articles the prompt drew on,
+    # the answer this one was served from, and whether a KB change has outdated it
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True)
+    sources = models.ManyToManyField(KnowledgeBase, blank=True, related_name='answers')
+    cached_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='cache_hits')
+    cache_stale = models.BooleanField(default=False)
 
 
 class FAQ(models.Model):
@@ -52,4 +101,76 @@ class FAQ(models.Model):
     answer = models.TextField()
     category = models.CharField(max_length=50)
     project_team = models.ForeignKey(Team, on_delete=models.CASCADE, null=True, blank=True)
-    frequency = models.IntegerField(default=0)
\ No newline at end of file
+    frequency = models.IntegerField(default=0)
+
+class LLMCall(models.Model):
+    """One upstream LLM call with its token usage, recorded by ai_core.usage.MeteredProvider."""
+    model = models.CharField(max_length=100)
+    call_type = models.CharField(max_length=30)  # generate, chat, stream_generate, stream_chat
+    artifact_type = models.CharField(max_length=30, blank=True)  # test_cases, test_plan, assistant, ...
+    source = models.CharField(max_length=50, blank=True)
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    tokens_estimated = models.BooleanField(default=False)  # True when the API did not report usage
+    latency_ms = models.IntegerField(default=0)
+    success = models.BooleanField(default=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.model} {self.call_type} ({self.prompt_tokens}+{self.completion_tokens})"
+
+
+class ExtractedText(models.Model):
+    """Parsed text of a PDF/DOCX upload, keyed by content hash, so re-uploads skip parsing (qa_api.textcache)."""
+    sha256 = models.CharField(max_length=64)
+    extractor_version = models.CharField(max_length=50)
+    text = models.BinaryField()  # zlib-compressed UTF-8
+    size = models.IntegerField()  # compressed bytes, counted against EXTRACTED_TEXT_CACHE_MAX_BYTES
+    chars = models.IntegerField(default=0)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sha256", "extractor_version"], name="extractedtext_unique_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.chars} chars)"
+
+
+class GenerationJob(models.Model):
+    """A generate/... request run in the background (?async=1) by `manage.py run_jobs` (qa_api.jobs)."""
+    QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    endpoint = models.CharField(max_length=200)  # request path the job was submitted to
+    artifact_type = models.CharField(max_length=30, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    payload = models.JSONField()  # built prompt, chunked job or batch prompts, plus meta
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)  # earliest next attempt (retry backoff)
+    worker = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)  # a running job past this lost its worker
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)  # result purged after this
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"], name="generationjob_ready")]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.status} ({self.id})"
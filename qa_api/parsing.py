@@ -1,28 +1,148 @@
+import codecs
+import mmap
+import os
+import re
+from contextlib import contextmanager
+
+import PyPDF2
 from PyPDF2 import PdfReader
 from docx import Document as Docx
 
+TEXT_CHUNK_BYTES = 64 * 1024
+
+# Part of the extracted-text cache key: bump the leading number whenever the
+# extraction output changes, so cached text from older parsers is not reused.
+EXTRACTOR_VERSION = f"2/pypdf2-{PyPDF2.__version__}"
+
+# DOCX heading styles become markdown headings ("## Login") so qa_api.sections
+# and the chunker see the document structure in the extracted text.
+_DOCX_HEADING_STYLE = re.compile(r"^Heading (\d)$")
+_SPACES = re.compile(r"\s+")
+
+
+def heading_line(level, title):
+    return "#" * max(1, min(level, 6)) + " " + title.strip()
+
+
+@contextmanager
+def _mapped(source):
+    """Memory-map a path so parsers page it in on demand instead of reading it whole."""
+    if not isinstance(source, (str, os.PathLike)):
+        yield source
+        return
+    with open(source, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+
+def count_pdf_pages(source):
+    """Page count of a PDF path or file object."""
+    with _mapped(source) as stream:
+        return len(PdfReader(stream).pages)
+
+
+def pdf_outline(reader):
+    """{page index: [(level, title), ...]} from a PDF's outline (bookmarks); {} if it has none or it is broken."""
+    headings = {}
+
+    def walk(items, level):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            title = _SPACES.sub(" ", str(getattr(item, "title", "") or "")).strip()
+            if title:
+                headings.setdefault(reader.get_destination_page_number(item), []).append((level, title))
+
+    try:
+        walk(reader.outline, 1)
+    except Exception:
+        return {}
+    return headings
+
+
+def _mark_headings(text, headings):
+    """Turn the lines a page's outline entries point at into markdown headings (or add them on top)."""
+    lines = text.splitlines()
+    missing = []
+    for level, title in headings:
+        wanted = title.lower()
+        for index, line in enumerate(lines):
+            if _SPACES.sub(" ", line).strip().lower() == wanted:
+                lines[index] = heading_line(level, title)
+                break
+        else:
+            missing.append(heading_line(level, title))
+    return "\n".join(missing + lines)
+
+
+def extract_pdf_pages(source, start=0, end=None):
+    """
+    Text of pages [start, end) of a PDF, non-empty pages joined by blank lines,
+    with outline entries marked as markdown headings.
+    """
+    with _mapped(source) as stream:
+        reader = PdfReader(stream)
+        outline = pdf_outline(reader)
+        pages = []
+        first = start or 0
+        for number, p in enumerate(reader.pages[start:end], start=first):
+            t = p.extract_text() or ""
+            if number in outline:
+                t = _mark_headings(t, outline[number])
+            if t.strip():
+                pages.append(t)
+        return "\n\n".join(pages)
+
+
+def extract_docx(source):
+    """Paragraph text of a DOCX, with Title/Heading N paragraphs written as markdown headings."""
+    # Not mapped: zipfile needs a seekable file, and it only reads the members it is asked for.
+    doc = Docx(os.fspath(source) if isinstance(source, os.PathLike) else source)
+    lines = []
+    for p in doc.paragraphs:
+        if not p.text.strip():
+            continue
+        style = p.style.name if p.style is not None else ""
+        match = _DOCX_HEADING_STYLE.match(style)
+        if match:
+            lines.append(heading_line(int(match.group(1)), p.text))
+        elif style == "Title":
+            lines.append(heading_line(1, p.text))
+        else:
+            lines.append(p.text)
+    return "\n".join(lines)
+
+
+def iter_text(django_file, chunk_bytes=TEXT_CHUNK_BYTES):
+    """Decode a text upload as UTF-8 in fixed-size chunks (never the whole file at once)."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    django_file.seek(0)
+    while True:
+        raw = django_file.read(chunk_bytes)
+        if not raw:
+            break
+        text = decoder.decode(raw)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
 def extract_text_from_upload(django_file):
     name = (django_file.name or "").lower()
     if name.endswith(".pdf"):
         try:
-            reader = PdfReader(django_file)
-            pages = []
-            for p in reader.pages:
-                t = p.extract_text() or ""
-                if t.strip():
-                    pages.append(t)
-            return "\n\n".join(pages)
+            return extract_pdf_pages(django_file)
         except Exception:
             return ""
     if name.endswith(".docx"):
         try:
-            doc = Docx(django_file)
-            return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
+            return extract_docx(django_file)
         except Exception:
             return ""
     # fallback: read bytes as text
     try:
-        raw = django_file.read()
-        return raw.decode("utf-8", errors="ignore")
+        return "".join(iter_text(django_file))
     except Exception:
         return ""
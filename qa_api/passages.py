@@ -0,0 +1,200 @@
+"""
+Passage store for KnowledgeBase articles.
+
+Each article's content is split into overlapping windows of about
+KB_PASSAGE_TOKENS tokens on sentence boundaries (KnowledgePassage rows,
+re-split when the article is saved, see qa_api.signals). The assistant
+retrieves the passages that best answer a question and packs them into its
+KB token budget, instead of the first part of each matched article.
+"""
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from ai_core.tokens import count_tokens, truncate_to_tokens
+
+from . import kb_vectors
+from .models import KnowledgeBase, KnowledgePassage
+from .vector_index import tokens as content_words
+
+# A sentence (up to terminal punctuation followed by whitespace) or the rest of a line
+_UNIT = re.compile(r"\S.*?(?:[.!?](?=\s)|$)", re.MULTILINE)
+
+PASSAGE_CANDIDATES = 20  # passages fetched from the passage vector index per question
+LEXICAL_WEIGHT = 0.5  # share of question words a passage contains, added to its cosine similarity
+ARTICLE_PRIOR = 0.1  # bonus for passages of the articles ranked first by kb_search.hybrid_ranking
+
+
+def _units(text, max_tokens):
+    """(start, end, tokens) of the sentences of text; sentences over max_tokens are cut into pieces."""
+    for match in _UNIT.finditer(text):
+        start, end = match.span()
+        while start < end:
+            piece = text[start:end]
+            tokens = count_tokens(piece)
+            if tokens > max_tokens:
+                # one word longer than a passage (a URL, encoded data) is cut by characters
+                piece = truncate_to_tokens(piece, max_tokens) or piece[:max_tokens * 4]
+                tokens = count_tokens(piece)
+            yield start, start + len(piece), tokens
+            start += len(piece)
+            while start < end and text[start].isspace():
+                start += 1
+
+
+def split_passages(text, max_tokens=None, overlap_tokens=None):
+    """
+    [(start, end)] character spans of text covering all of it in windows of
+    at most max_tokens, each repeating up to overlap_tokens of trailing
+    sentences from the one before so an answer spanning a boundary stays whole.
+    """
+    max_tokens = max_tokens or settings.KB_PASSAGE_TOKENS
+    overlap_tokens = settings.KB_PASSAGE_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    units = list(_units(text or "", max_tokens))
+    spans, first = [], 0
+    while first < len(units):
+        last, used = first, units[first][2]
+        while last + 1 < len(units) and used + units[last + 1][2] <= max_tokens:
+            last += 1
+            used += units[last][2]
+        spans.append((units[first][0], units[last][1]))
+        if last + 1 >= len(units):
+            break
+        # step back over trailing sentences worth overlap_tokens, always moving forward
+        following, repeated = last + 1, 0
+        while following - 1 > first and repeated + units[following - 1][2] <= overlap_tokens:
+            following -= 1
+            repeated += units[following][2]
+        first = following
+    return spans
+
+
+def build(article):
+    """Unsaved KnowledgePassage rows for the article's current content."""
+    content = article.content or ""
+    return [
+        KnowledgePassage(article=article, position=position, start=start, end=end,
+                         text=content[start:end], tokens=count_tokens(content[start:end]))
+        for position, (start, end) in enumerate(split_passages(content))
+    ]
+
+
+def sync(article):
+    """
+    Re-split the article if its content changed; returns the ids of the
+    passages removed (for the vector index), [] when nothing changed.
+    """
+    wanted = build(article)
+    current = list(KnowledgePassage.objects.filter(article=article).order_by("position").values_list("id", "text"))
+    if [text for _, text in current] == [p.text for p in wanted]:
+        return []
+    with transaction.atomic():
+        removed = [pk for pk, _ in current]
+        KnowledgePassage.objects.filter(id__in=removed).delete()
+        KnowledgePassage.objects.bulk_create(wanted)
+    return removed
+
+
+def sync_many(articles):
+    """
+    sync() for a batch of saved articles (bulk imports): one read, then one
+    delete and one insert for the articles whose content changed. Returns the
+    ids of the passages removed.
+    """
+    current = defaultdict(list)
+    for pk, article_id, text in KnowledgePassage.objects.filter(
+        article_id__in=[article.pk for article in articles]
+    ).order_by("article_id", "position").values_list("id", "article_id", "text"):
+        current[article_id].append((pk, text))
+    removed, rows = [], []
+    for article in articles:
+        wanted = build(article)
+        existing = current.get(article.pk, [])
+        if [text for _, text in existing] != [p.text for p in wanted]:
+            removed.extend(pk for pk, _ in existing)
+            rows.extend(wanted)
+    with transaction.atomic():
+        if removed:
+            KnowledgePassage.objects.filter(id__in=removed).delete()
+        KnowledgePassage.objects.bulk_create(rows)
+    return removed
+
+
+def rebuild(batch_size=500):
+    """Re-split every article; returns the number of passages written."""
+    written = 0
+    with transaction.atomic():
+        KnowledgePassage.objects.all().delete()
+        rows = []
+        for article in KnowledgeBase.objects.only("id", "content").iterator(chunk_size=batch_size):
+            rows.extend(build(article))
+            if len(rows) >= batch_size:
+                KnowledgePassage.objects.bulk_create(rows)
+                written += len(rows)
+                rows = []
+        KnowledgePassage.objects.bulk_create(rows)
+    return written + len(rows)
+
+
+def _merge(chosen):
+    """Join passages of one article that overlap or touch into single spans, in document order."""
+    merged = []
+    for passage in sorted(chosen, key=lambda p: p["start"]):
+        previous = merged[-1] if merged else None
+        if previous and passage["start"] <= previous["end"]:
+            previous["text"] += passage["text"][previous["end"] - passage["start"]:]
+            previous["end"] = max(previous["end"], passage["end"])
+            previous["score"] = max(previous["score"], passage["score"])
+        else:
+            merged.append(dict(passage))
+    return merged
+
+
+def best_passages(question, articles, max_tokens, team_id=None, category=None, include_universal=False):
+    """
+    The passages that best answer question, within max_tokens in total, as
+    [{"article_id", "title", "category", "text", "score", "start", "end"}]
+    ordered by article relevance and then position. Candidates are the
+    passages of `articles` (ranked KB hits) plus the closest ones in the
+    passage vector index under the same team/category filter.
+    """
+    article_rank = {article.pk: rank for rank, article in enumerate(articles)}
+    semantic = dict(kb_vectors.search_passages(question, limit=PASSAGE_CANDIDATES, team_id=team_id,
+                                               category=category, include_universal=include_universal))
+    candidates = KnowledgePassage.objects.filter(
+        article_id__in=list(article_rank)
+    ) if article_rank else KnowledgePassage.objects.none()
+    rows = list(
+        (candidates | KnowledgePassage.objects.filter(id__in=list(semantic)))
+        .select_related("article").only("id", "position", "start", "end", "text", "tokens",
+                                        "article__id", "article__title", "article__category")
+    )
+    missing = [row.id for row in rows if row.id not in semantic]
+    semantic.update(kb_vectors.score_passages(question, missing))
+
+    words = set(content_words(question))
+    scored = []
+    for row in rows:
+        lexical = len(words & set(content_words(row.text))) / len(words) if words else 0.0
+        similarity = max(0.0, semantic.get(row.id, 0.0))
+        if lexical == 0 and similarity < settings.KB_VECTOR_MIN_SCORE:
+            continue
+        rank = article_rank.get(row.article_id)
+        prior = ARTICLE_PRIOR / (1 + rank) if rank is not None else 0.0
+        scored.append((similarity + LEXICAL_WEIGHT * lexical + prior, row))
+
+    chosen, used = {}, 0
+    for score, row in sorted(scored, key=lambda item: item[0], reverse=True):
+        if used + row.tokens > max_tokens:
+            continue
+        used += row.tokens
+        chosen.setdefault(row.article_id, []).append({
+            "article_id": row.article_id, "title": row.article.title, "category": row.article.category,
+            "text": row.text, "score": round(score, 4), "start": row.start, "end": row.end,
+        })
+
+    ordered = sorted(chosen, key=lambda pk: (article_rank.get(pk, len(article_rank)),
+                                             -max(p["score"] for p in chosen[pk])))
+    return [passage for pk in ordered for passage in _merge(chosen[pk])]
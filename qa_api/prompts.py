@@ -1,3 +1,7 @@
+from ai_core.budget import PromptBudget
+from ai_core.factory import get_provider
+from ai_core.tokens import count_tokens
+
 TEST_CASE_SCHEMA = """Return JSON with this exact shape:
 {
   "test_cases": [
@@ -56,11 +60,46 @@ def build_requirement_text(
     if acceptance_criteria:
         parts.append(f"Acceptance Criteria:\n{acceptance_criteria.strip()}")
     if doc_text:
-        # avoid sending overly large text blocks
-        parts.append(f"Document Extracts:\n{doc_text.strip()[:50000]}")
+        # size is governed by budget_requirement_text(), not a character cut
+        parts.append(f"Document Extracts:\n{doc_text.strip()}")
 
     return "\n\n".join(parts)
 
+def budget_requirement_text(
+    user_story: str = "",
+    acceptance_criteria: str = "",
+    feature_description: str = "",
+    doc_text: str = "",
+    app_context: str = "",
+    overhead_text: str = "",
+    model: str = None,
+    meta: dict = None,
+):
+    """
+    build_requirement_text() fitted to the model's prompt token budget.
+    overhead_text is the rest of the prompt (instructions and schema) and is
+    never trimmed; document extracts are trimmed first, app context last.
+    Without an explicit model, the budget is sized for the model the provider
+    will route a call with this meta and the untrimmed prompt size to.
+    Returns (requirement_text, budget).
+    """
+    if model is None:
+        sections = (overhead_text, app_context, user_story, acceptance_criteria, feature_description, doc_text)
+        model = get_provider().target_model(meta, sum(count_tokens(text or "") for text in sections))
+    budget = PromptBudget(model)
+    budget.add("instructions_and_schema", overhead_text, fixed=True)
+    budget.add("app_context", app_context, priority=1)
+    budget.add("user_story", user_story, priority=2)
+    budget.add("acceptance_criteria", acceptance_criteria, priority=2)
+    budget.add("feature_description", feature_description, priority=3)
+    budget.add("doc_text", doc_text, priority=4)
+    kept = budget.allocate()
+    requirement_text = build_requirement_text(
+        kept["user_story"], kept["acceptance_criteria"], kept["feature_description"],
+        kept["doc_text"], kept["app_context"]
+    )
+    return requirement_text, budget
+
 def test_case_prompt(app_context: str, requirement_text: str, max_cases: int = 10) -> str:
     """
     Build a prompt for generating structured test cases in Gherkin style.
@@ -95,4 +134,25 @@ Instructions:
 - Include environments, entry/exit criteria, risks and mitigations.
 - Strictly follow this JSON schema:
 {TEST_PLAN_SCHEMA}
-"""
\ No newline at end of file
+"""
+
+def chunk_summary_prompt(app_context: str, chunk_text: str, index: int, total: int) -> str:
+    """
+    Build a prompt that condenses one section of a large document into the
+    facts a test plan needs (map step of chunked test plan generation).
+    """
+    return f"""
+You are a QA lead reading part {index} of {total} of a requirements document.
+
+Application Context:
+{app_context.strip()}
+
+Document Extract:
+{chunk_text.strip()}
+
+Instructions:
+- Summarise only what matters for test planning: features, business rules,
+  integrations, non-functional requirements, environments, data needs, risks.
+- Use short bullet points grouped under those headings; skip empty headings.
+- Do not invent requirements that are not in the extract.
+"""
@@ -0,0 +1,113 @@
+"""
+Knowledge retrieval for one QA assistant request.
+
+RetrievalPipeline ranks candidate articles once (kb_search.hybrid_ranking),
+loads them in one projected query and re-orders them by a popularity prior,
+picks the answering passages in one more query (qa_api.passages) and reads
+the team in one more. The system prompt's knowledge section and the
+response's related_docs both come from that one result set.
+
+related_docs keeps the KnowledgeBaseSerializer shape (content and the nested
+team, read in the same query) unless the client asks for the compact
+version 2 with ?related_docs_version=2.
+"""
+from django.conf import settings
+
+from . import counters, kb_search, passages
+from .models import KnowledgeBase, Team
+from .serializers import CompactRelatedDocumentSerializer, RelatedDocumentSerializer, TeamSerializer
+
+RELATED_DOCS_V1, RELATED_DOCS_V2 = 1, 2
+# Columns read for ranked articles: enough for compact related_docs, never content
+ARTICLE_FIELDS = (
+    "id", "title", "category", "tags", "last_updated", "usage_count", "project_team_id", "project_team__name",
+)
+# ...plus what version 1 related_docs show: content and the whole team
+V1_ARTICLE_FIELDS = ARTICLE_FIELDS + ("content", "created_by") + tuple(
+    f"project_team__{field}" for field in TeamSerializer.Meta.fields if field != "name"
+)
+TEAM_FIELDS = ("id", "name", "description", "tech_stack", "key_contacts")
+
+
+def related_docs_version(params):
+    """RELATED_DOCS_V2 when the client asked for it (?related_docs_version=2), otherwise RELATED_DOCS_V1."""
+    return RELATED_DOCS_V2 if params.get("related_docs_version") == "2" else RELATED_DOCS_V1
+
+
+class RetrievalPipeline:
+    """
+    Everything the assistant retrieves for a question, fetched by run():
+    `articles` (ranked, best first), `passages` (packed into token_budget)
+    and `team`. With a team, candidates are its articles plus universal
+    ones; without, every article can be related but only universal ones
+    feed the prompt, as before.
+    """
+
+    def __init__(self, question, team_id=None, limit=5, related_limit=3, token_budget=None,
+                 related_version=RELATED_DOCS_V1):
+        self.question = question
+        self.team_id = team_id or None
+        self.limit = limit
+        self.related_limit = related_limit
+        self.token_budget = token_budget or settings.ASSISTANT_KB_TOKENS
+        self.related_version = related_version
+        self.articles = []
+        self.passages = []
+        self.team = None
+
+    def run(self):
+        rows = kb_search.hybrid_ranking(
+            self.question, team_id=self.team_id, include_universal=True,
+            limit=max(2 * self.limit, self.related_limit),
+        )
+        fields = ARTICLE_FIELDS if self.related_version == RELATED_DOCS_V2 else V1_ARTICLE_FIELDS
+        queryset = KnowledgeBase.objects.select_related("project_team").only(*fields)
+        self.articles = kb_search.popularity_ranked(kb_search.load(rows, queryset)) if rows else []
+
+        self.passages = passages.best_passages(
+            self.question, self.prompt_articles(), self.token_budget,
+            team_id=self.team_id, include_universal=self.team_id is not None,
+            category=None if self.team_id else "universal",
+        )
+        # usage_count: articles whose passages went into the prompt, written behind (qa_api.counters)
+        counters.kb_usage.add_many({passage["article_id"] for passage in self.passages})
+        if self.team_id:
+            self.team = Team.objects.only(*TEAM_FIELDS).filter(pk=self.team_id).first()
+        return self
+
+    def prompt_articles(self):
+        """Ranked articles allowed in the prompt: up to `limit` universal and `limit` of the team's."""
+        universal = [a for a in self.articles if a.category == "universal"][:self.limit]
+        project = [a for a in self.articles if self.team_id and a.project_team_id == self.team_id and
+                   a.category != "universal"][:self.limit]
+        return project + universal
+
+    def knowledge_text(self):
+        """The prompt's knowledge section: retrieved passages grouped as universal or project knowledge."""
+        universal = [p for p in self.passages if p["category"] == "universal"]
+        project_specific = [p for p in self.passages if p["category"] != "universal"]
+        text = ""
+        if universal:
+            text += "Universal QA Standards:\n"
+            for passage in universal:
+                text += f"- {passage['title']}: {passage['text']}\n"
+        if project_specific:
+            text += "\nProject-Specific Knowledge:\n"
+            for passage in project_specific:
+                text += f"- {passage['title']}: {passage['text']}\n"
+        return text
+
+    def project_text(self):
+        if self.team is None:
+            return ""
+        return f"""
+                Current Project: {self.team.name}
+                Description: {self.team.description or ''}
+                Tech Stack: {self.team.tech_stack or ''}
+                Key Contacts: {self.team.key_contacts or ''}
+                """
+
+    def related_docs(self):
+        serializer = (CompactRelatedDocumentSerializer if self.related_version == RELATED_DOCS_V2
+                      else RelatedDocumentSerializer)
+        return serializer(self.articles[:self.related_limit], many=True).data
@@ -0,0 +1,102 @@
+import re
+
+# Headings in extracted text: markdown ones written by extraction (DOCX heading
+# styles, PDF outline) and numbered ones found in plain text ("3.2 Login", "4) Payments").
+_MARKDOWN = re.compile(r"^\s*(#{1,6})\s+(\S.*?)\s*#*\s*$")
+_NUMBERED = re.compile(r"^\s*(\d{1,3}(?:\.\d{1,3}){0,5})[.)]?\s+([A-Z][^\n]*?)\s*$")
+_NUMBER = re.compile(r"^(\d{1,3}(?:\.\d{1,3}){0,5})\.?(?:\s+|$)")
+_WORD = re.compile(r"[a-z0-9]+")
+
+MAX_HEADING_CHARS = 120
+MAX_HEADING_WORDS = 14
+
+
+class Section:
+    """A heading and the span of text it governs, subsections included: text[start:end]."""
+
+    def __init__(self, level, title, number, start):
+        self.level = level
+        self.title = title
+        self.number = number
+        self.start = start
+        self.end = None
+
+    def __repr__(self):
+        return f"Section({self.level}, {self.title!r}, {self.start}:{self.end})"
+
+
+def _numbered_heading(line):
+    match = _NUMBERED.match(line)
+    if not match:
+        return None
+    title = match.group(2)
+    # Numbered list items read like sentences; headings are short and unpunctuated.
+    if title[-1] in ".:;," or len(title.split()) > MAX_HEADING_WORDS:
+        return None
+    return match.group(1), title
+
+
+def build_index(text):
+    """Sections of the text in document order, each ending where a heading of the same or higher level starts."""
+    sections = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if stripped and len(stripped) <= MAX_HEADING_CHARS:
+            match = _MARKDOWN.match(stripped)
+            if match:
+                title = match.group(2)
+                number = _NUMBER.match(title)
+                sections.append(Section(len(match.group(1)), title, number.group(1) if number else None, offset))
+            else:
+                numbered = _numbered_heading(stripped)
+                if numbered:
+                    number, title = numbered
+                    sections.append(Section(number.count(".") + 1, f"{number} {title}", number, offset))
+        offset += len(line)
+
+    for index, section in enumerate(sections):
+        section.end = len(text)
+        for later in sections[index + 1:]:
+            if later.level <= section.level:
+                section.end = later.start
+                break
+    return sections
+
+
+def _matches(section, query):
+    number = _NUMBER.match(query)
+    if number and section.number is not None:
+        return section.number == number.group(1)
+    # the query's words as a run of the title's whole words: "UI" must not match "Build Pipeline"
+    words = _WORD.findall(query.lower())
+    title = _WORD.findall(section.title.lower())
+    return bool(words) and any(title[i:i + len(words)] == words for i in range(len(title) - len(words) + 1))
+
+
+def find_sections(index, queries):
+    """Sections whose number or title matches any query ("3.2", "Login", "payment refunds")."""
+    queries = [q.strip() for q in queries if q and q.strip()]
+    return [section for section in index if any(_matches(section, q) for q in queries)]
+
+
+def select_sections(text, queries, index=None):
+    """
+    Text of the sections matching the queries, subsections included, in
+    document order and without overlap; "" when nothing matches.
+    """
+    index = build_index(text) if index is None else index
+    spans = sorted((s.start, s.end) for s in find_sections(index, queries))
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return "\n\n".join(text[start:end].strip() for start, end in merged)
+
+
+def outline(index, max_entries=30):
+    """Top-level-first heading titles, for error messages listing what can be selected."""
+    top = min((s.level for s in index), default=1)
+    return [s.title for s in index if s.level == top][:max_entries]
@@ -1,3 +1,5 @@
+import re
+
 from rest_framework import serializers
 from .models import Team, FAQ, KnowledgeBase, QAQuery
 
@@ -9,6 +11,32 @@ class PromptSerializer(serializers.Serializer):
     team_id = serializers.IntegerField(required=True)
     max_cases = serializers.IntegerField(required=False, default=8, min_value=1, max_value=50)
 
+# Jira issue key, e.g. PAY-123. Keys end up inside a JQL `key in (...)` clause.
+STORY_KEY_RE = re.compile(r"^[A-Z][A-Z0-9_]+-\d+$")
+
+
+class BatchItemSerializer(PromptSerializer):
+    # Either the PromptSerializer fields or a Jira story key to pull them from
+    story_key = serializers.CharField(required=False, allow_blank=True)
+    team_id = serializers.IntegerField(required=False)
+    max_cases = serializers.IntegerField(required=False, min_value=1, max_value=50)
+
+    def validate_story_key(self, value):
+        if value and not STORY_KEY_RE.match(value):
+            raise serializers.ValidationError("Enter a Jira issue key such as PROJ-123.")
+        return value
+
+    def validate(self, attrs):
+        if not (attrs.get("story_key") or attrs.get("user_story") or attrs.get("feature_description")):
+            raise serializers.ValidationError("Provide a story_key, user_story or feature_description.")
+        return attrs
+
+class BatchTestCaseSerializer(serializers.Serializer):
+    items = serializers.ListField(child=BatchItemSerializer(), allow_empty=False, max_length=200)
+    team_id = serializers.IntegerField(required=False, help_text="Default team for items without one")
+    max_cases = serializers.IntegerField(required=False, default=8, min_value=1, max_value=50)
+    concurrency = serializers.IntegerField(required=False, min_value=1)
+
 class DocumentSerializer(serializers.Serializer):
     # Accept multiple files (BRD, SRS, etc.)
     documents = serializers.ListField(
@@ -17,8 +45,14 @@ class DocumentSerializer(serializers.Serializer):
     )
     app_context = serializers.CharField(required=False, allow_blank=True)
     section_hint = serializers.CharField(required=False, allow_blank=True)
+    sections = serializers.ListField(
+        child=serializers.CharField(), required=False, max_length=50,
+        help_text="Heading titles or numbers (e.g. '3.2', 'Login'); only these sections are sent"
+    )
     team_id = serializers.IntegerField(required=True)
     max_cases = serializers.IntegerField(required=False, default=8, min_value=1, max_value=50)
+    chunked = serializers.BooleanField(required=False, default=False,
+                                       help_text="Map-reduce over document sections instead of truncating")
 
 class ConfluencePageSerializer(serializers.Serializer):
     confluence_url = serializers.URLField(required=True)
@@ -46,6 +80,36 @@ class KnowledgeBaseSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'content', 'category', 'project_team', 'project_team_id', 
                  'tags', 'created_by', 'last_updated', 'usage_count']
 
+class KnowledgeBaseImportSerializer(serializers.ModelSerializer):
+    """One row of a bulk import (qa_api.kb_bulk); project_team_id is checked once per batch, not per row."""
+    id = serializers.IntegerField(required=False, min_value=1)
+    project_team_id = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = KnowledgeBase
+        fields = ['id', 'title', 'content', 'category', 'project_team_id', 'tags', 'created_by']
+
+class RelatedDocumentSerializer(KnowledgeBaseSerializer):
+    """An entry of the assistant's related_docs (version 1): the KnowledgeBaseSerializer fields plus the search snippet."""
+    snippet = serializers.CharField(read_only=True, default=None)
+
+    class Meta(KnowledgeBaseSerializer.Meta):
+        fields = KnowledgeBaseSerializer.Meta.fields + ['snippet']
+
+class TeamSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Team
+        fields = ['id', 'name']
+
+class CompactRelatedDocumentSerializer(serializers.ModelSerializer):
+    """related_docs version 2 (?related_docs_version=2): no content, and the team as just its id and name."""
+    project_team = TeamSummarySerializer(read_only=True)
+    snippet = serializers.CharField(read_only=True, default=None)
+
+    class Meta:
+        model = KnowledgeBase
+        fields = ['id', 'title', 'category', 'project_team', 'tags', 'last_updated', 'snippet']
+
 class QAQuerySerializer(serializers.ModelSerializer):
     project_team = TeamSerializer(read_only=True)
     
@@ -64,6 +128,12 @@ class FAQSerializer(serializers.ModelSerializer):
         model = FAQ
         fields = ['id', 'question', 'answer', 'category', 'project_team', 'frequency']
 
+class FAQPromoteSerializer(serializers.Serializer):
+    query_id = serializers.IntegerField()
+    category = serializers.CharField(max_length=50, required=False, default="general")
+    question = serializers.CharField(max_length=500, required=False)
+    answer = serializers.CharField(required=False)
+
 class FeedbackSerializer(serializers.Serializer):
     query_id = serializers.IntegerField()
     rating = serializers.IntegerField(min_value=1, max_value=5)
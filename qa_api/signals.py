@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import answer_cache, faq, kb_tags, kb_vectors, passages
+from .models import FAQ, KnowledgeBase
+
+
+@receiver(post_save, sender=KnowledgeBase)
+def sync_tag_index(sender, instance, **kwargs):
+    """Keep KnowledgeBaseTag in step with an article's tags (deletes cascade on their own)."""
+    kb_tags.sync(instance)
+
+
+@receiver(post_save, sender=KnowledgeBase)
+def sync_passages(sender, instance, **kwargs):
+    """Re-split the article into passages and re-embed it and them once the save commits."""
+    removed = passages.sync(instance)
+
+    def reindex():
+        kb_vectors.remove_passages(removed)
+        kb_vectors.index_articles([instance])
+
+    # after commit, so a rolled-back save never reaches the (non-transactional) vector files
+    transaction.on_commit(reindex)
+
+
+@receiver(post_save, sender=KnowledgeBase)
+@receiver(pre_delete, sender=KnowledgeBase)
+def invalidate_answers(sender, instance, **kwargs):
+    """Stop serving cached assistant answers that cited the article (before a delete drops the links)."""
+    answer_cache.invalidate_articles([instance.pk])
+
+
+@receiver(pre_delete, sender=KnowledgeBase)
+def unembed_article(sender, instance, **kwargs):
+    # passage ids are read before the cascade deletes the rows
+    pk, passage_pks = instance.pk, list(instance.passages.values_list("id", flat=True))
+    transaction.on_commit(lambda: kb_vectors.remove_articles([pk], passage_pks))
+
+
+@receiver(post_save, sender=FAQ)
+@receiver(post_delete, sender=FAQ)
+def reload_faq_index(sender, **kwargs):
+    transaction.on_commit(faq.changed)
@@ -0,0 +1,80 @@
+import json
+
+from django.http import StreamingHttpResponse
+
+from ai_core.json_stream import IncrementalJSONParser, array_items, top_level_keys
+
+# What gets emitted as soon as it is complete, per artifact type:
+# each element of TEST_CASE_SCHEMA's "test_cases", each section of TEST_PLAN_SCHEMA.
+STREAM_TARGETS = {
+    "test_cases": ("test_case", array_items("test_cases")),
+    "test_plan": ("section", top_level_keys),
+}
+
+
+def wants_stream(params):
+    """True when the caller asked for server-sent events (?stream=1)."""
+    return params.get("stream", "").lower() in ("1", "true", "yes")
+
+
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_response(events):
+    """StreamingHttpResponse for an (a)sync iterator of formatted events."""
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # keep nginx from buffering the stream
+    return response
+
+
+class ArtifactEvents:
+    """
+    Turns text deltas of a generated artifact into SSE events.
+    Emits `test_case` / `section` events as elements complete, then `done`
+    carrying the element count (and the raw text if nothing parsed).
+    """
+
+    def __init__(self, type_):
+        self.event, want = STREAM_TARGETS.get(type_, ("section", top_level_keys))
+        self.parser = IncrementalJSONParser(want)
+        self.count = 0
+
+    def feed(self, delta):
+        for path, value in self.parser.feed(delta):
+            self.count += 1
+            if self.event == "section":
+                yield sse_event(self.event, {"name": path[0], "value": value})
+            else:
+                yield sse_event(self.event, value)
+
+    def finish(self):
+        done = {"count": self.count}
+        if not self.count:
+            done["raw"] = self.parser.buffer
+        return sse_event("done", done)
+
+
+def artifact_stream(deltas, type_):
+    events = ArtifactEvents(type_)
+    try:
+        for delta in deltas:
+            yield from events.feed(delta)
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+        return
+    yield events.finish()
+
+
+async def aartifact_stream(deltas, type_):
+    events = ArtifactEvents(type_)
+    try:
+        async for delta in deltas:
+            for event in events.feed(delta):
+                yield event
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+        return
+    yield events.finish()
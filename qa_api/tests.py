@@ -1,3 +1,1383 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import numpy as np
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from docx import Document
+from openai import InternalServerError, OpenAI, RateLimitError
+
+import ai_core.factory
+import ai_core.openapi_provider
+from ai_core.base import BaseLLMProvider
+from ai_core.budget import PromptBudget
+from ai_core.cache import CachedProvider, MemoryTier, SQLiteTier
+from ai_core.json_stream import IncrementalJSONParser, array_items, top_level_keys
+from ai_core.limiter import (
+    OVERLOAD, SUCCESS, AdaptiveLimiter, LimitedProvider, LLMOverloaded, RetryPolicy, deadline_scope,
+)
+from ai_core.mock_provider import MockProvider
+from ai_core.openapi_provider import OpenAIProvider
+from ai_core.router import AllProvidersFailed, RouterProvider
+from ai_core.singleflight import SingleFlight
+from ai_core.tokens import count_tokens
+
+from . import counters, faq, jobs, kb_search, kb_tags, kb_vectors, passages
+from .batch import build_batch_prompts
+from .chunking import chunk_document, merge_test_cases
+from .extraction import iter_document_text
+from .models import FAQ, ExtractedText, GenerationJob, KnowledgeBase, KnowledgeBaseTag, KnowledgePassage, QAQuery, Team
+from .passages import split_passages
+from .prompts import TEST_CASE_SCHEMA, TEST_PLAN_SCHEMA, test_case_prompt, test_plan_prompt
+from .sections import select_sections
+from .textcache import content_hash, get_text, put_text
+from .uploads import SpooledUploadHandler, ingest_budget
+from .vector_index import MIN_CAPACITY, VectorIndex, embed
+from .views import _document_text
+
+
+class RecordingProvider:
+    """Upstream stand-in that numbers its answers, so a cached answer is told apart from a fresh one."""
+    model = "recording"
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, prompt, meta=None):
+        self.prompts.append(prompt)
+        return {"test_cases": f"answer {len(self.prompts)}"}
+
+    def stream_chat_completion(self, system_prompt, question, temperature=0.3, meta=None):
+        self.prompts.append(question)
+        yield from ("Refunds ", "take ", f"{len(self.prompts)} days.")
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "llm_cache.sqlite3")
+
+    def test_memory_then_persistent_hits(self):
+        upstream = RecordingProvider()
+        cached = CachedProvider(upstream, MemoryTier(), SQLiteTier(self.path))
+        first = cached.generate("Generate  cases\nfor login", meta={"type": "test_cases"})
+        self.assertEqual(cached.generate("Generate cases for login ", meta={"type": "test_cases"}), first)
+        self.assertNotEqual(cached.generate("Generate cases for login", meta={"type": "test_plan"}), first)
+
+        # a fresh memory tier, as in another worker process: served from SQLite, then from memory
+        other = CachedProvider(upstream, MemoryTier(), SQLiteTier(self.path))
+        self.assertEqual(other.generate("Generate cases for login", meta={"type": "test_cases"}), first)
+        other.generate("Generate cases for login", meta={"type": "test_cases"})
+        self.assertEqual(len(upstream.prompts), 2)
+        self.assertEqual((cached.counters["memory_hits"], cached.counters["misses"]), (1, 2))
+        self.assertEqual((other.counters["persistent_hits"], other.counters["memory_hits"]), (1, 1))
+
+    def test_entries_expire_and_least_recently_used_go_first(self):
+        memory = MemoryTier(max_entries=2, ttl=60)
+        memory.set("a", 1)
+        memory.set("b", 2)
+        memory.get("a")
+        memory.set("c", 3)
+        self.assertEqual((memory.get("a"), memory.get("b"), memory.get("c")), (1, None, 3))
+        self.assertEqual(memory.evictions, 1)
+
+        short = MemoryTier(ttl=0.01)
+        short.set("a", 1)
+        time.sleep(0.02)
+        self.assertIsNone(short.get("a"))
+
+        persistent = SQLiteTier(self.path, ttl=-1)
+        persistent.set("a", {"x": 1})
+        self.assertIsNone(persistent.get("a"))
+        self.assertEqual(persistent.prune(), 1)
+
+    def test_stream_miss_is_stored_and_replayed(self):
+        upstream = RecordingProvider()
+        cached = CachedProvider(upstream, MemoryTier(), SQLiteTier(self.path))
+        stream = cached.stream_chat_completion("system", "How long do refunds take?")
+        self.assertEqual(list(stream), ["Refunds ", "take ", "1 days."])
+        self.assertEqual(list(cached.stream_chat_completion("system", "How long do refunds take?")),
+                         ["Refunds take 1 days."])
+        self.assertEqual(cached.chat_completion("system", "How long do refunds take?"), "Refunds take 1 days.")
+        self.assertEqual(len(upstream.prompts), 1)
+        self.assertEqual((cached.counters["hits"], cached.counters["misses"]), (2, 1))
+
+
+class NoCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(AI_PROVIDER="mock", LLM_CACHE_ENABLED=True,
+                                            LLM_CACHE_DB=os.path.join(directory.name, "llm_cache.sqlite3")))
+        ai_core.factory._provider_instance = None
+        self.addCleanup(setattr, ai_core.factory, "_provider_instance", None)
+
+    def generate(self, query=""):
+        return self.client.post(f"/api/generate/testcases/prompt/{query}",
+                                {"user_story": "As a payer I want receipts.", "team_id": 1},
+                                content_type="application/json")
+
+    def test_nocache_bypasses_the_cache(self):
+        self.assertEqual(self.generate("?nocache=1").status_code, 200)
+        self.generate()
+        self.generate()
+        cache = self.client.get("/api/ai/stats/").json()["cache"]
+        self.assertEqual((cache["bypassed"], cache["misses"], cache["hits"]), (1, 1, 1))
+
+
+class IncrementalJSONParserTests(SimpleTestCase):
+    OUTPUT = ('```json\n{"scope": "a \\"quoted\\" {brace} ]", '
+              '"test_cases": [{"id": 1, "steps": ["x, y", "z\\\\"]}, {"id": 2}], "total": 2}\n```')
+
+    def test_items_are_yielded_as_soon_as_complete(self):
+        parser = IncrementalJSONParser(array_items("test_cases"))
+        seen = []
+        for i, ch in enumerate(self.OUTPUT):
+            seen.extend((i, item) for item in parser.feed(ch))
+        self.assertEqual([item for _, item in seen], [
+            (("test_cases", 0), {"id": 1, "steps": ["x, y", "z\\"]}),
+            (("test_cases", 1), {"id": 2}),
+        ])
+        self.assertEqual(self.OUTPUT[seen[0][0]], "}")  # not held back until the array closes
+        self.assertTrue(parser.done)
+
+    def test_chunks_split_inside_strings_and_escapes(self):
+        parser = IncrementalJSONParser(top_level_keys)
+        split = self.OUTPUT.index("\\\"quoted") + 1  # between a backslash and the quote it escapes
+        self.assertEqual(list(parser.feed(self.OUTPUT[:split])), [])
+        self.assertEqual(list(parser.feed(self.OUTPUT[split:])), [
+            (("scope",), 'a "quoted" {brace} ]'),
+            (("test_cases",), [{"id": 1, "steps": ["x, y", "z\\"]}, {"id": 2}]),
+            (("total",), 2),
+        ])
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_together(self, flight, fn, callers=4):
+        """Call fn on one key from several threads; returns the threads and each caller's result or error."""
+        outcomes = [None] * callers
+
+        def call(i):
+            try:
+                outcomes[i] = flight.do("key", fn)
+            except Exception as e:
+                outcomes[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+        for thread in threads:
+            thread.start()
+        return threads, outcomes
+
+    def test_concurrent_callers_share_one_call(self):
+        flight, release, calls = SingleFlight(), threading.Event(), []
+
+        def fn():
+            calls.append(1)
+            release.wait(5)
+            return {"test_cases": []}
+
+        threads, outcomes = self.run_together(flight, fn)
+        while flight.counters["coalesced"] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [{"test_cases": []}] * 4)
+        self.assertEqual(len({id(outcome) for outcome in outcomes}), 4)  # followers get copies
+        self.assertEqual(flight.stats(), {"upstream_calls": 1, "coalesced": 3, "in_flight": 0})
+
+    def test_leader_error_reaches_every_caller_and_is_not_kept(self):
+        flight, release = SingleFlight(), threading.Event()
+
+        def fail():
+            release.wait(5)
+            raise RuntimeError("upstream 503")
+
+        threads, outcomes = self.run_together(flight, fail, callers=3)
+        while flight.counters["coalesced"] < 2:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertTrue(all(isinstance(outcome, RuntimeError) for outcome in outcomes))
+        self.assertEqual(flight.do("key", lambda: "recovered"), "recovered")
+
+
+def jira_issue(key, summary):
+    return {"id": key, "key": key, "fields": {"summary": summary}}
+
+
+@override_settings(AI_PROVIDER="mock", LLM_CACHE_ENABLED=False)
+class BatchPromptTests(TestCase):
+    def setUp(self):
+        ai_core.factory._provider_instance = None
+        self.addCleanup(setattr, ai_core.factory, "_provider_instance", None)
+        self.team = Team.objects.create(name="Payments", context_info="Card payments service.")
+
+    @override_settings(LLM_MAX_PROMPT_TOKENS=2000)
+    def test_large_stories_are_fitted_to_the_prompt_budget(self):
+        story = "As a payer I want to split a bill. " * 2000
+        prompts = build_batch_prompts([{"user_story": story}, {"user_story": "As a payer I want receipts."}],
+                                      default_team_id=self.team.id)
+
+        (_, _, large, error), (_, _, small, _) = prompts
+        self.assertIsNone(error)
+        self.assertLessEqual(count_tokens(large), 2000)
+        self.assertIn("Card payments service.", large)
+        self.assertIn("As a payer I want receipts.", small)
+
+    def test_story_keys_must_look_like_jira_keys(self):
+        response = self.client.post("/api/generate/testcases/batch/", {"items": [
+            {"story_key": "PAY-1"},
+            {"story_key": "X-1) OR project = SECRET ORDER BY (key"},
+        ]}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()["items"]), ["1"])
+        self.assertIn("story_key", response.json()["items"]["1"])
+
+    @mock.patch("jira_xray_app.services.jira_service.JiraService.get_story_by_key")
+    @mock.patch("jira_xray_app.services.jira_service.JiraService.get_stories_by_keys")
+    def test_one_missing_story_fails_only_its_item(self, search, get_one):
+        search.side_effect = Exception("Jira API request failed: 400 - An issue with key 'PAY-404' does not exist")
+
+        def get_story(key):
+            if key == "PAY-404":
+                raise ValueError(f"User story {key} not found")
+            return jira_issue(key, f"Summary of {key}")
+        get_one.side_effect = get_story
+
+        prompts = build_batch_prompts([{"story_key": "PAY-1"}, {"story_key": "PAY-404"}, {"story_key": "PAY-2"}],
+                                      default_team_id=self.team.id)
+        self.assertEqual([(key, error) for _, key, _, error in prompts],
+                         [("PAY-1", None), ("PAY-404", "User story PAY-404 not found"), ("PAY-2", None)])
+        self.assertIn("Summary of PAY-2", prompts[2][2])
+        self.assertEqual(search.call_count, 1)
+
+
+class ChunkingTests(SimpleTestCase):
+    def test_chunks_keep_every_section_within_the_limit(self):
+        doc = "\n\n".join([
+            "1 Login\nUsers sign in with email.",
+            "2 Payments\n" + "Cards are charged on checkout.\n" * 10,
+            "3 Refunds\nRefunds go back to the card.",
+        ])
+        chunks = chunk_document(doc, max_chars=120)
+        self.assertTrue(all(len(chunk) <= 120 for chunk in chunks))
+        self.assertTrue(chunks[0].startswith("1 Login"))
+        self.assertTrue(chunks[-1].endswith("3 Refunds\nRefunds go back to the card."))
+        self.assertEqual("".join("".join(chunks).split()), "".join(doc.split()))  # nothing dropped
+
+    def test_merge_drops_near_duplicates_and_renumbers(self):
+        merged = merge_test_cases([
+            '```json\n{"test_cases": [{"id": "a", "title": "Login with valid email address"},'
+            ' {"id": "b", "title": "Login with an expired password"}]}\n```',
+            "not JSON at all",
+            '{"test_cases": [{"id": "x", "title": "Login with a valid email address!"},'
+            ' "not a case", {"id": "y", "title": "Refund to the original card"}]}',
+        ])
+        self.assertEqual([(case["id"], case["title"]) for case in merged], [
+            ("TC-001", "Login with valid email address"),
+            ("TC-002", "Login with an expired password"),
+            ("TC-003", "Refund to the original card"),
+        ])
+
+
+class PromptBudgetTests(SimpleTestCase):
+    @staticmethod
+    def words(count):
+        return " ".join(["word"] * count)
+
+    def test_priorities_are_served_in_order(self):
+        budget = PromptBudget(max_prompt_tokens=400)
+        budget.add("schema", self.words(100), fixed=True)
+        budget.add("context", self.words(50), priority=1)
+        budget.add("story", self.words(20), priority=2)
+        budget.add("criteria", self.words(300), priority=2)
+        budget.add("doc", self.words(500), priority=3)
+        kept = budget.allocate()
+
+        self.assertEqual([kept[name] for name in ("schema", "context", "story")],
+                         [self.words(100), self.words(50), self.words(20)])
+        self.assertTrue(self.words(300).startswith(kept["criteria"]))  # trimmed from the end
+        self.assertEqual(kept["doc"], "")
+        self.assertEqual(budget.report()["used_tokens"], 400)
+        self.assertEqual([name for name in kept if budget.trimmed(name)], ["criteria", "doc"])
+
+    def test_large_sections_of_one_priority_share_evenly(self):
+        budget = PromptBudget(max_prompt_tokens=400)
+        budget.add("schema", self.words(100), fixed=True)
+        budget.add("story", self.words(300), priority=2)
+        budget.add("criteria", self.words(300), priority=2)
+        budget.allocate()
+        shares = [section["kept_tokens"] for section in budget.report()["sections"][1:]]
+        self.assertEqual(shares, [150, 150])
+
+
+class SmallPlanModelProvider(MockProvider):
+    """Sends test plans to a model with a small context window."""
+
+    def target_model(self, meta=None, prompt_tokens=0):
+        return "small-model" if (meta or {}).get("type") == "test_plan" else None
+
+
+@override_settings(AI_PROVIDER="mock", LLM_CACHE_ENABLED=False, LLM_CONTEXT_TOKENS={"small-model": 6096})
+class LLMStatsTests(TestCase):
+    def setUp(self):
+        ai_core.factory._provider_instance = None
+        self.addCleanup(setattr, ai_core.factory, "_provider_instance", None)
+        self.team = Team.objects.create(name="Payments", context_info="Card payments service.")
+
+    def test_days_is_validated_and_clamped(self):
+        self.assertEqual(self.client.get("/api/ai/stats/?days=abc").status_code, 400)
+        self.assertEqual(self.client.get("/api/ai/stats/?days=100000").status_code, 200)
+        self.assertIn("usage", self.client.get("/api/ai/stats/?days=-3").json())
+
+    def test_prompts_are_budgeted_for_the_target_model(self):
+        ai_core.factory._provider_instance = SmallPlanModelProvider()
+        payload = {"user_story": "As a payer I want receipts.", "team_id": self.team.id}
+        plan = self.client.post("/api/generate/testplan/prompt/?dry_run=1", payload,
+                                content_type="application/json").json()["budget"]
+        cases = self.client.post("/api/generate/testcases/prompt/?dry_run=1", payload,
+                                 content_type="application/json").json()["budget"]
+        self.assertEqual((plan["model"], plan["budget_tokens"]), ("small-model", 2000))
+        self.assertEqual(cases["model"], settings.OPENAI_MODEL)
+
+
+class ScriptedProvider(BaseLLMProvider):
+    """Answers with its own name, or fails with `error` after streaming `deltas_before_error` deltas."""
+
+    def __init__(self, name, error=None, deltas_before_error=0):
+        self.model = name
+        self.error = error
+        self.deltas_before_error = deltas_before_error
+        self.calls = 0
+
+    def generate(self, prompt, meta=None):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return {"raw": self.model}
+
+    def stream_generate(self, prompt, meta=None):
+        self.calls += 1
+        for i in range(self.deltas_before_error if self.error else 2):
+            yield f"{self.model}-{i} "
+        if self.error:
+            raise self.error
+
+
+class RouterTests(SimpleTestCase):
+    ROUTES = [
+        {"type": "test_plan", "max_tokens": 50, "chain": ["small", "large"]},
+        {"min_tokens": 100, "chain": ["large", "small"]},
+        {"type": ["test_cases", "assistant"], "chain": ["small"]},
+    ]
+
+    def router(self, small=None, large=None, routes=ROUTES):
+        return RouterProvider({"small": small or ScriptedProvider("small"),
+                               "large": large or ScriptedProvider("large")}, routes)
+
+    def test_rules_match_on_type_and_prompt_size(self):
+        router = self.router()
+        short, long = "word " * 10, "word " * 200
+        self.assertEqual(router.chain(short, {"type": "test_plan"}), ["small", "large"])
+        self.assertEqual(router.chain(long, {"type": "test_plan"}), ["large", "small"])
+        self.assertEqual(router.chain(short, {"type": "assistant"}), ["small"])
+        self.assertEqual(router.chain(short, {}), ["small", "large"])  # no rule: every provider in order
+        self.assertEqual(router.target_model({"type": "test_plan"}, 200), "large")
+        self.assertEqual(router.target_model({"type": "test_plan"}, 10), "small")
+        with self.assertRaises(ValueError):
+            RouterProvider({"small": ScriptedProvider("small")}, [{"chain": ["small", "huge"]}])
+
+    def test_falls_back_in_chain_order(self):
+        small, large = ScriptedProvider("small", error=RuntimeError("500")), ScriptedProvider("large")
+        router = self.router(small, large)
+        with self.assertLogs("ai_core.router", "WARNING"):
+            self.assertEqual(router.generate("word " * 10, {"type": "test_plan"}), {"raw": "large"})
+        self.assertEqual(router.generate("word " * 200, {"type": "test_plan"}), {"raw": "large"})
+        self.assertEqual((small.calls, large.calls), (1, 2))
+        self.assertEqual(router.stats()["router"]["fallbacks"], 1)
+        self.assertEqual(router.stats()["router"]["routed"], {"large": 2})
+
+    def test_all_failing_raises_all_providers_failed(self):
+        router = self.router(ScriptedProvider("small", error=RuntimeError("500")),
+                             ScriptedProvider("large", error=RuntimeError("timeout")))
+        with self.assertRaises(AllProvidersFailed) as raised, self.assertLogs("ai_core.router", "WARNING"):
+            router.generate("word", {"type": "test_plan"})
+        self.assertIsInstance(raised.exception.__cause__, RuntimeError)
+        self.assertEqual(router.stats()["router"]["failures"], 1)
+
+    def test_saturation_everywhere_is_reraised_as_overload(self):
+        router = self.router(ScriptedProvider("small", error=RuntimeError("500")),
+                             ScriptedProvider("large", error=LLMOverloaded("at capacity", retry_after=3)))
+        with self.assertRaises(LLMOverloaded) as raised, self.assertLogs("ai_core.router", "WARNING"):
+            router.generate("word", {"type": "test_plan"})
+        self.assertEqual(raised.exception.retry_after, 3)
+
+    def test_streams_fall_back_only_before_the_first_delta(self):
+        router = self.router(ScriptedProvider("small", error=RuntimeError("500")))
+        with self.assertLogs("ai_core.router", "WARNING"):
+            self.assertEqual(list(router.stream_generate("word", {"type": "test_plan"})), ["large-0 ", "large-1 "])
+
+        router = self.router(ScriptedProvider("small", error=RuntimeError("reset"), deltas_before_error=1))
+        deltas = []
+        with self.assertRaisesMessage(RuntimeError, "reset"):
+            for delta in router.stream_generate("word", {"type": "test_plan"}):
+                deltas.append(delta)
+        self.assertEqual(deltas, ["small-0 "])
+        self.assertEqual(router.providers["large"].calls, 0)
+
+
+@override_settings(OPENAI_API_KEY="test-key")
+class OpenAIProviderTests(SimpleTestCase):
+    def provider(self, model, handler):
+        self.addCleanup(ai_core.openapi_provider._RESPONSES_SUPPORT.pop, model, None)
+        provider = OpenAIProvider(model=model)
+        provider.client = OpenAI(api_key="test-key", base_url="https://llm.test/v1", max_retries=0,
+                                 http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+        return provider
+
+    def test_chat_only_models_keep_the_output_cap(self):
+        bodies = []
+
+        def handler(request):
+            if request.url.path.endswith("/responses"):
+                return httpx.Response(400, json={"error": {"message": "Responses API not supported"}})
+            bodies.append(json.loads(request.content))
+            return httpx.Response(200, json={
+                "id": "c1", "object": "chat.completion", "created": 0, "model": "chat-only",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "Use the staging VPN."}}],
+            })
+
+        provider = self.provider("chat-only", handler)
+        self.assertEqual(provider.chat_completion("system", "How do I reach staging?"), "Use the staging VPN.")
+        self.assertEqual(provider.chat_completion("system", "And production?"), "Use the staging VPN.")
+        self.assertEqual([body["max_tokens"] for body in bodies], [500, 500])
+        self.assertIs(ai_core.openapi_provider._RESPONSES_SUPPORT["chat-only"], False)
+
+    def test_programming_errors_do_not_mark_a_model_chat_only(self):
+        provider = self.provider("responses-model", lambda request: httpx.Response(500))
+
+        def broken():
+            raise AttributeError("'NoneType' object has no attribute 'output'")
+
+        with self.assertRaises(AttributeError):
+            provider._probe(broken, lambda: "chat")
+        self.assertNotIn("responses-model", ai_core.openapi_provider._RESPONSES_SUPPORT)
+
+
+def read_events(response):
+    """(event, data) pairs of a text/event-stream response."""
+    return parse_events(b"".join(response.streaming_content).decode())
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@override_settings(AI_PROVIDER="mock", LLM_CACHE_ENABLED=False)
+class EndpointTests(TestCase):
+    def setUp(self):
+        ai_core.factory._provider_instance = None
+        self.addCleanup(setattr, ai_core.factory, "_provider_instance", None)
+        self.team = Team.objects.create(name="Payments", context_info="Card payments web app",
+                                        tech_stack="Django", key_contacts="qa-lead@example.com")
+
+    async def test_async_generate_view(self):
+        response = await self.async_client.post(
+            "/api/async/generate/testcases/prompt/",
+            {"user_story": "As a payer I want receipts.", "team_id": self.team.id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("test_cases", response.json())
+
+        response = await self.async_client.post(
+            "/api/async/generate/testcases/prompt/", "{", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async_assistant_view(self):
+        response = await self.async_client.post(
+            "/api/async/qa-assistant/",
+            {"question": "How do refunds work?", "project_team_id": self.team.id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertIn("You asked: How do refunds work?", body["response"])
+        query = await QAQuery.objects.aget(id=body["query_id"])
+        self.assertEqual(query.project_team_id, self.team.id)
+
+    def test_generate_streams_test_cases_as_events(self):
+        response = self.client.post("/api/generate/testcases/prompt/?stream=1",
+                                    {"user_story": "As a payer I want receipts.", "team_id": self.team.id,
+                                     "max_cases": 4},
+                                    content_type="application/json")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = read_events(response)
+        self.assertEqual([name for name, _ in events], ["test_case"] * 4 + ["done"])
+        self.assertEqual([data["id"] for _, data in events[:-1]], ["TC-001", "TC-002", "TC-003", "TC-004"])
+        self.assertEqual(events[-1][1], {"count": 4})
+
+    def test_assistant_streams_tokens_then_the_logged_query(self):
+        response = self.client.post("/api/qa-assistant/?stream=1",
+                                    {"question": "How do refunds work?", "project_team_id": self.team.id},
+                                    content_type="application/json")
+        events = read_events(response)
+        self.assertEqual(events[0][0], "related_docs")
+        self.assertEqual({name for name, _ in events[1:-1]}, {"token"})
+        self.assertEqual(events[-1][0], "done")
+        answer = "".join(data["text"] for _, data in events[1:-1])
+        self.assertEqual(QAQuery.objects.get(id=events[-1][1]["query_id"]).response, answer)
+        self.assertIn("You asked: How do refunds work?", answer)
+
+
+class MockProviderTests(SimpleTestCase):
+    REQUIREMENTS = "User Story:\nAs a payer I want to download receipts"
+
+    def test_artifacts_follow_the_prompt_schemas(self):
+        provider = MockProvider({})
+        output = provider.generate(test_case_prompt("Payments web app", self.REQUIREMENTS, 3), {"type": "test_cases"})
+        cases = json.loads(output["test_cases"])["test_cases"]
+        case_keys = set(re.findall(r'"(\w+)":', TEST_CASE_SCHEMA)) - {"test_cases"}
+        self.assertEqual([set(case) for case in cases], [case_keys] * 3)
+        self.assertTrue(all(case["priority"] in ("P0", "P1", "P2") for case in cases))
+        self.assertIn("download receipts", cases[0]["title"])
+
+        output = provider.generate(test_plan_prompt("Payments web app", self.REQUIREMENTS), {"type": "test_plan"})
+        plan = json.loads(output["test_plan"])
+        self.assertEqual(set(plan), set(re.findall(r'^\s*"(\w+)":', TEST_PLAN_SCHEMA, re.MULTILINE)))
+
+    def test_max_cases_and_missing_meta(self):
+        provider = MockProvider({})
+        output = provider.generate(test_case_prompt("Payments web app", self.REQUIREMENTS, 12), {"type": "test_cases"})
+        cases = json.loads(output["test_cases"])["test_cases"]
+        self.assertEqual([case["id"] for case in cases], [f"TC-{n:03d}" for n in range(1, 13)])
+        self.assertEqual(output, provider.generate(test_case_prompt("Payments web app", self.REQUIREMENTS, 12),
+                                                   {"type": "test_cases"}))  # deterministic
+
+        self.assertIn("raw", provider.generate("Summarise the release notes", meta=None))
+        answer = provider.chat_completion("You are a QA assistant.", "How do I get staging access?")
+        self.assertIn("You asked: How do I get staging access?", answer)
+        self.assertEqual("".join(provider.stream_chat_completion("You are a QA assistant.",
+                                                                 "How do I get staging access?")), answer)
+
+    def test_faults_are_raised_as_sdk_errors_at_the_configured_rates(self):
+        provider = MockProvider({"rate_limit_rate": 0.2, "error_rate": 0.1, "retry_after": 3, "seed": 7})
+        outcomes = []
+        for _ in range(2000):
+            try:
+                provider.chat_completion("system", "question")
+                outcomes.append("ok")
+            except RateLimitError as e:
+                self.assertEqual((e.status_code, e.response.headers["retry-after"]), (429, "3"))
+                outcomes.append(429)
+            except InternalServerError as e:
+                self.assertEqual(e.status_code, 500)
+                outcomes.append(500)
+        self.assertAlmostEqual(outcomes.count(429) / 2000, 0.2, delta=0.03)
+        self.assertAlmostEqual(outcomes.count(500) / 2000, 0.1, delta=0.03)
+
+    def test_router_falls_back_from_injected_faults(self):
+        router = RouterProvider({"flaky": MockProvider({"error_rate": 1.0}), "steady": MockProvider({})},
+                                [{"chain": ["flaky", "steady"]}])
+        with self.assertLogs("ai_core.router", "WARNING"):
+            output = router.generate(test_case_prompt("Payments web app", self.REQUIREMENTS, 2), {"type": "test_cases"})
+        self.assertEqual(len(json.loads(output["test_cases"])["test_cases"]), 2)
+        self.assertEqual(router.stats()["router"]["routed"], {"steady": 1})
+
+
+def pdf_with_pages(texts):
+    """A minimal text PDF with one page per entry of texts."""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for number, text in enumerate(texts):
+        page_id, content_id = 4 + 2 * number, 5 + 2 * number
+        content = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode("latin-1")
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content)
+        objects[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(b"%d 0 R" % page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+    out, offsets = bytearray(b"%PDF-1.4\n"), {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (obj_id, objects[obj_id])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offsets[obj_id] for obj_id in sorted(objects))
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def docx_with_paragraphs(texts):
+    doc = Document()
+    for text in texts:
+        doc.add_paragraph(text)
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+@override_settings(EXTRACTION_WORKERS=2, EXTRACTION_PAGES_PER_TASK=2, EXTRACTION_FILE_TIMEOUT=60,
+                   EXTRACTED_TEXT_CACHE_ENABLED=False)
+class ExtractionTests(SimpleTestCase):
+    PAGES = [f"Requirement page {number}" for number in range(1, 8)]
+
+    def uploads(self):
+        return [
+            SimpleUploadedFile("srs.pdf", pdf_with_pages(self.PAGES), "application/pdf"),
+            SimpleUploadedFile("brd.docx", docx_with_paragraphs(["Scope", "Checkout flow", "Refunds"])),
+            SimpleUploadedFile("notes.txt", b"Plain notes"),
+        ]
+
+    def read(self, uploads):
+        return "".join(iter_document_text(uploads))
+
+    def test_pages_and_files_keep_their_order_across_the_pool(self):
+        for workers in (2, 0):
+            with self.subTest(workers=workers), self.settings(EXTRACTION_WORKERS=workers):
+                text = self.read(self.uploads())
+                self.assertEqual(re.findall(r"Requirement page \d", text), self.PAGES)
+                self.assertTrue(text.endswith("\n\nScope\nCheckout flow\nRefunds\n\nPlain notes"))
+
+    def test_failed_or_late_files_stop_contributing_text(self):
+        broken = SimpleUploadedFile("broken.pdf", b"%PDF-1.4 not really a pdf")
+        with self.assertLogs("qa_api.extraction", "WARNING"):
+            self.assertEqual(self.read([broken, SimpleUploadedFile("notes.txt", b"Plain notes")]), "Plain notes")
+        # Pages already read are kept; the file stops contributing once its deadline passes.
+        late = [f"Late page {number}" for number in range(1, 41)]
+        upload = SimpleUploadedFile("late.pdf", pdf_with_pages(late), "application/pdf")
+        with self.settings(EXTRACTION_FILE_TIMEOUT=0), self.assertLogs("qa_api.extraction", "WARNING") as logs:
+            pages = re.findall(r"Late page \d+", self.read([upload]))
+        self.assertEqual(pages, late[:len(pages)])
+        self.assertLess(len(pages), len(late))
+        self.assertIn("timed out", logs.output[0])
+
+
+@override_settings(AI_PROVIDER="mock", LLM_CACHE_ENABLED=False, DOCUMENT_UPLOAD_MAX_BYTES=4096,
+                   DOCUMENT_REQUEST_MAX_BYTES=16384, DOCUMENT_INGEST_MAX_BYTES=8192)
+class UploadLimitTests(TestCase):
+    URL = "/api/generate/testcases/document/"
+
+    def setUp(self):
+        ai_core.factory._provider_instance = None
+        self.addCleanup(setattr, ai_core.factory, "_provider_instance", None)
+        self.team = Team.objects.create(name="Payments", context_info="Card payments web app",
+                                        tech_stack="Django", key_contacts="qa-lead@example.com")
+
+    def upload(self, *sizes):
+        documents = [SimpleUploadedFile(f"notes{n}.txt", b"x" * size) for n, size in enumerate(sizes)]
+        return self.client.post(self.URL, {"documents": documents, "team_id": self.team.id})
+
+    def test_upload_within_limits_is_accepted(self):
+        self.assertEqual(self.upload(3000, 3000).status_code, 200)
+        self.assertEqual(ingest_budget.used, 0)
+
+    def test_file_over_per_file_limit_is_rejected(self):
+        response = self.upload(1000, 5000)
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("notes1.txt", response.json()["detail"])
+        self.assertEqual(ingest_budget.used, 0)
+
+    def test_request_over_per_request_limit_is_rejected(self):
+        response = self.upload(4000, 4000, 4000, 4000, 4000)
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("Request body", response.json()["detail"])
+        self.assertEqual(ingest_budget.used, 0)
+
+    def test_full_ingest_budget_answers_503(self):
+        self.assertTrue(ingest_budget.reserve(6000))
+        self.addCleanup(ingest_budget.release, 6000)
+        self.assertEqual(self.upload(3000).status_code, 503)
+        self.assertEqual(ingest_budget.used, 6000)
+
+
+@override_settings(EXTRACTION_WORKERS=2, EXTRACTION_PAGES_PER_TASK=2, EXTRACTION_FILE_TIMEOUT=60,
+                   EXTRACTED_TEXT_CACHE_ENABLED=True)
+class ExtractedTextCacheTests(TestCase):
+    PAGES = [f"Requirement page {number}" for number in range(1, 6)]
+
+    def read(self):
+        upload = SimpleUploadedFile("srs.pdf", pdf_with_pages(self.PAGES), "application/pdf")
+        return "".join(iter_document_text([upload]))
+
+    def test_identical_bytes_are_not_parsed_again(self):
+        text = self.read()
+        with mock.patch("qa_api.extraction._submit_file") as submit:
+            self.assertEqual(self.read(), text)
+        submit.assert_not_called()
+        entry = ExtractedText.objects.get()
+        self.assertEqual(entry.hits, 1)
+        self.assertEqual(entry.sha256, hashlib.sha256(pdf_with_pages(self.PAGES)).hexdigest())
+
+    def test_new_extractor_version_misses(self):
+        text = self.read()
+        with mock.patch("qa_api.textcache.EXTRACTOR_VERSION", "2/test"):
+            self.assertEqual(self.read(), text)
+        self.assertEqual(ExtractedText.objects.filter(hits=0).count(), 2)
+
+    def test_least_recently_used_entries_are_evicted_past_the_size_cap(self):
+        texts = {name: os.urandom(600).hex() for name in "abc"}
+        put_text("a", texts["a"])
+        put_text("b", texts["b"])
+        self.assertEqual(get_text("a"), texts["a"])
+        size = ExtractedText.objects.get(sha256="a").size
+        with self.settings(EXTRACTED_TEXT_CACHE_MAX_BYTES=size * 5 // 2):
+            put_text("c", texts["c"])
+        self.assertEqual(set(ExtractedText.objects.values_list("sha256", flat=True)), {"a", "c"})
+        self.assertIsNone(get_text("b"))
+
+    @override_settings(DOCUMENT_UPLOAD_MAX_BYTES=1024 * 1024, DOCUMENT_INGEST_MAX_BYTES=1024 * 1024)
+    def test_streamed_hash_matches_the_file(self):
+        data = os.urandom(200 * 1024)
+        handler = SpooledUploadHandler()
+        handler.new_file("documents", "srs.pdf", "application/pdf", len(data))
+        for start in range(0, len(data), handler.chunk_size):
+            handler.receive_data_chunk(data[start:start + handler.chunk_size], start)
+        upload = handler.file_complete(len(data))
+        self.addCleanup(upload.close)
+        self.assertEqual(content_hash(upload), hashlib.sha256(data).hexdigest())
+        self.assertEqual(ingest_budget.used, len(data))
+        upload.close()
+        self.assertEqual(ingest_budget.used, 0)
+
+
+def rate_limited(retry_after=None):
+    headers = {"retry-after": retry_after} if retry_after else {}
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://llm.test/v1/chat"))
+    return RateLimitError("rate limited", response=response, body=None)
+
+
+class AdaptiveLimiterTests(SimpleTestCase):
+    def test_limit_grows_on_success_and_halves_once_per_burst(self):
+        limiter = AdaptiveLimiter(initial=4, max_wait=0)
+        for _ in range(4):
+            limiter.acquire()
+        with self.assertRaises(LLMOverloaded):  # full, and no time to queue
+            limiter.acquire()
+        for _ in range(4):
+            limiter.release(SUCCESS)
+        self.assertGreater(limiter.limit, 4.9)
+
+        grown = limiter.limit
+        for _ in range(3):
+            limiter.acquire()
+        for _ in range(3):
+            limiter.release(OVERLOAD)  # one burst of 429s
+        self.assertAlmostEqual(limiter.limit, grown / 2)
+        self.assertEqual(limiter.stats()["throttled"], 3)
+
+    def test_never_below_min_limit(self):
+        limiter = AdaptiveLimiter(initial=2, min_limit=1, decrease_interval=0)
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(OVERLOAD)
+        self.assertEqual(limiter.limit, 1)
+
+
+class RetryPolicyTests(SimpleTestCase):
+    def test_backoff_is_bounded_and_gives_up(self):
+        policy = RetryPolicy(max_attempts=4, base_delay=0.5, max_delay=1.5)
+        error = rate_limited()
+        for attempt, ceiling in ((1, 0.5), (2, 1.0), (3, 1.5)):
+            self.assertTrue(all(0 <= policy.delay(error, attempt) <= ceiling for _ in range(50)))
+        self.assertIsNone(policy.delay(error, 4))
+        self.assertIsNone(policy.delay(ValueError("bad prompt"), 1))
+        self.assertIsNone(policy.delay(LLMOverloaded("shed"), 1))
+
+    def test_retry_after_and_deadline_are_honored(self):
+        policy = RetryPolicy(base_delay=0.5)
+        self.assertTrue(7 <= policy.delay(rate_limited("7"), 1) <= 7.5)
+        with deadline_scope(2):
+            self.assertIsNone(policy.delay(rate_limited("7"), 1))
+
+    def test_provider_retries_then_reports_overload(self):
+        calls = []
+
+        class Flaky:
+            def generate(self, prompt, meta=None):
+                calls.append(prompt)
+                if len(calls) < 3:
+                    raise rate_limited()
+                return {"ok": True}
+
+        limited = LimitedProvider(Flaky(), AdaptiveLimiter(), RetryPolicy(max_attempts=3, base_delay=0))
+        self.assertEqual(limited.generate("p"), {"ok": True})
+        self.assertEqual(limited.limiter.stats()["retries"], 2)
+
+        calls.clear()
+        limited.policy.max_attempts = 2
+        with self.assertRaises(LLMOverloaded) as raised:
+            limited.generate("p")
+        self.assertIsInstance(raised.exception.__cause__, RateLimitError)
+        self.assertEqual(limited.limiter.stats()["in_flight"], 0)
+
+
+class RateLimitedStream(BaseLLMProvider):
+    """Every stream is refused with a 429 asking for a short wait."""
+
+    def __init__(self):
+        self.attempts = 0
+
+    def generate(self, prompt, meta=None):
+        raise rate_limited("0.05")
+
+    def stream_generate(self, prompt, meta=None):
+        self.attempts += 1
+        raise rate_limited("0.05")
+        yield
+
+    async def astream_generate(self, prompt, meta=None):
+        self.attempts += 1
+        raise rate_limited("0.05")
+        yield
+
+
+@override_settings(LLM_CACHE_ENABLED=False)
+class RequestDeadlineTests(TestCase):
+    def setUp(self):
+        self.upstream = RateLimitedStream()
+        ai_core.factory._provider_instance = LimitedProvider(
+            self.upstream, AdaptiveLimiter(), RetryPolicy(max_attempts=100, base_delay=0.01))
+        self.addCleanup(setattr, ai_core.factory, "_provider_instance", None)
+        self.payload = {"user_story": "As a payer I want receipts.",
+                        "team_id": Team.objects.create(name="Payments", context_info="Card payments").id}
+
+    def assert_gave_up_at_the_deadline(self, events, started):
+        # without the deadline, 100 attempts would take over 5 seconds
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertLess(self.upstream.attempts, 30)
+        self.assertEqual(events[-1][0], "error")
+        self.assertIn("overloaded", events[-1][1]["error"])
+
+    def test_streamed_response_stops_retrying_at_the_deadline(self):
+        started = time.monotonic()
+        response = self.client.post("/api/generate/testcases/prompt/?stream=1", self.payload,
+                                    content_type="application/json", HTTP_X_REQUEST_TIMEOUT="0.3")
+        self.assert_gave_up_at_the_deadline(read_events(response), started)
+
+    async def test_async_streamed_response_stops_retrying_at_the_deadline(self):
+        started = time.monotonic()
+        response = await self.async_client.post("/api/async/generate/testcases/prompt/?stream=1", self.payload,
+                                                content_type="application/json",
+                                                headers={"X-Request-Timeout": "0.3"})
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assert_gave_up_at_the_deadline(parse_events(body), started)
+
+
+@override_settings(AI_PROVIDER="mock", LLM_CACHE_ENABLED=False)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        ai_core.factory._provider_instance = None
+        self.addCleanup(setattr, ai_core.factory, "_provider_instance", None)
+
+    def enqueue(self, max_attempts=3):
+        with self.settings(JOB_MAX_ATTEMPTS=max_attempts):
+            prompt = "Generate up to 2 test cases.\nUser Story:\nAs a payer I want receipts."
+            return jobs.enqueue_generation("/api/generate/test-cases/", prompt, {"type": "test_cases"})
+
+    def test_one_worker_claims_until_its_lease_lapses(self):
+        job = self.enqueue()
+        first = jobs.claim("worker-1")
+        self.assertEqual((first.id, first.status, first.attempts), (job.id, GenerationJob.RUNNING, 1))
+        self.assertIsNone(jobs.claim("worker-2"))
+
+        GenerationJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        second = jobs.claim("worker-2")
+        self.assertEqual((second.id, second.worker, second.attempts), (job.id, "worker-2", 2))
+
+        with self.assertLogs("qa_api.jobs", "INFO"):
+            jobs.run_job(first, "worker-1")  # the lapsed worker's late result is discarded
+        self.assertEqual(GenerationJob.objects.get(id=job.id).status, GenerationJob.RUNNING)
+        jobs.run_job(second, "worker-2")
+        finished = GenerationJob.objects.get(id=job.id)
+        self.assertEqual(finished.status, GenerationJob.SUCCEEDED)
+        self.assertEqual(len(json.loads(finished.result["test_cases"])["test_cases"]), 2)
+
+    @override_settings(MOCK_LLM={"error_rate": 1.0}, LLM_LIMITER_ENABLED=False, JOB_RETRY_BASE_DELAY=30)
+    def test_failures_are_retried_with_backoff_then_fail(self):
+        job = self.enqueue(max_attempts=2)
+        with self.assertLogs("qa_api.jobs", "INFO"):
+            jobs.run_job(jobs.claim("worker-1"), "worker-1")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (GenerationJob.QUEUED, ""))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=25))
+        self.assertIsNone(jobs.claim("worker-1"))  # not before its backoff
+
+        GenerationJob.objects.filter(id=job.id).update(run_after=timezone.now())
+        with self.assertLogs("qa_api.jobs", "WARNING"):
+            jobs.run_job(jobs.claim("worker-1"), "worker-1")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (GenerationJob.FAILED, 2))
+        self.assertTrue(job.error)
+        self.assertIsNotNone(job.expires_at)
+
+
+class SectionSelectionTests(SimpleTestCase):
+    DOC = ("1 Overview\nPayments for the web shop.\n"
+           "2 Build Pipeline\nCI builds every branch.\n"
+           "2.1 Release Builds\nTagged builds ship.\n"
+           "3 User Interface\nCheckout form layout.\n")
+
+    def test_headings_match_on_whole_words_with_subsections(self):
+        self.assertEqual(select_sections(self.DOC, ["UI"]), "")  # not the "ui" inside "Build"
+        self.assertEqual(select_sections(self.DOC, ["user interface"]), "3 User Interface\nCheckout form layout.")
+        self.assertEqual(select_sections(self.DOC, ["Build Pipeline", "2.1"]),
+                         "2 Build Pipeline\nCI builds every branch.\n2.1 Release Builds\nTagged builds ship.")
+        self.assertEqual(select_sections(self.DOC, ["Pipeline Build"]), "")
+
+    def test_unmatched_hint_keeps_the_whole_document(self):
+        def document_text(**params):
+            return _document_text(dict(documents=[SimpleUploadedFile("spec.txt", self.DOC.encode())], **params))
+
+        self.assertEqual(document_text(section_hint="UI"), "UI\n\n" + self.DOC)
+        self.assertEqual(document_text(section_hint="3"), "3 User Interface\nCheckout form layout.")
+        with self.assertRaisesMessage(ValueError, "Available sections: 1 Overview; 2 Build Pipeline; 3 User Interface"):
+            document_text(sections=["UI"])
+
+
+@override_settings(KB_VECTOR_INDEX_ENABLED=False)
+class KnowledgeBaseSearchTests(TestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name="Payments", tech_stack="Django, Postgres", key_contacts="ops@")
+
+    def article(self, title, content, tags=(), team=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return KnowledgeBase.objects.create(title=title, content=content, tags=list(tags), created_by="tests",
+                                                category="project_specific" if team else "universal",
+                                                project_team=team)
+
+    def test_bm25_weights_titles_and_needs_every_term(self):
+        body = self.article("Release checklist", "Rotate the signing keys before the release train leaves.")
+        title = self.article("Signing keys", "Where the keys live and who may rotate them.")
+        self.article("Holidays", "Nobody rotates anything in August.")
+
+        found = kb_search.search("signing keys")
+        self.assertEqual([a.pk for a in found], [title.pk, body.pk])
+        self.assertLess(found[0].score, found[1].score)  # bm25(): lower is better
+        self.assertIn("<mark>keys</mark>", found[1].snippet)
+        self.assertEqual([a.pk for a in kb_search.search("signing august")], [])
+        self.assertEqual(len(kb_search.search("signing august", any_term=True)), 3)
+
+    def test_phrases_prefixes_filters_and_edits(self):
+        mine = self.article("Deploy guide", "Blue green deployment with a manual gate.", team=self.team)
+        other = self.article("Deploy guide", "Green blue switch-over.", team=Team.objects.create(name="Mobile"))
+
+        self.assertEqual([a.pk for a in kb_search.search('"blue green"')], [mine.pk])
+        self.assertEqual({a.pk for a in kb_search.search("deploy*")}, {mine.pk, other.pk})
+        self.assertEqual([a.pk for a in kb_search.search("deploy", team_id=self.team.id)], [mine.pk])
+
+        KnowledgeBase.objects.filter(pk=other.pk).update(content="Canary releases only.")  # triggers, not signals
+        self.assertEqual([a.pk for a in kb_search.search("canary")], [other.pk])
+        self.assertEqual([a.pk for a in kb_search.search("switch")], [])
+
+
+@override_settings(KB_VECTOR_INDEX_ENABLED=False)
+class TagIndexTests(TestCase):
+    def test_any_and_all_filters_follow_saved_tags(self):
+        both = KnowledgeBase.objects.create(title="Login", content="SSO login.", category="universal",
+                                            tags=[" Auth ", "SSO", "auth"], created_by="tests")
+        auth = KnowledgeBase.objects.create(title="Tokens", content="API tokens.", category="universal",
+                                            tags=["AUTH"], created_by="tests")
+        self.assertEqual(sorted(KnowledgeBaseTag.objects.filter(article=both).values_list("tag", flat=True)),
+                         ["auth", "sso"])
+
+        def tagged(tags, mode):
+            return set(kb_tags.filter_articles(KnowledgeBase.objects.all(), tags, mode).values_list("id", flat=True))
+
+        self.assertEqual(tagged(["auth", "sso"], kb_tags.ANY), {both.pk, auth.pk})
+        self.assertEqual(tagged(["auth", "sso"], kb_tags.ALL), {both.pk})
+        self.assertEqual(tagged(["Auth", "auth"], kb_tags.ALL), {both.pk, auth.pk})  # one distinct tag
+        self.assertEqual([a.pk for a in kb_search.search("login", tags=["auth", "sso"], tag_mode=kb_tags.ALL)],
+                         [both.pk])
+
+        auth.tags = ["auth", "sso"]
+        auth.save()
+        self.assertEqual(tagged(["auth", "sso"], kb_tags.ALL), {both.pk, auth.pk})
+        self.assertEqual(kb_tags.facets(), [{"tag": "auth", "count": 2}, {"tag": "sso", "count": 2}])
+
+
+class VectorIndexTests(SimpleTestCase):
+    DIM = 64
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        self.index = VectorIndex(self.path, self.DIM)
+
+    def vector(self, text):
+        return embed(text, self.DIM)
+
+    def keys(self, text, index=None, **filters):
+        return [key for key, _ in (index or self.index).search(self.vector(text), k=50, **filters)]
+
+    def assert_df_consistent(self):
+        self.assertTrue(self.index._refresh())
+        live = np.asarray(self.index._vectors[:self.index._meta["rows"]]) != 0
+        self.assertTrue(np.array_equal(np.asarray(self.index._df), live.sum(axis=0)))
+
+    def test_upsert_replaces_in_place_and_deleted_rows_are_reused(self):
+        self.index.upsert(1, self.vector("staging credentials rotation"))
+        self.index.upsert(2, self.vector("refunds for card payments"))
+        self.index.upsert(1, self.vector("release train schedule"))
+        self.assertEqual((len(self.index), self.index._read_meta()["rows"]), (2, 2))
+        self.assertEqual(self.keys("release train schedule")[0], 1)
+        self.assertNotIn(1, self.keys("staging credentials rotation"))
+        self.assert_df_consistent()
+
+        self.index.delete_many([1])
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.keys("release train schedule"), [])
+        self.index.upsert(3, self.vector("holiday rota"))
+        self.assertEqual((len(self.index), self.index._read_meta()["rows"]), (2, 2))  # the tombstone, not a new row
+        self.assertEqual(self.keys("holiday rota"), [3])
+        self.assert_df_consistent()
+
+    def test_grows_past_min_capacity(self):
+        count = MIN_CAPACITY + 10
+        self.index.upsert_many([(key, self.vector(f"article topic{key}"), None, 0) for key in range(count)])
+        meta = self.index._read_meta()
+        self.assertEqual((len(self.index), meta["rows"]), (count, count))
+        self.assertGreaterEqual(meta["capacity"], count)
+        self.assertEqual(self.keys(f"article topic{count - 1}")[0], count - 1)
+
+    def test_team_category_and_universal_filters(self):
+        text = "staging credentials"
+        self.index.upsert_many([(key, self.vector(f"filler {key}"), 9, 0) for key in range(100, 120)])
+        self.index.upsert(1, self.vector(text), team_id=1, category=0)
+        self.index.upsert(2, self.vector(text), team_id=2, category=0)
+        self.index.upsert(3, self.vector(text), category=1)
+
+        self.assertEqual(sorted(self.keys(text)[:3]), [1, 2, 3])
+        self.assertEqual(self.keys(text, team_id=1), [1])
+        self.assertEqual(self.keys(text, category=1), [3])
+        self.assertEqual(sorted(self.keys(text, team_id=1, include_universal_code=1)), [1, 3])
+        self.assertEqual(self.keys(text, team_id=5), [])
+
+    def test_readers_remap_after_another_writer(self):
+        reader = VectorIndex(self.path, self.DIM)
+        self.index.upsert(1, self.vector("staging credentials"))
+        self.assertEqual(self.keys("staging credentials", reader), [1])
+        generation = reader._meta["generation"]
+
+        last = MIN_CAPACITY + 1
+        self.index.upsert_many([(key, self.vector(f"article topic{key}"), None, 0) for key in range(2, last + 1)])
+        self.assertEqual(self.keys(f"article topic{last}", reader)[0], last)
+        self.assertEqual(len(reader), last)
+        self.assertGreater(reader._meta["generation"], generation)
+
+
+class KnowledgeBaseVectorTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(KB_VECTOR_DIR=directory.name, KB_VECTOR_INDEX_ENABLED=True))
+
+    def article(self, title, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return KnowledgeBase.objects.create(title=title, content=content, category="universal",
+                                                created_by="tests")
+
+    def test_paraphrase_ranks_above_unrelated_articles(self):
+        self.article("Refund policy", "Card refunds settle within five working days.")
+        staging = self.article("Staging environment access",
+                               "Ask the platform team for staging credentials; they are rotated monthly.")
+        self.article("Holiday rota", "Book leave in the team calendar before the sprint starts.")
+
+        found = kb_vectors.search("Who hands out credentials for the staging environment?")
+        self.assertEqual(found[0][0], staging.pk)
+        self.assertTrue(all(score < found[0][1] for _, score in found[1:]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            staging.delete()
+        self.assertNotIn(staging.pk, [pk for pk, _ in kb_vectors.search("staging credentials")])
+
+
+class PassageSplitTests(SimpleTestCase):
+    TEXT = " ".join(
+        f"Step {n} of the release checklist covers signing key {n}, its owner and the rollback plan."
+        for n in range(1, 40)
+    ) + "\nAppendix: contacts for the release train.\n"
+
+    def assert_windows(self, text, max_tokens, overlap_tokens):
+        spans = split_passages(text, max_tokens, overlap_tokens)
+        covered = set()
+        for start, end in spans:
+            covered.update(range(start, end))
+            self.assertLessEqual(count_tokens(text[start:end]), max_tokens)
+        self.assertEqual({i for i, char in enumerate(text) if not char.isspace()} - covered, set())
+        starts = [start for start, _ in spans]
+        self.assertEqual(starts, sorted(set(starts)))  # every window starts after the previous one
+        return spans
+
+    def test_windows_cover_the_text_within_max_tokens_and_overlap(self):
+        spans = self.assert_windows(self.TEXT, 80, 30)
+        self.assertGreater(len(spans), 3)
+        self.assertTrue(all(nxt[0] < end for (_, end), nxt in zip(spans, spans[1:])))  # consecutive windows overlap
+
+    def test_one_very_long_sentence_still_moves_forward(self):
+        sentence = " ".join(f"word{n}" for n in range(600)) + "."
+        self.assert_windows(sentence, 40, 30)
+        self.assert_windows("x" * 5000, 40, 30)  # one word longer than a window
+
+
+class PassageSyncTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(KB_VECTOR_DIR=directory.name, KB_PASSAGE_TOKENS=40,
+                                            KB_PASSAGE_OVERLAP_TOKENS=10))
+
+    def test_unchanged_content_is_not_resplit(self):
+        content = " ".join(f"Rotation note {n}: keys rotate every {n} weeks." for n in range(20))
+        with self.captureOnCommitCallbacks(execute=True):
+            article = KnowledgeBase.objects.create(title="Key rotation", content=content, category="universal",
+                                                   created_by="tests")
+        ids = set(KnowledgePassage.objects.filter(article=article).values_list("id", flat=True))
+        self.assertGreater(len(ids), 1)
+        self.assertEqual(passages.sync(article), [])
+
+        article.content = content + " Ask the platform team first."
+        self.assertEqual(set(passages.sync(article)), ids)
+        self.assertTrue(KnowledgePassage.objects.filter(article=article).values_list("text", flat=True)
+                        .last().endswith("Ask the platform team first."))
+
+
+# prune common terms, FTS ranking, articles, passages, team, answer cache lookup,
+# then QAQuery and its sources inserted in one savepoint
+ASSISTANT_QUERY_BUDGET = 10
+
+
+@override_settings(AI_PROVIDER="mock", LLM_CACHE_ENABLED=False, LLM_USAGE_RECORDING=False,
+                   QUERY_STATS_HEADERS=True, COUNTER_FLUSH_INTERVAL=0)
+class AssistantTestCase(TestCase):
+    """Mock provider, a throwaway vector index directory and a team to ask for."""
+
+    def setUp(self):
+        vector_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(vector_dir.cleanup)
+        self.enterContext(override_settings(KB_VECTOR_DIR=vector_dir.name))
+        ai_core.factory._provider_instance = None
+        self.addCleanup(setattr, ai_core.factory, "_provider_instance", None)
+        faq.load()  # as at startup
+        self.addCleanup(counters.discard)  # never flushed at exit, after the test database is gone
+        self.team = Team.objects.create(name="Payments", tech_stack="Django, Postgres", key_contacts="ops@")
+        kb_search.fts_available()
+
+    def add_articles(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                KnowledgeBase.objects.create(
+                    title=f"Staging access {i}",
+                    content=f"Request staging credentials from the platform team. Rotation note {i}.",
+                    category="universal" if i % 2 else "project_specific",
+                    project_team=self.team if i % 2 == 0 else None,
+                    tags=["access"],
+                    created_by="tests",
+                )
+
+    def ask(self, question="How do I get staging credentials?", query=""):
+        return self.client.post(
+            f"/api/qa-assistant/{query}",
+            {"question": question, "project_team_id": self.team.id},
+            content_type="application/json",
+        )
+
+    def rate(self, query_id, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/qa-feedback/", {"query_id": query_id, "rating": rating},
+                             content_type="application/json")
+
+
+class AssistantQueryBudgetTests(AssistantTestCase):
+    def test_query_count_is_fixed(self):
+        self.add_articles(4)
+        with self.assertNumQueries(ASSISTANT_QUERY_BUDGET):
+            response = self.ask()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-DB-Queries"], str(ASSISTANT_QUERY_BUDGET))
+        self.assertTrue(response.json()["related_docs"])
+
+        self.add_articles(20)
+        with self.assertNumQueries(ASSISTANT_QUERY_BUDGET):
+            self.ask()
+
+    def test_related_docs_keep_their_shape_unless_v2_is_asked_for(self):
+        self.add_articles(4)
+        related = self.ask().json()["related_docs"]
+        self.assertLessEqual(len(related), 3)
+        team_doc = next(doc for doc in related if doc["project_team"])
+        self.assertEqual(team_doc["project_team"]["name"], "Payments")
+        self.assertEqual(team_doc["project_team"]["tech_stack"], "Django, Postgres")
+        self.assertIn("Request staging credentials", team_doc["content"])
+        self.assertIn("snippet", team_doc)
+
+        with self.assertNumQueries(ASSISTANT_QUERY_BUDGET):
+            compact = self.ask(query="?related_docs_version=2").json()["related_docs"]
+        team_doc = next(doc for doc in compact if doc["project_team"])
+        self.assertEqual(team_doc["project_team"], {"id": self.team.id, "name": "Payments"})
+        self.assertNotIn("content", team_doc)
+
+
+class AnswerCacheTests(AssistantTestCase):
+    def test_well_rated_answer_is_served_again(self):
+        self.add_articles(2)
+        first = self.ask().json()
+        self.assertFalse(self.ask().json()["cached"])  # not rated yet
+
+        self.rate(first["query_id"], 5)
+        again = self.ask("how can I get my staging credentials").json()
+        self.assertTrue(again["cached"])
+        self.assertEqual(again["response"], first["response"])
+        self.assertEqual(QAQuery.objects.get(pk=again["query_id"]).cached_from_id, first["query_id"])
+
+    def test_article_change_invalidates(self):
+        self.add_articles(2)
+        first = self.ask().json()
+        self.rate(first["query_id"], 5)
+        self.assertTrue(self.ask().json()["cached"])
+
+        article = QAQuery.objects.get(pk=first["query_id"]).sources.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            article.content += " Credentials expire after 90 days."
+            article.save()
+        self.assertFalse(self.ask().json()["cached"])
+
+    def test_low_rating_on_served_copy_withdraws_answer(self):
+        self.add_articles(2)
+        first = self.ask().json()
+        self.rate(first["query_id"], 4)
+        served = self.ask().json()
+        self.rate(served["query_id"], 1)
+        self.assertFalse(self.ask().json()["cached"])
+
+
+class FAQMatcherTests(AssistantTestCase):
+    def setUp(self):
+        super().setUp()
+        self.faq = FAQ.objects.create(question="How do I get test environment access?", answer="Use the access portal.",
+                                      category="access", project_team=self.team)
+        faq.load()
+
+    def test_known_question_is_answered_from_memory(self):
+        with self.assertNumQueries(0):
+            data = self.ask("how do I get access to the test enviroment").json()
+        self.assertEqual(data["faq_id"], self.faq.id)
+        self.assertEqual(data["response"], "Use the access portal.")
+        self.assertFalse(QAQuery.objects.exists())
+
+        counters.flush()
+        self.faq.refresh_from_db()
+        self.assertEqual(self.faq.frequency, 1)
+
+    def test_other_teams_and_saved_changes(self):
+        other = Team.objects.create(name="Mobile")
+        self.assertIsNone(faq.match("How do I get test environment access?", other.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faq.project_team = None
+            self.faq.save()
+        self.assertEqual(faq.match("How do I get test environment access?", other.id)["id"], self.faq.id)
+
+    def test_frequent_questions_become_candidates(self):
+        for _ in range(3):
+            self.ask("Who owns the staging database?")
+        candidates = self.client.get("/api/faq/candidates/").json()
+        self.assertEqual([c["count"] for c in candidates], [3])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            promoted = self.client.post("/api/faq/promote/", {"query_id": candidates[0]["query_id"], "category": "ownership"},
+                                        content_type="application/json").json()
+        self.assertEqual(promoted["frequency"], 3)
+        self.assertEqual(self.client.get("/api/faq/candidates/").json(), [])
+        self.assertEqual(self.ask("who owns the staging database").json()["faq_id"], promoted["id"])
+
+
+class UsageCounterTests(AssistantTestCase):
+    def test_usage_is_written_behind_in_one_transaction(self):
+        self.add_articles(4)
+        with self.assertNumQueries(ASSISTANT_QUERY_BUDGET):
+            self.ask()
+        self.ask()
+        used = KnowledgeBase.objects.filter(usage_count__gt=0)
+        self.assertFalse(used.exists())
+
+        # one savepoint around one UPDATE per distinct increment
+        with self.assertNumQueries(3):
+            self.assertEqual(counters.flush(), 8)
+        self.assertEqual(sorted(used.values_list("usage_count", flat=True)), [2, 2, 2, 2])
+        self.assertEqual(counters.flush(), 0)
+
+    def test_flush_leaves_the_search_index_alone(self):
+        self.add_articles(2)
+        counters.kb_usage.add_many(KnowledgeBase.objects.values_list("id", flat=True))
+
+        def changes():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT total_changes()")  # counts rows written by triggers too
+                return cursor.fetchone()[0]
+
+        before = changes()
+        counters.flush()
+        self.assertEqual(changes() - before, 2)  # the two usage_count rows, no FTS re-index
+        self.assertEqual(len(kb_search.search("rotation")), 2)
+
+    def test_popular_articles_rank_first_among_equals(self):
+        self.add_articles(2)
+        articles = list(KnowledgeBase.objects.order_by("id"))
+        for article in articles:
+            article.score = 0.01
+        counters.kb_usage.add(articles[-1].pk, 50)
+        self.assertEqual(kb_search.popularity_ranked(articles)[0].pk, articles[-1].pk)
+
+
+class BulkImportExportTests(AssistantTestCase):
+    def import_body(self, body, content_type="application/x-ndjson"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/api/knowledgebase/import/", body, content_type=content_type)
+
+    def test_ndjson_import_indexes_each_batch(self):
+        rows = [{"title": f"Runbook {i}", "content": f"Restart service {i} with the deploy tool.", "category": "tools",
+                 "project_team_id": self.team.id, "tags": ["Runbook"]} for i in range(5)]
+        body = "\n".join([json.dumps(rows[0]), "{broken", json.dumps({"title": "x", "content": "y", "category": "nope"})]
+                         + [json.dumps(row) for row in rows[1:]])
+        with self.settings(KB_IMPORT_BATCH_SIZE=2):
+            result = self.import_body(body).json()
+
+        self.assertEqual((result["created"], result["updated"], result["failed"]), (5, 0, 2))
+        self.assertEqual([error["line"] for error in result["errors"]], [2, 3])
+        self.assertEqual(KnowledgeBaseTag.objects.filter(tag="runbook").count(), 5)
+        self.assertEqual(KnowledgePassage.objects.count(), 5)
+        self.assertEqual([a.title for a in kb_search.search("restart service 3")], ["Runbook 3"])
+
+    def test_csv_export_imports_back_as_updates(self):
+        self.add_articles(3)
+        response = self.client.get("/api/knowledgebase/export/?file_format=csv")
+        exported = b"".join(response.streaming_content).decode()
+        self.assertEqual(exported.count("\n"), 4)
+
+        result = self.import_body(exported.replace("Rotation note", "Rotation memo"), content_type="text/csv").json()
+        self.assertEqual((result["created"], result["updated"]), (0, 3))
+        self.assertTrue(all("Rotation memo" in text for text in KnowledgePassage.objects.values_list("text", flat=True)))
+        self.assertEqual(kb_search.search("memo")[0].tags, ["access"])
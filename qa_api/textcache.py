@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import zlib
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import ExtractedText
+from .parsing import EXTRACTOR_VERSION
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def content_hash(upload):
+    """Hex SHA-256 of an upload's bytes; free for SpooledUpload, one chunked read otherwise."""
+    digest = getattr(upload, "sha256", None)
+    if digest is not None:
+        return digest.hexdigest()
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for chunk in iter(lambda: upload.read(HASH_CHUNK_BYTES), b""):
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(upload):
+    """Cache key for a PDF/DOCX upload, or None when the cache is off or the file cannot be hashed."""
+    if not settings.EXTRACTED_TEXT_CACHE_ENABLED:
+        return None
+    try:
+        return content_hash(upload)
+    except Exception as e:
+        logger.warning("Hashing %s failed: %s", upload.name, e)
+        return None
+
+
+def get_text(key):
+    """Cached text for a content hash under the current extractor, or None."""
+    if key is None:
+        return None
+    try:
+        row = (ExtractedText.objects.filter(sha256=key, extractor_version=EXTRACTOR_VERSION)
+               .values_list("id", "text").first())
+        if row is None:
+            return None
+        ExtractedText.objects.filter(id=row[0]).update(last_used_at=timezone.now(), hits=F("hits") + 1)
+        return zlib.decompress(bytes(row[1])).decode("utf-8")
+    except Exception as e:
+        logger.warning("Extracted text cache lookup failed: %s", e)
+        return None
+
+
+def put_text(key, text):
+    """Store a file's extracted text, then evict the least recently used entries beyond the size cap."""
+    if key is None:
+        return
+    blob = zlib.compress(text.encode("utf-8"), settings.EXTRACTED_TEXT_CACHE_COMPRESSION)
+    if len(blob) > settings.EXTRACTED_TEXT_CACHE_MAX_BYTES:
+        return
+    try:
+        ExtractedText.objects.create(sha256=key, extractor_version=EXTRACTOR_VERSION,
+                                     text=blob, size=len(blob), chars=len(text))
+    except IntegrityError:
+        return  # a concurrent request stored the same file
+    except Exception as e:
+        logger.warning("Extracted text cache store failed: %s", e)
+        return
+    try:
+        evict()
+    except Exception as e:
+        logger.warning("Extracted text cache eviction failed: %s", e)
+
+
+def evict(max_bytes=None):
+    """Delete least recently used entries until the cache fits max_bytes. Returns the number removed."""
+    if max_bytes is None:
+        max_bytes = settings.EXTRACTED_TEXT_CACHE_MAX_BYTES
+    excess = (ExtractedText.objects.aggregate(total=Sum("size"))["total"] or 0) - max_bytes
+    if excess <= 0:
+        return 0
+    doomed = []
+    for pk, size in ExtractedText.objects.order_by("last_used_at", "id").values_list("id", "size").iterator():
+        doomed.append(pk)
+        excess -= size
+        if excess <= 0:
+            break
+    return ExtractedText.objects.filter(id__in=doomed).delete()[0]
@@ -0,0 +1,103 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Upload is too large."
+    default_code = "upload_too_large"
+
+
+class IngestionBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many uploads are being processed, try again shortly."
+    default_code = "ingestion_busy"
+
+
+class ByteBudget:
+    """Bytes of upload data this process currently holds, capped at DOCUMENT_INGEST_MAX_BYTES."""
+
+    def __init__(self):
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, size):
+        with self._lock:
+            if self.used + size > settings.DOCUMENT_INGEST_MAX_BYTES:
+                return False
+            self.used += size
+            return True
+
+    def release(self, size):
+        with self._lock:
+            self.used -= size
+
+
+ingest_budget = ByteBudget()
+
+
+class SpooledUpload(TemporaryUploadedFile):
+    """
+    Temp-file upload that gives its bytes back to ingest_budget when the
+    request closes it. sha256 is fed as the bytes stream in, so the content
+    hash never needs a second pass over the file.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reserved = 0
+        self.sha256 = hashlib.sha256()
+
+    def reserve(self, size):
+        if not ingest_budget.reserve(size):
+            return False
+        self.reserved += size
+        return True
+
+    def close(self):
+        if self.reserved:
+            ingest_budget.release(self.reserved)
+            self.reserved = 0
+        return super().close()
+
+
+class SpooledUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams every upload straight to a temp file (never into memory) and
+    rejects it as soon as it crosses DOCUMENT_UPLOAD_MAX_BYTES, the request
+    crosses DOCUMENT_REQUEST_MAX_BYTES, or the process is already holding
+    DOCUMENT_INGEST_MAX_BYTES of uploads.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.spooled = []
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > settings.DOCUMENT_REQUEST_MAX_BYTES:
+            raise UploadTooLarge(f"Request body exceeds {settings.DOCUMENT_REQUEST_MAX_BYTES} bytes.")
+
+    def new_file(self, *args, **kwargs):
+        super(TemporaryFileUploadHandler, self).new_file(*args, **kwargs)
+        self.file = SpooledUpload(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.spooled.append(self.file)
+
+    def _reject(self, error):
+        # Files already received never reach request.FILES, so nothing else would close them.
+        for upload in self.spooled:
+            upload.close()
+        raise error
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.DOCUMENT_UPLOAD_MAX_BYTES:
+            self._reject(UploadTooLarge(f"{self.file_name} exceeds {settings.DOCUMENT_UPLOAD_MAX_BYTES} bytes."))
+        if not self.file.reserve(len(raw_data)):
+            self._reject(IngestionBusy())
+        self.file.sha256.update(raw_data)
+        self.file.write(raw_data)
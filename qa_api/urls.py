@@ -6,16 +6,30 @@ from .views import (
     GenerateTestPlanFromPrompt,
     GenerateTestPlanFromDocument,
     GenerateTestPlanFromConfluenceUrl,
+    GenerateTestCasesBatch,
     AutoPopulateUserStoryDataFromKey,
     QAAssistantAPIView,
     QAFeedbackAPIView,
+    QAAnalyticsAPIView,
+    LLMStatsAPIView,
+    JobDetailAPIView,
     KnowledgeBaseViewSet,
+    FAQViewSet,
     TeamViewSet
 )
+from .async_views import (
+    AsyncGenerateTestCasesFromPrompt,
+    AsyncGenerateTestCasesFromDocument,
+    AsyncGenerateTestPlanFromPrompt,
+    AsyncGenerateTestPlanFromDocument,
+    AsyncGenerateTestPlanFromConfluenceUrl,
+    AsyncQAAssistantView,
+)
 
 urlpatterns = [
     path("generate/testcases/prompt/", GenerateTestCasesFromPrompt.as_view()),
     path("generate/testcases/document/", GenerateTestCasesFromDocument.as_view()),
+    path("generate/testcases/batch/", GenerateTestCasesBatch.as_view()),
     path("generate/testplan/prompt/", GenerateTestPlanFromPrompt.as_view()),
     path("generate/testplan/document/", GenerateTestPlanFromDocument.as_view()),
     path("generate/testplan/confluence_url/", GenerateTestPlanFromConfluenceUrl.as_view()),
@@ -23,6 +37,24 @@ urlpatterns = [
     path("teams/", TeamViewSet.as_view({'get': 'list'})),
     path("qa-assistant/", QAAssistantAPIView.as_view()),
     path("qa-feedback/", QAFeedbackAPIView.as_view()),  # POST for feedback
+    path("qa-analytics/", QAAnalyticsAPIView.as_view()),  # usage, ratings and answer cache hits
     path("knowledgebase/", KnowledgeBaseViewSet.as_view({'get': 'list', 'post': 'create'})),
+    path("knowledgebase/search/", KnowledgeBaseViewSet.as_view({'get': 'search'})),
+    path("knowledgebase/tags/", KnowledgeBaseViewSet.as_view({'get': 'tags'})),
+    path("knowledgebase/export/", KnowledgeBaseViewSet.as_view({'get': 'export'})),
+    path("knowledgebase/import/", KnowledgeBaseViewSet.as_view({'post': 'bulk_import'})),
+    path("faq/", FAQViewSet.as_view({'get': 'list', 'post': 'create'})),
+    path("faq/candidates/", FAQViewSet.as_view({'get': 'candidates'})),
+    path("faq/promote/", FAQViewSet.as_view({'post': 'promote'})),
+    path("ai/stats/", LLMStatsAPIView.as_view()),
+    path("jobs/<uuid:job_id>/", JobDetailAPIView.as_view(), name="job-detail"),
+
+    # Native async twins for ASGI deployments (qa_ai_assistant/asgi.py)
+    path("async/generate/testcases/prompt/", AsyncGenerateTestCasesFromPrompt.as_view()),
+    path("async/generate/testcases/document/", AsyncGenerateTestCasesFromDocument.as_view()),
+    path("async/generate/testplan/prompt/", AsyncGenerateTestPlanFromPrompt.as_view()),
+    path("async/generate/testplan/document/", AsyncGenerateTestPlanFromDocument.as_view()),
+    path("async/generate/testplan/confluence_url/", AsyncGenerateTestPlanFromConfluenceUrl.as_view()),
+    path("async/qa-assistant/", AsyncQAAssistantView.as_view()),
 
 ]
\ No newline at end of file
@@ -0,0 +1,36 @@
+from django.db.models import Count, Sum
+
+from .models import LLMCall
+
+
+def record_llm_call(record):
+    """LLM_USAGE_RECORDER target: persist one MeteredProvider record."""
+    LLMCall.objects.create(
+        model=record["model"][:100],
+        call_type=record["call"],
+        artifact_type=record["artifact_type"][:30],
+        source=record["source"][:50],
+        prompt_tokens=record["prompt_tokens"],
+        completion_tokens=record["completion_tokens"],
+        tokens_estimated=record["tokens_estimated"],
+        latency_ms=record["latency_ms"],
+        success=record["success"],
+        error=record["error"],
+    )
+
+
+def usage_summary(since=None):
+    """Token totals per model and artifact type, optionally since a datetime."""
+    calls = LLMCall.objects.all()
+    if since is not None:
+        calls = calls.filter(created_at__gte=since)
+    rows = (
+        calls.values("model", "artifact_type")
+        .annotate(
+            calls=Count("id"),
+            prompt_tokens=Sum("prompt_tokens"),
+            completion_tokens=Sum("completion_tokens"),
+        )
+        .order_by("model", "artifact_type")
+    )
+    return list(rows)
@@ -0,0 +1,299 @@
+"""
+Offline embeddings and a memory-mapped vector index.
+
+embed() turns text into a dense float32 vector by signed feature hashing of
+stemmed words and word pairs (sublinear TF, L2-normalized): no model files,
+no network, a few microseconds per sentence.
+
+VectorIndex keeps those vectors in one contiguous float32 matrix on disk,
+memory-mapped by every process that searches it, next to per-row key,
+team and category arrays and per-dimension document frequencies (which
+IDF-weight queries). A search is one matrix-vector product over the rows
+the team/category filter keeps, then a partial sort for the top k.
+
+Writers serialize on a lock file and bump the generation in meta.json;
+readers notice the change on their next search and re-map the files.
+"""
+import json
+import math
+import os
+import re
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows dev machines: single process, no locking
+    fcntl = None
+
+FORMAT_VERSION = 1
+MIN_CAPACITY = 1024
+# Below this share of rows selected by the filter, gather the rows first rather than scoring all of them
+GATHER_RATIO = 0.2
+BIGRAM_WEIGHT = 0.5
+NO_TEAM = -1
+NO_CATEGORY = -1
+
+_WORD = re.compile(r"[^\W_]+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from how i if in into is it me my of on or our "
+    "should so that the their then there these this to us was we what when where which who why will "
+    "with would you your".split()
+)
+_SUFFIXES = ("ing", "edly", "ed", "es", "s")
+
+
+def _stem(word):
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+            return word[:-len(suffix)]
+    return word
+
+
+def tokens(text):
+    """Lowercased, stemmed content words of text, in order."""
+    return [_stem(w) for w in _WORD.findall((text or "").lower()) if w not in _STOPWORDS and len(w) > 1]
+
+
+def embed(text, dim):
+    """Unit-length float32 vector of text (all zeros if it has no content words)."""
+    words = tokens(text)
+    counts = {}
+    for word in words:
+        counts[word] = counts.get(word, 0.0) + 1.0
+    for first, second in zip(words, words[1:]):
+        pair = first + " " + second
+        counts[pair] = counts.get(pair, 0.0) + BIGRAM_WEIGHT
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, count in counts.items():
+        h = zlib.crc32(feature.encode("utf-8"))
+        weight = 1.0 + math.log(count) if count >= 1 else count
+        vector[h % dim] += weight if h & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """
+    Keyed vectors (one row per key) with optional team/category codes, stored
+    under `path`. Open one per process and reuse it; see the module docstring.
+    """
+
+    def __init__(self, path, dim):
+        self.path = os.fspath(path)
+        self.dim = dim
+        self._seen = None  # (inode, mtime_ns) of meta.json when last mapped
+        self._meta = None
+
+    # -- files ---------------------------------------------------------
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._file("meta.json")) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, meta):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, self._file("meta.json"))
+
+    def _map(self, meta, mode):
+        capacity, dim = meta["capacity"], meta["dim"]
+        self._vectors = np.memmap(self._file("vectors.f32"), np.float32, mode, shape=(capacity, dim))
+        self._keys = np.memmap(self._file("keys.i64"), np.int64, mode, shape=(capacity,))
+        self._teams = np.memmap(self._file("teams.i64"), np.int64, mode, shape=(capacity,))
+        self._categories = np.memmap(self._file("categories.i8"), np.int8, mode, shape=(capacity,))
+        self._df = np.memmap(self._file("df.f64"), np.float64, mode, shape=(dim,))
+        self._meta = meta
+
+    def _size(self, name, nbytes):
+        with open(self._file(name), "ab") as fh:
+            fh.truncate(nbytes)
+
+    def _allocate(self, capacity, dim):
+        """Grow (or create) the files to hold `capacity` rows; new key slots are marked free."""
+        old = os.path.getsize(self._file("keys.i64")) // 8 if os.path.exists(self._file("keys.i64")) else 0
+        self._size("vectors.f32", capacity * dim * 4)
+        self._size("keys.i64", capacity * 8)
+        self._size("teams.i64", capacity * 8)
+        self._size("categories.i8", capacity)
+        if not os.path.exists(self._file("df.f64")):
+            self._size("df.f64", dim * 8)
+        if capacity > old:
+            keys = np.memmap(self._file("keys.i64"), np.int64, "r+", shape=(capacity,))
+            keys[old:] = -1
+            keys.flush()
+
+    def _refresh(self):
+        """Map the files, again if another process changed them since; False if there is no index."""
+        try:
+            stat = os.stat(self._file("meta.json"))
+        except OSError:
+            self._meta = None
+            return False
+        seen = (stat.st_ino, stat.st_mtime_ns)
+        if seen != self._seen or self._meta is None:
+            meta = self._read_meta()
+            if not meta or meta.get("version") != FORMAT_VERSION or meta.get("dim") != self.dim:
+                self._meta = None
+                return False
+            self._map(meta, "r")
+            self._seen = seen
+        return True
+
+    @contextmanager
+    def _writing(self, reset=False):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file("lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            meta = None if reset else self._read_meta()
+            if not meta or meta.get("version") != FORMAT_VERSION or meta.get("dim") != self.dim:
+                meta = self._reset()
+            self._map(meta, "r+")
+            yield meta
+            for array in (self._vectors, self._keys, self._teams, self._categories, self._df):
+                array.flush()
+            meta["generation"] += 1
+            self._write_meta(meta)
+            self._seen = None  # re-map read-only on the next search
+
+    def _reset(self):
+        for name in ("vectors.f32", "keys.i64", "teams.i64", "categories.i8", "df.f64"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        self._allocate(MIN_CAPACITY, self.dim)
+        meta = {"version": FORMAT_VERSION, "dim": self.dim, "capacity": MIN_CAPACITY, "rows": 0, "live": 0,
+                "generation": 0}
+        self._write_meta(meta)
+        return meta
+
+    # -- writes --------------------------------------------------------
+
+    def _rows_of(self, keys):
+        """{key: row} for the keys already stored."""
+        used = self._keys[:self._meta["rows"]]
+        found = np.flatnonzero(np.isin(used, np.asarray(keys, dtype=np.int64)))
+        return {int(used[row]): int(row) for row in found}
+
+    def _free_rows(self, meta, count):
+        """Rows for `count` new keys: tombstones first, then appended rows (growing the files)."""
+        free = np.flatnonzero(self._keys[:meta["rows"]] < 0)[:count].tolist()
+        missing = count - len(free)
+        if missing:
+            start = meta["rows"]
+            if start + missing > meta["capacity"]:
+                capacity = max(meta["capacity"] * 2, start + missing)
+                self._allocate(capacity, self.dim)
+                meta["capacity"] = capacity
+                self._map(meta, "r+")
+            free.extend(range(start, start + missing))
+            meta["rows"] = start + missing
+        return free
+
+    def upsert_many(self, items):
+        """Store [(key, vector, team_id or None, category code or NO_CATEGORY)], replacing existing keys."""
+        items = list({item[0]: item for item in items}.values())  # last write per key wins
+        if not items:
+            return
+        with self._writing() as meta:
+            existing = self._rows_of([item[0] for item in items])
+            new = [item for item in items if item[0] not in existing]
+            rows = dict(existing)
+            rows.update(zip((item[0] for item in new), self._free_rows(meta, len(new))))
+            for key, vector, team_id, category in items:
+                row = rows[key]
+                if key in existing:
+                    self._df -= self._vectors[row] != 0
+                else:
+                    meta["live"] += 1
+                self._vectors[row] = vector
+                self._df += vector != 0
+                self._keys[row] = key
+                self._teams[row] = NO_TEAM if team_id is None else team_id
+                self._categories[row] = category
+
+    def upsert(self, key, vector, team_id=None, category=NO_CATEGORY):
+        self.upsert_many([(key, vector, team_id, category)])
+
+    def delete_many(self, keys):
+        """Drop keys; their rows become tombstones reused by later inserts."""
+        if not keys:
+            return
+        with self._writing() as meta:
+            for row in self._rows_of(keys).values():
+                self._df -= self._vectors[row] != 0
+                self._vectors[row] = 0
+                self._keys[row] = -1
+                meta["live"] -= 1
+
+    def clear(self):
+        """Drop every row (and re-create the files at the configured dimension)."""
+        with self._writing(reset=True):
+            pass
+
+    # -- reads ---------------------------------------------------------
+
+    def __len__(self):
+        return self._meta["live"] if self._refresh() else 0
+
+    def query_vector(self, text):
+        """embed(text) weighted by each dimension's IDF in this index, re-normalized."""
+        vector = embed(text, self.dim)
+        if not self._refresh() or not vector.any():
+            return vector
+        idf = np.log((self._meta["live"] + 1.0) / (np.asarray(self._df) + 1.0)) + 1.0
+        vector = vector * idf.astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def scores(self, vector, keys):
+        """{key: cosine score} for the given keys that are stored."""
+        if not self._refresh() or not len(keys):
+            return {}
+        rows = self._rows_of(keys)
+        if not rows:
+            return {}
+        scores = self._vectors[list(rows.values())] @ vector
+        return {key: float(score) for key, score in zip(rows, scores)}
+
+    def search(self, vector, k=10, team_id=None, category=None, include_universal_code=None, min_score=0.0):
+        """
+        [(key, cosine score)] of the k rows closest to vector, best first.
+        team_id/category restrict the rows; with include_universal_code, rows of
+        that category are kept regardless of team.
+        """
+        if not self._refresh() or not vector.any():
+            return []
+        rows = self._meta["rows"]
+        keys = self._keys[:rows]
+        mask = keys >= 0
+        if category is not None:
+            mask &= self._categories[:rows] == category
+        if team_id is not None:
+            team = self._teams[:rows] == team_id
+            if include_universal_code is not None:
+                team |= self._categories[:rows] == include_universal_code
+            mask &= team
+        selected = int(np.count_nonzero(mask))
+        if not selected:
+            return []
+        if selected < rows * GATHER_RATIO:
+            candidates = np.flatnonzero(mask)
+            scores = self._vectors[candidates] @ vector
+        else:
+            candidates = None
+            scores = self._vectors[:rows] @ vector
+            scores[~mask] = -np.inf
+        k = min(k, selected)
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        rows_out = top if candidates is None else candidates[top]
+        return [(int(keys[row]), float(score)) for row, score in zip(rows_out, scores[top]) if score > min_score]
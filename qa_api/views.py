@@ -1,5 +1,8 @@
+import math
 import time
+from datetime import timedelta
 from django.shortcuts import render
+from django.utils import timezone
 
 # Create your views here.
 from rest_framework.views import APIView
@@ -7,10 +10,22 @@ from rest_framework.response import Response
 from rest_framework import status, viewsets
 from django.conf import settings
 from .models import Team, KnowledgeBase, FAQ, QAQuery
-from .serializers import QAQueryCreateSerializer, TeamSerializer, PromptSerializer, DocumentSerializer, ConfluencePageSerializer,UserStorySerializer, KnowledgeBaseSerializer, FeedbackSerializer
-from .parsing import extract_text_from_upload
-from .prompts import build_requirement_text, test_case_prompt, test_plan_prompt
+from .serializers import QAQueryCreateSerializer, TeamSerializer, PromptSerializer, DocumentSerializer, ConfluencePageSerializer,UserStorySerializer, KnowledgeBaseSerializer, FeedbackSerializer, BatchTestCaseSerializer, FAQSerializer, FAQPromoteSerializer
+from .extraction import TextReader, iter_document_text
+from .sections import build_index, outline, select_sections
+from . import answer_cache, faq, kb_bulk, kb_search, kb_tags
+from .retrieval import RELATED_DOCS_V1, RetrievalPipeline, related_docs_version
+from .prompts import build_requirement_text, budget_requirement_text, test_case_prompt, test_plan_prompt
+from .streaming import wants_stream, sse_event, sse_response, artifact_stream
+from .batch import batch_summary, build_batch_prompts, run_batch
+from .jobs import accepted, cancel, describe, enqueue_batch, enqueue_generation, get_job, wants_job
+from .chunking import ChunkedJob, ChunkedTestCases, ChunkedTestPlan, chunk_document, wants_chunking
+from .usage import usage_summary
+from django.http import StreamingHttpResponse
 from ai_core.factory import get_provider
+from ai_core.budget import PromptBudget
+from ai_core.tokens import count_tokens
+from ai_core.limiter import LLMOverloaded
 import json
 from rest_framework.decorators import action
 from django.db.models import Q, Count, Avg
@@ -31,150 +46,311 @@ def _assemble_context(validated):
     return validated.get("app_context", "") or "Generic web/mobile application for feature-level QA."
 
 
-class GenerateTestCasesFromPrompt(APIView):
+def _overloaded(e, response_class=Response):
+    """
+    503 with Retry-After, so clients back off instead of retrying into a
+    saturated backend. Async views pass JsonResponse as response_class.
+    """
+    response = response_class({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response["Retry-After"] = str(math.ceil(e.retry_after or 1))
+    return response
+
+
+def _flag(query, name):
+    """True when a query flag such as ?nocache=1 is set; takes request.query_params or request.GET."""
+    return query.get(name, "").lower() in ("1", "true", "yes")
+
+
+def _nocache(query):
+    """True when the caller asked to bypass the LLM response cache (?nocache=1)."""
+    return _flag(query, "nocache")
+
+
+def _dry_run(query):
+    """True when the caller only wants the prompt's token breakdown (?dry_run=1)."""
+    return _flag(query, "dry_run")
+
+
+def _tag_params(query_params):
+    """(tags, mode) from ?tags=a,b (or repeated ?tag=) and ?tag_mode=any|all."""
+    tags = [t for value in query_params.getlist('tags') for t in value.split(',')]
+    tags += query_params.getlist('tag')
+    mode = kb_tags.ALL if query_params.get('tag_mode', '').lower() == kb_tags.ALL else kb_tags.ANY
+    return tags, mode
+
+
+class GenerationAPIView(APIView):
+    """
+    Shared flow for the generate/... endpoints: validate the payload,
+    build the prompt, call the provider (or stream it as SSE with ?stream=1,
+    queue it as a background job with ?async=1, or only report its token
+    breakdown with ?dry_run=1).
+    Subclasses set serializer_class and implement build_prompt(), which may
+    return a ChunkedJob instead of a prompt for oversized documents.
+    """
+    serializer_class = None
+    budget = None  # PromptBudget of the last build_prompt() call
+
+    def build_prompt(self, validated):
+        """Return (prompt or ChunkedJob, meta) for a validated payload. Raise ValueError for unusable input."""
+        raise NotImplementedError
+
+    def dry_run_report(self, prompt, meta):
+        """Token breakdown of the prompt(s) that would be sent, without calling the LLM."""
+        report = {"type": meta.get("type"), "budget": self.budget.report() if self.budget else None}
+        if isinstance(prompt, ChunkedJob):
+            chunk_tokens = [count_tokens(p) for p in prompt.map_prompts()]
+            report.update({"chunked": True, "chunks": len(chunk_tokens), "chunk_prompt_tokens": chunk_tokens,
+                           "prompt_tokens": sum(chunk_tokens)})
+        else:
+            report.update({"chunked": False, "prompt_tokens": count_tokens(prompt), "prompt_chars": len(prompt)})
+        return report
+
     def post(self, request):
-        s = PromptSerializer(data=request.data)
+        s = self.serializer_class(data=request.data)
         s.is_valid(raise_exception=True)
 
-        user_story = s.validated_data.get("user_story", "")
-        ac = s.validated_data.get("acceptance_criteria", "")
-        feature_description = s.validated_data.get("feature_description", "")
-        app_context = _assemble_context(s.validated_data)
-        print("App context:", app_context)
-        max_cases = s.validated_data.get("max_cases", 8)
-
-        requirement_text = build_requirement_text(user_story, ac, feature_description, "", app_context)
-        prompt = test_case_prompt(app_context, requirement_text, max_cases)
+        try:
+            prompt, meta = self.build_prompt(s.validated_data)
+        except ValueError as ve:
+            return Response({"detail": str(ve)}, status=400)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        if _dry_run(request.query_params):
+            return Response(self.dry_run_report(prompt, meta))
+        meta["nocache"] = _nocache(request.query_params)
+        if wants_job(request.query_params):
+            job = enqueue_generation(request.path, prompt, meta)
+            return Response(accepted(request, job), status=status.HTTP_202_ACCEPTED)
 
         provider = get_provider()
+        if isinstance(prompt, ChunkedJob):
+            # Chunked results are merged server-side, so they are never streamed.
+            try:
+                return Response(prompt.run(provider, meta))
+            except LLMOverloaded as e:
+                return _overloaded(e)
+            except Exception as e:
+                return Response({"error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        if wants_stream(request.query_params):
+            return sse_response(artifact_stream(provider.stream_generate(prompt, meta=meta), meta.get("type")))
         try:
-            result = provider.generate(prompt, meta={"type": "test_cases"})
+            result = provider.generate(prompt, meta=meta)
             return Response(result)
+        except LLMOverloaded as e:
+            return _overloaded(e)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
 
 
-class GenerateTestCasesFromDocument(APIView):
-    def post(self, request):
-        s = DocumentSerializer(data=request.data)
-        s.is_valid(raise_exception=True)
+# Generous ceiling on characters per estimated token; the prompt budget trims precisely.
+MAX_CHARS_PER_TOKEN = 8
 
-        f = s.validated_data["document"]
-        doc_text = extract_text_from_upload(f)
-        if not doc_text.strip():
-            return Response({"detail": "Could not extract text from document."}, status=400)
 
-        app_context = _assemble_context(s.validated_data)
-        max_cases = s.validated_data.get("max_cases", 8)
-        section_hint = s.validated_data.get("section_hint", "")
+def _read_documents(validated, whole=False):
+    """
+    Text of every uploaded file, read only as far as it can be used: what can
+    fit the prompt budget, or up to DOCUMENT_TEXT_MAX_CHARS if it may be chunked
+    or sections are picked out of it (whole=True).
+    """
+    reader = TextReader(iter_document_text(validated["documents"]))
+    try:
+        if whole:
+            text = reader.read(settings.DOCUMENT_TEXT_MAX_CHARS)
+        else:
+            text = reader.read(PromptBudget().total * MAX_CHARS_PER_TOKEN)
+            if not reader.exhausted and (validated.get("chunked") or settings.CHUNKED_GENERATION_AUTO):
+                text += reader.read(settings.DOCUMENT_TEXT_MAX_CHARS - len(text))
+    finally:
+        reader.close()
+
+    if not text.strip():
+        raise ValueError("Could not extract text from any document.")
+    return text
 
-        requirement_text = build_requirement_text(
-            "", "", "", (section_hint + "\n\n" + doc_text) if section_hint else doc_text, app_context
-        )[:settings.MAX_CONTEXT_CHARS]
 
+def _document_text(validated):
+    """
+    Document text for the prompt. With sections=[...] or a section_hint that
+    names headings, only those sections (and their subsections) are used; a
+    section_hint that matches no heading is prepended as guidance instead.
+    """
+    sections = [s for s in validated.get("sections") or [] if s.strip()]
+    section_hint = validated.get("section_hint", "").strip()
+    if not (sections or section_hint):
+        return _read_documents(validated)
+
+    doc_text = _read_documents(validated, whole=True)
+    index = build_index(doc_text)
+    selected = select_sections(doc_text, sections + ([section_hint] if section_hint else []), index)
+    if selected:
+        return selected
+    if sections:
+        headings = outline(index)
+        available = f" Available sections: {'; '.join(headings)}." if headings else " The documents have no headings."
+        raise ValueError(f"None of the requested sections were found.{available}")
+    return section_hint + "\n\n" + doc_text
+
+
+class GenerateTestCasesFromPrompt(GenerationAPIView):
+    serializer_class = PromptSerializer
+
+    def build_prompt(self, validated):
+        user_story = validated.get("user_story", "")
+        ac = validated.get("acceptance_criteria", "")
+        feature_description = validated.get("feature_description", "")
+        app_context = _assemble_context(validated)
+        max_cases = validated.get("max_cases", 8)
+        meta = {"type": "test_cases"}
+
+        requirement_text, self.budget = budget_requirement_text(
+            user_story, ac, feature_description, "", app_context,
+            overhead_text=test_case_prompt(app_context, "", max_cases), meta=meta
+        )
         prompt = test_case_prompt(app_context, requirement_text, max_cases)
+        return prompt, meta
 
-        provider = get_provider()
-        try:
-            result = provider.generate(prompt, meta={"type": "test_cases", "source": "document"})
-            return Response(result)
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
 
+class GenerateTestCasesFromDocument(GenerationAPIView):
+    serializer_class = DocumentSerializer
 
-class GenerateTestPlanFromPrompt(APIView):
-    def post(self, request):
-        s = PromptSerializer(data=request.data)
-        s.is_valid(raise_exception=True)
+    def build_prompt(self, validated):
+        text = _document_text(validated)
 
-        user_story = s.validated_data.get("user_story", "")
-        ac = s.validated_data.get("acceptance_criteria", "")
-        feature_description = s.validated_data.get("feature_description", "")
-        app_context = _assemble_context(s.validated_data)
+        app_context = _assemble_context(validated)
+        max_cases = validated.get("max_cases", 8)
+        meta = {"type": "test_cases", "source": "document"}
 
-        requirement_text = build_requirement_text(user_story, ac, feature_description, "", app_context)
-        prompt = test_plan_prompt(app_context, requirement_text)
+        requirement_text, self.budget = budget_requirement_text(
+            "", "", "", text, app_context,
+            overhead_text=test_case_prompt(app_context, "", max_cases), meta=meta
+        )
+        if wants_chunking(validated, self.budget):
+            return ChunkedTestCases(app_context, chunk_document(text), max_cases), meta
 
-        provider = get_provider()
-        try:
-            result = provider.generate(prompt, meta={"type": "test_plan"})
-            return Response(result)
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        prompt = test_case_prompt(app_context, requirement_text, max_cases)
+        return prompt, meta
 
 
-class GenerateTestPlanFromDocument(APIView):
-    def post(self, request):
-        s = DocumentSerializer(data=request.data)
-        s.is_valid(raise_exception=True)
+class GenerateTestPlanFromPrompt(GenerationAPIView):
+    serializer_class = PromptSerializer
 
-        files = s.validated_data["documents"]
+    def build_prompt(self, validated):
+        user_story = validated.get("user_story", "")
+        ac = validated.get("acceptance_criteria", "")
+        feature_description = validated.get("feature_description", "")
+        app_context = _assemble_context(validated)
+        meta = {"type": "test_plan"}
+
+        requirement_text, self.budget = budget_requirement_text(
+            user_story, ac, feature_description, "", app_context,
+            overhead_text=test_plan_prompt(app_context, ""), meta=meta
+        )
+        prompt = test_plan_prompt(app_context, requirement_text)
+        return prompt, meta
 
-        # Extract text from each uploaded file
-        doc_texts = []
-        for f in files:
-            text = extract_text_from_upload(f)
-            if text.strip():
-                doc_texts.append(text)
 
-        if not doc_texts:
-            return Response(
-                {"detail": "Could not extract text from any document."},
-                status=400
-            )
+class GenerateTestPlanFromDocument(GenerationAPIView):
+    serializer_class = DocumentSerializer
 
-        # Combine into one string (works for 1 file or many)
-        combined_text = "\n\n".join(doc_texts)
+    def build_prompt(self, validated):
+        combined_text = _document_text(validated)
 
-        app_context = _assemble_context(s.validated_data)
+        app_context = _assemble_context(validated)
+        meta = {"type": "test_plan", "source": "document"}
+
+        requirement_text, self.budget = budget_requirement_text(
+            "", "", "", combined_text, app_context,
+            overhead_text=test_plan_prompt(app_context, ""), meta=meta
+        )
+        if wants_chunking(validated, self.budget):
+            return ChunkedTestPlan(app_context, chunk_document(combined_text)), meta
 
-        requirement_text = build_requirement_text("", "", "", combined_text, app_context)[:settings.MAX_CONTEXT_CHARS]
         prompt = test_plan_prompt(app_context, requirement_text)
+        return prompt, meta
 
-        provider = get_provider()
-        try:
-            result = provider.generate(prompt, meta={"type": "test_plan", "source": "document"})
-            return Response(result)
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+
+class GenerateTestPlanFromConfluenceUrl(GenerationAPIView):
+    serializer_class = ConfluencePageSerializer
+
+    def build_prompt(self, validated):
+        confluence_url = validated.get("confluence_url", "")
+        if not confluence_url:
+            raise ValueError("Confluence URL is required.")
+
+        app_context = _assemble_context(validated)
+
+        from confluence.services.confluence_services import ConfluenceService
+
+        # Get page content
+        confluence = ConfluenceService()
+        page_content = confluence.get_page_by_url(confluence_url)
+
+        # Validate that we have content
+        if not page_content['content'].strip():
+            raise ValueError("Confluence page has no content.")
+        doc_text = page_content['content']
+        meta = {"type": "test_plan", "source": "confluence"}
+
+        requirement_text, self.budget = budget_requirement_text(
+            "", "", "", doc_text, app_context,
+            overhead_text=test_plan_prompt(app_context, ""), meta=meta
+        )
+        prompt = test_plan_prompt(app_context, requirement_text)
+        return prompt, meta
         
-class GenerateTestPlanFromConfluenceUrl(APIView):
+
+class GenerateTestCasesBatch(APIView):
+    """
+    Generate test cases for many stories in one call.
+    Items fan out to the provider with a bounded concurrency; results come back
+    as NDJSON lines as they complete (?stream=1), as one aggregate, or
+    later from jobs/<id>/ (?async=1).
+    """
+
     def post(self, request):
-        s = ConfluencePageSerializer(data=request.data)
+        s = BatchTestCaseSerializer(data=request.data)
         s.is_valid(raise_exception=True)
 
-        confluence_url = s.validated_data.get("confluence_url", "")
-        if not confluence_url:
-            return Response({"detail": "Confluence URL is required."}, status=400)
+        concurrency = min(
+            s.validated_data.get("concurrency") or settings.BATCH_CONCURRENCY,
+            settings.BATCH_MAX_CONCURRENCY,
+        )
+        prompts = build_batch_prompts(
+            s.validated_data["items"],
+            default_team_id=s.validated_data.get("team_id"),
+            default_max_cases=s.validated_data["max_cases"],
+        )
+        meta = {"type": "test_cases", "source": "batch", "nocache": _nocache(request.query_params)}
+        if wants_job(request.query_params):
+            job = enqueue_batch(request.path, prompts, concurrency, meta)
+            return Response(accepted(request, job), status=status.HTTP_202_ACCEPTED)
+        results = run_batch(get_provider(), prompts, concurrency, meta)
 
-        app_context = _assemble_context(s.validated_data)
+        if wants_stream(request.query_params):
+            lines = (json.dumps(item, default=str) + "\n" for item in results)
+            return StreamingHttpResponse(lines, content_type="application/x-ndjson")
 
-        from confluence.services.confluence_services import ConfluenceService
+        return Response(batch_summary(results))
 
-        try:
-            # Get page content
-            confluence = ConfluenceService()
-            page_content = confluence.get_page_by_url(confluence_url)
 
-            # Validate that we have content
-            if not page_content['content'].strip():
-                return Response({"detail": "Confluence page has no content."}, status=400)
-            doc_text = page_content['content']
+class JobDetailAPIView(APIView):
+    """Status and, once finished, result of a background job (GET); cancel it (DELETE)."""
 
-            # print("The content extracted from Confluence is:", doc_text[:500])
+    def get(self, request, job_id):
+        job = get_job(job_id)
+        if job is None:
+            return Response({"detail": "Job not found or expired."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(describe(job))
 
-            requirement_text = build_requirement_text("", "", "", doc_text, app_context)[:settings.MAX_CONTEXT_CHARS]
-            prompt = test_plan_prompt(app_context, requirement_text)
+    def delete(self, request, job_id):
+        job = get_job(job_id)
+        if job is None:
+            return Response({"detail": "Job not found or expired."}, status=status.HTTP_404_NOT_FOUND)
+        if not cancel(job):
+            return Response(describe(job), status=status.HTTP_409_CONFLICT)
+        return Response(describe(job))
 
-            provider = get_provider()
-            result = provider.generate(prompt, meta={"type": "test_plan", "source": "confluence"})
-            return Response(result)
-        
-        except ValueError as ve:
-            return Response({"detail": str(ve)}, status=400)
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
-        
 
 class AutoPopulateUserStoryDataFromKey(APIView):
     def post(self, request):
@@ -211,6 +387,59 @@ class TeamViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TeamSerializer
 
 
+class FAQViewSet(viewsets.ModelViewSet):
+    """FAQs the assistant answers from memory (qa_api.faq), most asked first"""
+    queryset = FAQ.objects.all()
+    serializer_class = FAQSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        category = self.request.query_params.get('category')
+        project_id = self.request.query_params.get('project_id')
+
+        if category:
+            queryset = queryset.filter(category=category)
+        if project_id:
+            queryset = queryset.filter(Q(project_team_id=project_id) | Q(project_team__isnull=True))
+
+        return queryset.order_by('-frequency', 'id')
+
+    @action(detail=False, methods=['get'])
+    def candidates(self, request):
+        """
+        Questions asked at least ?min_count= times (default 3) in the last
+        ?days= (default 30) that no FAQ answers yet, clustered, most asked
+        first; ?project_id= limits them to one team.
+        """
+        try:
+            min_count = max(int(request.query_params.get('min_count', 3)), 1)
+            days = int(request.query_params.get('days', 30))
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            return Response({'error': 'min_count, days and limit must be integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(faq.candidates(
+            team_id=request.query_params.get('project_id') or None,
+            since=timezone.now() - timedelta(days=days),
+            min_count=min_count,
+            limit=limit,
+        ))
+
+    @action(detail=False, methods=['post'])
+    def promote(self, request):
+        """Create an FAQ from a candidate's query_id, optionally with a reworded question or answer."""
+        serializer = FAQPromoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        try:
+            query = QAQuery.objects.get(id=data['query_id'])
+        except QAQuery.DoesNotExist:
+            return Response({'error': 'Query not found'}, status=status.HTTP_404_NOT_FOUND)
+        entry = faq.promote(query, data['category'], question=data.get('question'), answer=data.get('answer'))
+        return Response(FAQSerializer(entry).data, status=status.HTTP_201_CREATED)
+
+
 class KnowledgeBaseViewSet(viewsets.ModelViewSet):
     queryset = KnowledgeBase.objects.all()
     serializer_class = KnowledgeBaseSerializer
@@ -226,138 +455,142 @@ class KnowledgeBaseViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(
                 Q(project_team_id=project_id) | Q(category='universal')
             )
+        tags, mode = _tag_params(self.request.query_params)
+        queryset = kb_tags.filter_articles(queryset, tags, mode)
         
         return queryset.order_by('-last_updated')
+
+    @action(detail=False, methods=['get'])
+    def tags(self, request):
+        """Per-tag article counts (facets) over the articles the same filters would list."""
+        try:
+            limit = min(int(request.query_params.get('limit', 50)), 500)
+        except ValueError:
+            limit = 50
+        return Response(kb_tags.facets(self.get_queryset(), limit=limit))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the articles the same filters would list as NDJSON (default) or
+        CSV (?file_format=csv), in a form bulk_import accepts back.
+        """
+        fmt = request.query_params.get('file_format', kb_bulk.NDJSON).lower()
+        if fmt not in kb_bulk.FORMATS:
+            return Response({'error': f'file_format must be one of {", ".join(kb_bulk.FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(kb_bulk.export_lines(self.get_queryset(), fmt),
+                                         content_type=kb_bulk.CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="knowledgebase.{fmt}"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def bulk_import(self, request):
+        """
+        Import articles from NDJSON or CSV, sent as the raw request body or
+        as a multipart `file`; the format comes from ?file_format=, else the
+        file name or content type. Rows with an existing id replace that
+        article; invalid rows are skipped and reported by line.
+        """
+        upload = request.FILES.get('file') if request.content_type.startswith('multipart/') else None
+        lines = upload if upload is not None else request.stream
+        if lines is None:
+            return Response({'error': 'Send the articles as the request body or as a "file" upload.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.query_params.get('file_format', '').lower() or kb_bulk.guess_format(
+            upload.name if upload is not None else '', request.content_type
+        )
+        if fmt not in kb_bulk.FORMATS:
+            return Response({'error': f'file_format must be one of {", ".join(kb_bulk.FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        result = kb_bulk.import_articles(
+            lines, fmt, created_by=request.query_params.get('created_by') or 'bulk import'
+        )
+        if result['failed'] and not result['created'] + result['updated']:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
     
     @action(detail=False, methods=['get'])
     def search(self, request):
-        """Search knowledge base by content"""
+        """
+        Ranked full-text search: all terms must match; "quoted phrases" and
+        prefix* terms are supported. Honors the same category/project_id/tags
+        filters as the list, and returns a highlighted snippet with each article.
+        """
         query = request.query_params.get('q', '')
         if not query:
             return Response([])
-        
-        results = self.queryset.filter(
-            Q(title__icontains=query) | 
-            Q(content__icontains=query) |
-            Q(tags__contains=[query])
-        )
-        
-        serializer = self.get_serializer(results, many=True)
-        return Response(serializer.data)
 
-class QAAssistantAPIView(APIView):
-    """Main API for QA Assistant interactions"""
-    
-    def post(self, request):
-        serializer = QAQueryCreateSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
-        start_time = time.time()
-        question = serializer.validated_data['question']
-        project_team_id = serializer.validated_data.get('project_team_id')
-        user_context = serializer.validated_data.get('user_context', {})
-        
         try:
-            # Get relevant context
-            context = self._get_relevant_context(question, project_team_id)
-            
-            # Generate AI response
-            ai_response = self._generate_ai_response(question, context, project_team_id)
-            
-            # Get suggested follow-ups and related docs
-            followups = self._get_suggested_followups(question, context)
-            related_docs = self._get_related_documents(question, project_team_id)
-            
-            # Log the query
-            query_obj = QAQuery.objects.create(
-                question=question,
-                response=ai_response,
-                project_team_id=project_team_id,
-                response_time=time.time() - start_time
-            )
-            
-            return Response({
-                'query_id': query_obj.id,
-                'response': ai_response,
-                'suggested_followups': followups,
-                'related_docs': related_docs,
-                'response_time': query_obj.response_time
-            })
-            
-        except Exception as e:
-            return Response(
-                {'error': f'Failed to generate response: {str(e)}'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-    
-    def _get_relevant_context(self, question, project_team_id):
-        """Retrieve relevant knowledge base entries"""
-        # Universal knowledge
-        universal_kb = KnowledgeBase.objects.filter(category='universal')
-        
-        # Project-specific knowledge
-        project_kb = KnowledgeBase.objects.none()
-        if project_team_id:
-            project_kb = KnowledgeBase.objects.filter(project_team_id=project_team_id)
-        
-        # Search for relevant entries based on question keywords
-        question_lower = question.lower()
-        keywords = question_lower.split()
-        
-        relevant_universal = universal_kb.filter(
-            Q(title__icontains=question_lower) |
-            Q(content__icontains=question_lower) |
-            Q(tags__overlap=keywords)
-        )[:5]
-        
-        relevant_project = project_kb.filter(
-            Q(title__icontains=question_lower) |
-            Q(content__icontains=question_lower) |
-            Q(tags__overlap=keywords)
-        )[:5]
-        
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            limit = 20
+        project_id = request.query_params.get('project_id')
+        tags, mode = _tag_params(request.query_params)
+        results = kb_search.search(
+            query,
+            category=request.query_params.get('category') or None,
+            team_id=project_id or None,
+            include_universal=True,
+            limit=limit,
+            tags=tags,
+            tag_mode=mode,
+        )
+
+        data = self.get_serializer(results, many=True).data
+        for item, article in zip(data, results):
+            item['snippet'] = article.snippet
+            item['score'] = article.score
+        return Response(data)
+
+class QAAssistantMixin:
+    """Retrieval and prompt helpers shared by the sync and async assistant views"""
+
+    def _faq_answer(self, question, project_team_id, nocache=False):
+        """The FAQ that answers the question (qa_api.faq), counted as a hit, unless ?nocache=1"""
+        entry = None if nocache else faq.match(question, project_team_id)
+        if entry:
+            faq.record_hit(entry['id'])
+        return entry
+
+    def _faq_response(self, question, entry, start_time):
+        """Response body for an FAQ answer: no retrieval, no LLM call and no QAQuery logged"""
         return {
-            'universal': KnowledgeBaseSerializer(relevant_universal, many=True).data,
-            'project_specific': KnowledgeBaseSerializer(relevant_project, many=True).data
+            'query_id': None,
+            'faq_id': entry['id'],
+            'response': entry['answer'],
+            'suggested_followups': self._get_suggested_followups(question, None),
+            'related_docs': [],
+            'response_time': time.time() - start_time,
+            'cached': False
         }
+
+    def _faq_events(self, payload):
+        """The SSE events of an FAQ answer, in the order a generated answer sends them"""
+        done = {key: payload[key] for key in ('query_id', 'faq_id', 'suggested_followups', 'response_time', 'cached')}
+        return [
+            sse_event("related_docs", payload['related_docs']),
+            sse_event("token", {"text": payload['response']}),
+            sse_event("done", done),
+        ]
+
+    def _retrieve(self, question, project_team_id, related_version=RELATED_DOCS_V1):
+        """Rank and fetch the knowledge for a question once (see qa_api.retrieval)"""
+        return RetrievalPipeline(question, project_team_id, related_version=related_version).run()
+
+    def _cached_answer(self, question, retrieval, nocache=False):
+        """A well-rated earlier answer that fits this question (qa_api.answer_cache), unless ?nocache=1"""
+        return None if nocache else answer_cache.lookup(question, retrieval)
     
-    def _generate_ai_response(self, question, context, project_team_id):
-        """Generate response using OpenAI API"""
-        
-        # Get project info
-        project_info = ""
-        if project_team_id:
-            try:
-                project = Team.objects.get(id=project_team_id)
-                project_info = f"""
-                Current Project: {project.name}
-                Description: {project.description}
-                Tech Stack: {', '.join(project.tech_stack)}
-                Key Contacts: {', '.join(project.key_contacts)}
-                """
-            except Team.DoesNotExist:
-                pass
-        
-        # Build context string
-        context_str = ""
-        if context['universal']:
-            context_str += "Universal QA Standards:\n"
-            for item in context['universal']:
-                context_str += f"- {item['title']}: {item['content'][:200]}...\n"
-        
-        if context['project_specific']:
-            context_str += "\nProject-Specific Knowledge:\n"
-            for item in context['project_specific']:
-                context_str += f"- {item['title']}: {item['content'][:200]}...\n"
-        
+    def _build_system_prompt(self, question, retrieval):
+        """Build the assistant system prompt from project info and retrieved knowledge"""
         system_prompt = f"""
         You are a QA Knowledge Assistant for a software development organization with 7 project teams.
         
-        {project_info}
+        {retrieval.project_text()}
         
         Available Knowledge:
-        {context_str}
+        {retrieval.knowledge_text()}
         
         Guidelines:
         - Provide specific, actionable answers based on available knowledge
@@ -374,20 +607,7 @@ class QAAssistantAPIView(APIView):
         - End with additional resources or next steps if relevant
         """
         
-        # response = client.chat.completions.create(
-        #     model="gpt-4",
-        #     messages=[
-        #         {"role": "system", "content": system_prompt},
-        #         {"role": "user", "content": question}
-        #     ],
-        #     temperature=0.3,
-        #     max_tokens=500
-        # )
-        
-        # return response.choices[0].message.content
-        provider = get_provider()
-        result = provider.chat_completion(system_prompt, question, temperature=0.3)
-        return result
+        return system_prompt
     
     def _get_suggested_followups(self, question, context):
         """Generate suggested follow-up questions"""
@@ -418,21 +638,122 @@ class QAAssistantAPIView(APIView):
         else:
             return common_followups['procedures']
     
-    def _get_related_documents(self, question, project_team_id):
-        """Get related documentation"""
-        # Find related KB articles
-        related = KnowledgeBase.objects.filter(
-            Q(title__icontains=question) | 
-            Q(content__icontains=question)
-        )
+
+class QAAssistantAPIView(QAAssistantMixin, APIView):
+    """Main API for QA Assistant interactions"""
+    
+    def post(self, request):
+        serializer = QAQueryCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        start_time = time.time()
+        question = serializer.validated_data['question']
+        project_team_id = serializer.validated_data.get('project_team_id')
+        user_context = serializer.validated_data.get('user_context', {})
         
-        if project_team_id:
-            related = related.filter(
-                Q(project_team_id=project_team_id) | Q(category='universal')
+        try:
+            # Known questions are answered from the FAQ index before anything else
+            entry = self._faq_answer(question, project_team_id, nocache=_nocache(request.query_params))
+            if entry:
+                payload = self._faq_response(question, entry, start_time)
+                if wants_stream(request.query_params):
+                    return sse_response(iter(self._faq_events(payload)))
+                return Response(payload)
+
+            # Retrieve knowledge once: prompt context and related docs come from the same result
+            retrieval = self._retrieve(question, project_team_id, related_docs_version(request.query_params))
+            cached = self._cached_answer(question, retrieval, nocache=_nocache(request.query_params))
+
+            if wants_stream(request.query_params):
+                return sse_response(self._stream_ai_response(
+                    question, retrieval, cached, start_time, nocache=_nocache(request.query_params)
+                ))
+            
+            # Generate AI response, unless a well-rated answer to the same question can be re-served
+            if cached:
+                ai_response = cached.response
+            else:
+                ai_response = self._generate_ai_response(question, retrieval, nocache=_nocache(request.query_params))
+            
+            # Get suggested follow-ups and related docs
+            followups = self._get_suggested_followups(question, retrieval)
+            related_docs = retrieval.related_docs()
+            
+            # Log the query
+            query_obj = answer_cache.record(
+                question, ai_response, retrieval, time.time() - start_time, cached_from=cached
             )
+            
+            return Response({
+                'query_id': query_obj.id,
+                'response': ai_response,
+                'suggested_followups': followups,
+                'related_docs': related_docs,
+                'response_time': query_obj.response_time,
+                'cached': cached is not None
+            })
+
+        except LLMOverloaded as e:
+            return _overloaded(e)
+        except Exception as e:
+            return Response(
+                {'error': f'Failed to generate response: {str(e)}'}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    def _generate_ai_response(self, question, retrieval, nocache=False):
+        """Generate response using OpenAI API"""
+        system_prompt = self._build_system_prompt(question, retrieval)
+
+        # response = client.chat.completions.create(
+        #     model="gpt-4",
+        #     messages=[
+        #         {"role": "system", "content": system_prompt},
+        #         {"role": "user", "content": question}
+        #     ],
+        #     temperature=0.3,
+        #     max_tokens=500
+        # )
         
-        return KnowledgeBaseSerializer(related[:3], many=True).data
-    
+        # return response.choices[0].message.content
+        provider = get_provider()
+        result = provider.chat_completion(
+            system_prompt, question, temperature=0.3, meta={"type": "assistant", "nocache": nocache}
+        )
+        return result
+
+    def _stream_ai_response(self, question, retrieval, cached, start_time, nocache=False):
+        """SSE events: related_docs first, then answer tokens (a cached answer in one), then done with the logged query id"""
+        yield sse_event("related_docs", retrieval.related_docs())
+
+        parts = []
+        if cached:
+            parts.append(cached.response)
+            yield sse_event("token", {"text": cached.response})
+        else:
+            system_prompt = self._build_system_prompt(question, retrieval)
+            provider = get_provider()
+            try:
+                for delta in provider.stream_chat_completion(
+                    system_prompt, question, temperature=0.3, meta={"type": "assistant", "nocache": nocache}
+                ):
+                    parts.append(delta)
+                    yield sse_event("token", {"text": delta})
+            except Exception as e:
+                yield sse_event("error", {"error": f"Failed to generate response: {str(e)}"})
+                return
+
+        query_obj = answer_cache.record(
+            question, "".join(parts), retrieval, time.time() - start_time, cached_from=cached
+        )
+        yield sse_event("done", {
+            "query_id": query_obj.id,
+            "suggested_followups": self._get_suggested_followups(question, retrieval),
+            "response_time": query_obj.response_time,
+            "cached": cached is not None
+        })
+
 
 class QAFeedbackAPIView(APIView):
     """Handle user feedback on AI responses"""
@@ -450,6 +771,7 @@ class QAFeedbackAPIView(APIView):
             query = QAQuery.objects.get(id=query_id)
             query.user_feedback = rating
             query.save()
+            answer_cache.rated(query)
             
             # TODO: Store detailed feedback comments if needed
             
@@ -486,5 +808,21 @@ class QAAnalyticsAPIView(APIView):
             'average_rating': round(avg_rating or 0, 2),
             'common_questions': list(common_questions),
             'knowledge_base_stats': list(kb_stats),
-            'total_kb_articles': KnowledgeBase.objects.count()
-        })
\ No newline at end of file
+            'total_kb_articles': KnowledgeBase.objects.count(),
+            'answer_cache': answer_cache.cache_stats()
+        })
+
+
+class LLMStatsAPIView(APIView):
+    """Counters exposed by the configured provider stack (cache hits, misses, evictions) and token usage"""
+    MAX_DAYS = 365
+
+    def get(self, request):
+        try:
+            days = min(max(int(request.query_params.get("days", 1)), 1), self.MAX_DAYS)
+        except (TypeError, ValueError):
+            return Response({"error": "days must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        provider = get_provider()
+        stats = provider.stats() if hasattr(provider, "stats") else {}
+        stats["usage"] = usage_summary(since=timezone.now() - timedelta(days=days))
+        return Response(stats)